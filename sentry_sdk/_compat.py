@@ -20,6 +20,7 @@ PY311 = sys.version_info[0] == 3 and sys.version_info[1] >= 11
 
 if PY2:
     import urlparse
+    from thread import get_ident
 
     text_type = unicode  # noqa
 
@@ -40,6 +41,7 @@ if PY2:
 
 else:
     import urllib.parse as urlparse  # noqa
+    from threading import get_ident  # noqa
 
     text_type = str
     string_types = (text_type,)  # type: Tuple[type]
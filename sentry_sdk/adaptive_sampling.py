@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+
+import sentry_sdk
+from sentry_sdk.utils import now
+
+from sentry_sdk._types import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Optional
+
+    from sentry_sdk._types import SamplingContext
+
+
+MAX_TRANSACTION_NAMES = 500
+
+# Weight of the most recent interval in the throughput estimates
+_SMOOTHING = 0.5
+
+# Queue load from which on the sample rate is lowered, down to zero for a
+# full queue
+_QUEUE_LOAD_THRESHOLD = 0.5
+
+
+class _Throughput(object):
+    __slots__ = (
+        "interval_start",
+        "started",
+        "finished",
+        "started_per_second",
+        "rate",
+    )
+
+    def __init__(self, interval_start, rate):
+        # type: (float, float) -> None
+        self.interval_start = interval_start
+        self.started = 0
+        self.finished = 0
+        self.started_per_second = None  # type: Optional[float]
+        self.rate = rate
+
+
+class AdaptiveSampler(object):
+    """
+    Computes sample rates that keep the number of sampled transactions per
+    transaction name close to `target_per_second`, independent of how much
+    traffic there is.
+
+    The number of transactions started per second is estimated for every
+    name and the sample rate is set so that `target_per_second` of them are
+    sampled, at most `max_rate`. If more sampled transactions than that
+    finished in the last interval, e.g. because sampling decisions were
+    inherited from incoming traces, the rate is lowered accordingly. When
+    the transport's queue fills up, rates are lowered further.
+
+    It can be passed as `traces_sampler`, or be called from one to combine
+    it with other rules.
+    """
+
+    def __init__(
+        self,
+        target_per_second,  # type: float
+        max_rate=1.0,  # type: float
+        interval=1.0,  # type: float
+    ):
+        # type: (...) -> None
+        self.target_per_second = target_per_second
+        self.max_rate = max_rate
+        self.interval = interval
+        self._throughputs = OrderedDict()  # type: OrderedDict[str, _Throughput]
+        self._lock = threading.Lock()
+
+    def __call__(self, sampling_context):
+        # type: (SamplingContext) -> float
+        if sampling_context["parent_sampled"] is not None:
+            return float(sampling_context["parent_sampled"])
+        return self.sample_rate(sampling_context["transaction_context"]["name"])
+
+    def _get_throughput(self, name):
+        # type: (str) -> _Throughput
+        current = now()
+        throughput = self._throughputs.pop(name, None)
+        if throughput is None:
+            throughput = _Throughput(current, self.max_rate)
+            if len(self._throughputs) >= MAX_TRANSACTION_NAMES:
+                self._throughputs.popitem(last=False)
+        self._throughputs[name] = throughput
+
+        elapsed = current - throughput.interval_start
+        if elapsed >= self.interval:
+            self._update_rate(throughput, elapsed)
+            throughput.interval_start = current
+            throughput.started = throughput.finished = 0
+
+        return throughput
+
+    def _update_rate(self, throughput, elapsed):
+        # type: (_Throughput, float) -> None
+        started_per_second = throughput.started / elapsed
+        if throughput.started_per_second is not None:
+            started_per_second = (
+                _SMOOTHING * started_per_second
+                + (1 - _SMOOTHING) * throughput.started_per_second
+            )
+        throughput.started_per_second = started_per_second
+
+        rate = self.max_rate
+        if started_per_second > 0:
+            rate = min(rate, self.target_per_second / started_per_second)
+
+        finished_per_second = throughput.finished / elapsed
+        if finished_per_second > self.target_per_second:
+            rate *= self.target_per_second / finished_per_second
+
+        throughput.rate = rate
+
+    def sample_rate(self, name):
+        # type: (str) -> float
+        """Return the sample rate for a transaction that is starting."""
+        with self._lock:
+            throughput = self._get_throughput(name)
+            throughput.started += 1
+            rate = throughput.rate
+
+        client = sentry_sdk.Hub.current.client
+        load = client.transport.queue_load() if client and client.transport else 0.0
+        if load > _QUEUE_LOAD_THRESHOLD:
+            rate *= max(0.0, (1 - load) / (1 - _QUEUE_LOAD_THRESHOLD))
+
+        return rate
+
+    def record_finished(self, name):
+        # type: (str) -> None
+        """Count a sampled transaction that finished."""
+        with self._lock:
+            self._get_throughput(name).finished += 1
@@ -8,6 +8,7 @@ from sentry_sdk.tracing import NoOpSpan
 
 if TYPE_CHECKING:
     from typing import Any
+    from typing import Awaitable
     from typing import Dict
     from typing import Optional
     from typing import overload
@@ -196,7 +197,7 @@ def flush(
     timeout=None,  # type: Optional[float]
     callback=None,  # type: Optional[Callable[[int, float], None]]
 ):
-    # type: (...) -> None
+    # type: (...) -> Optional[Awaitable[None]]
     return Hub.current.flush(timeout=timeout, callback=callback)
 
 
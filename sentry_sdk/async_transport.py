@@ -0,0 +1,405 @@
+import asyncio
+import ssl
+
+import certifi
+
+from sentry_sdk.hub import Hub
+from sentry_sdk.transport import HttpTransport
+from sentry_sdk.utils import capture_internal_exceptions, logger
+
+from sentry_sdk._types import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import Awaitable
+    from typing import Callable
+    from typing import Dict
+    from typing import Optional
+
+    from sentry_sdk.envelope import Envelope
+    from sentry_sdk._types import EndpointType, Event
+
+    Job = Callable[[], Awaitable[None]]
+
+try:
+    import httpx  # type: ignore
+except ImportError:
+    raise ImportError("AsyncHttpTransport requires httpx to be installed")
+
+# httpx 0.26 added the `proxy` argument, 0.28 removed `proxies`.
+HTTPX_VERSION = tuple(map(int, httpx.__version__.split(".")[:2]))
+
+try:
+    from asyncio import get_running_loop
+except ImportError:
+    # Python 3.6
+    def get_running_loop():
+        # type: () -> asyncio.AbstractEventLoop
+        loop = asyncio._get_running_loop()
+        if loop is None:
+            raise RuntimeError("no running event loop")
+        return loop
+
+
+__all__ = ["AsyncHttpTransport"]
+
+
+_TERMINATOR = object()
+
+
+def _current_loop():
+    # type: () -> Optional[asyncio.AbstractEventLoop]
+    try:
+        return get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _HttpxResponse(object):
+    """
+    Exposes a httpx response under the attribute names of a urllib3 response,
+    which is what `HttpTransport._handle_response` works with.
+    """
+
+    __slots__ = ("status", "headers", "data")
+
+    def __init__(self, response):
+        # type: (httpx.Response) -> None
+        self.status = response.status_code
+        self.headers = response.headers
+        self.data = response.content
+
+
+class AsyncHttpTransport(HttpTransport):
+    """
+    HTTP transport that sends events from the running asyncio event loop.
+
+    Envelopes captured while an event loop is running are put into an
+    `asyncio.Queue` which is drained by a task on that loop, using a
+    non-blocking `httpx.AsyncClient`. The transport binds to the first loop
+    it sees. Everything captured outside of that loop, for example from other
+    threads, falls back to the background worker thread of `HttpTransport`.
+
+    `flush` blocks when called from outside the event loop. When called on the
+    event loop it can not block, so it returns an awaitable instead, which is
+    also available as `flush_async`. Nothing is waited for unless that is
+    awaited, also not by `sentry_sdk.flush()`, which passes it on.
+
+    Envelopes that are still queued when the event loop shuts down are
+    recorded as lost.
+    """
+
+    def __init__(
+        self, options  # type: Dict[str, Any]
+    ):
+        # type: (...) -> None
+        HttpTransport.__init__(self, options)
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._queue = None  # type: Optional[asyncio.Queue[Any]]
+        self._async_client = None  # type: Optional[httpx.AsyncClient]
+        self._consumer = None  # type: Optional[asyncio.Task[None]]
+        # The queue entry the consumer of the current loop is sending.
+        self._in_flight = None  # type: Optional[Any]
+
+    def _make_async_client(self):
+        # type: () -> httpx.AsyncClient
+        assert self.parsed_dsn is not None
+        proxy = self._get_proxy(
+            self.parsed_dsn,
+            http_proxy=self.options["http_proxy"],
+            https_proxy=self.options["https_proxy"],
+        )
+        opts = {
+            "verify": ssl.create_default_context(
+                cafile=self.options["ca_certs"] or certifi.where()
+            ),
+        }  # type: Dict[str, Any]
+        if proxy:
+            proxy_argument = "proxy" if HTTPX_VERSION >= (0, 26) else "proxies"
+            opts[proxy_argument] = httpx.Proxy(
+                proxy, headers=self.options["proxy_headers"] or None
+            )
+
+        return httpx.AsyncClient(**opts)
+
+    def _get_queue(self):
+        # type: () -> Optional[asyncio.Queue[Any]]
+        """
+        Returns the queue of the running event loop, or `None` if events
+        need to be sent through the background worker thread instead.
+        """
+        loop = _current_loop()
+        if loop is None:
+            return None
+
+        if loop is not self._loop:
+            if self._loop is not None and not self._loop.is_closed():
+                return None
+
+            if self._queue is not None:
+                self._drop_queued(self._queue, self._in_flight)
+
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.options["transport_queue_size"])
+            self._async_client = self._make_async_client()
+            self._consumer = loop.create_task(
+                self._consume(self._queue, self._async_client)
+            )
+
+        return self._queue
+
+    def queue_load(self):
+        # type: () -> float
+        queue = self._queue
+        if queue is None or self._loop is not _current_loop():
+            return super(AsyncHttpTransport, self).queue_load()
+        return min(1.0, queue.qsize() / float(queue.maxsize or 1))
+
+    async def _consume(
+        self,
+        queue,  # type: asyncio.Queue[Any]
+        async_client,  # type: httpx.AsyncClient
+    ):
+        # type: (...) -> None
+
+        # The task inherits the context of whoever captured the first event.
+        # Run with an empty hub so that the requests to Sentry are not
+        # instrumented as part of the application's transaction.
+        with Hub(None):
+            entry = None  # type: Optional[Any]
+            try:
+                while True:
+                    entry = await queue.get()
+                    try:
+                        if entry is _TERMINATOR:
+                            break
+                        job, _ = entry
+                        self._in_flight = entry
+                        with capture_internal_exceptions():
+                            await job()
+                            self._flush_client_reports()
+                        self._in_flight = None
+                    finally:
+                        queue.task_done()
+            finally:
+                # Also runs when the task is cancelled or closed because the
+                # loop shuts down, after which nothing is sent anymore.
+                self._drop_queued(queue, entry if self._in_flight is entry else None)
+
+            with capture_internal_exceptions():
+                await async_client.aclose()
+
+    def _drop_queued(
+        self,
+        queue,  # type: asyncio.Queue[Any]
+        in_flight=None,  # type: Optional[Any]
+    ):
+        # type: (...) -> None
+        """
+        Records the jobs left in a queue that isn't consumed anymore as lost,
+        together with the one its consumer was sending, if any.
+        """
+        dropped = 0
+        if in_flight is not None and in_flight is self._in_flight:
+            self._in_flight = None
+            dropped += 1
+            self._make_record_loss(in_flight[1])("queue_overflow")
+
+        while True:
+            try:
+                entry = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            queue.task_done()
+            if entry is not _TERMINATOR:
+                dropped += 1
+                _, envelope = entry
+                self._make_record_loss(envelope)("queue_overflow")
+
+        if dropped:
+            self.on_dropped_event("full_queue")
+            logger.debug("async transport stopped, dropped %s events", dropped)
+
+    def _submit(
+        self,
+        job,  # type: Job
+        envelope=None,  # type: Optional[Envelope]
+    ):
+        # type: (...) -> Optional[bool]
+        """
+        Returns `None` if there is no usable event loop, else whether the job
+        fit into the queue. The job sends `envelope`, or an event if `None`.
+        """
+        queue = self._get_queue()
+        if queue is None:
+            return None
+
+        try:
+            queue.put_nowait((job, envelope))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _send_request_async(
+        self,
+        body,  # type: bytes
+        headers,  # type: Dict[str, str]
+        endpoint_type="store",  # type: EndpointType
+        envelope=None,  # type: Optional[Envelope]
+    ):
+        # type: (...) -> None
+        assert self._async_client is not None
+        record_loss = self._make_record_loss(envelope)
+
+        try:
+            response = await self._async_client.post(
+                str(self._auth.get_api_url(endpoint_type)),
+                content=body,
+                headers=self._get_request_headers(headers),
+            )
+        except Exception:
+            self.on_dropped_event("network")
+            record_loss("network_error")
+            raise
+
+        self._handle_response(_HttpxResponse(response), record_loss)
+
+    async def _send_event_async(
+        self, event  # type: Event
+    ):
+        # type: (...) -> None
+        body = self._prepare_event(event)
+        if body is None:
+            return None
+
+        await self._send_request_async(
+            body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        )
+
+    async def _send_envelope_async(
+        self, envelope  # type: Envelope
+    ):
+        # type: (...) -> None
+        prepared = self._prepare_envelope(envelope)
+        if prepared is None:
+            return None
+
+        envelope, body = prepared
+        await self._send_request_async(
+            body,
+            headers={
+                "Content-Type": "application/x-sentry-envelope",
+                "Content-Encoding": "gzip",
+            },
+            endpoint_type="envelope",
+            envelope=envelope,
+        )
+
+    def capture_event(
+        self, event  # type: Event
+    ):
+        # type: (...) -> None
+        submitted = self._submit(lambda: self._send_event_async(event))
+        if submitted is None:
+            return HttpTransport.capture_event(self, event)
+
+        if not submitted:
+            self.on_dropped_event("full_queue")
+            self.record_lost_event("queue_overflow", data_category="error")
+
+    def capture_envelope(
+        self, envelope  # type: Envelope
+    ):
+        # type: (...) -> None
+        submitted = self._submit(lambda: self._send_envelope_async(envelope), envelope)
+        if submitted is None:
+            return HttpTransport.capture_envelope(self, envelope)
+
+        if not submitted:
+            self.on_dropped_event("full_queue")
+            for item in envelope.items:
+                self.record_lost_event("queue_overflow", item=item)
+
+    async def flush_async(
+        self,
+        timeout,  # type: float
+        callback=None,  # type: Optional[Any]
+    ):
+        # type: (...) -> None
+        """Wait `timeout` seconds for the events queued on the loop to be sent."""
+        queue = self._queue
+        if queue is None or timeout <= 0:
+            return
+
+        self._flush_client_reports(force=True)
+
+        join = asyncio.ensure_future(queue.join())
+        initial_timeout = min(0.1, timeout)
+        done, _ = await asyncio.wait([join], timeout=initial_timeout)
+        if done:
+            return
+
+        pending = queue.qsize() + 1
+        logger.debug("%d event(s) pending on flush", pending)
+        if callback is not None:
+            callback(pending, timeout)
+
+        done, _ = await asyncio.wait([join], timeout=timeout - initial_timeout)
+        if not done:
+            join.cancel()
+            logger.error("flush timed out, dropped %s events", queue.qsize() + 1)
+
+    def flush(
+        self,
+        timeout,  # type: float
+        callback=None,  # type: Optional[Any]
+    ):
+        # type: (...) -> Optional[Awaitable[None]]
+        if self._worker.is_alive:
+            HttpTransport.flush(self, timeout, callback)
+
+        loop = self._loop
+        if loop is None or loop.is_closed() or timeout <= 0:
+            return None
+
+        if _current_loop() is loop:
+            # Blocking here would block the loop that needs to send the
+            # events, hand out something to await instead.
+            logger.debug("flush called on the event loop, await it to wait")
+            return loop.create_task(self.flush_async(timeout, callback))
+
+        if not loop.is_running():
+            loop.run_until_complete(self.flush_async(timeout, callback))
+            return None
+
+        future = asyncio.run_coroutine_threadsafe(
+            self.flush_async(timeout, callback), loop
+        )
+        try:
+            future.result(timeout + 1)
+        except Exception:
+            logger.error("Failed to flush the async transport", exc_info=True)
+        return None
+
+    def kill(self):
+        # type: () -> None
+        HttpTransport.kill(self)
+
+        loop, queue = self._loop, self._queue
+        self._loop = self._queue = self._async_client = None
+        if loop is None or queue is None:
+            return
+
+        if loop.is_closed():
+            self._drop_queued(queue, self._in_flight)
+            return
+
+        def terminate():
+            # type: () -> None
+            try:
+                queue.put_nowait(_TERMINATOR)
+            except asyncio.QueueFull:
+                logger.debug("async transport queue full, kill failed")
+
+        loop.call_soon_threadsafe(terminate)
@@ -4,6 +4,7 @@ import uuid
 import random
 from datetime import datetime
 import socket
+from collections import Counter
 
 from sentry_sdk._compat import string_types, text_type, iteritems
 from sentry_sdk.utils import (
@@ -16,9 +17,10 @@ from sentry_sdk.utils import (
     get_default_release,
     handle_in_app,
     logger,
+    source_context_cache,
 )
-from sentry_sdk.serializer import serialize
-from sentry_sdk.tracing import trace, has_tracing_enabled
+from sentry_sdk.serializer import serialize, serialize_iterative
+from sentry_sdk.tracing import trace, has_tracing_enabled, set_id_generator
 from sentry_sdk.transport import make_transport
 from sentry_sdk.consts import (
     DEFAULT_OPTIONS,
@@ -32,11 +34,19 @@ from sentry_sdk.sessions import SessionFlusher
 from sentry_sdk.envelope import Envelope
 from sentry_sdk.profiler import has_profiling_enabled, setup_profiler
 from sentry_sdk.scrubber import EventScrubber
+from sentry_sdk.adaptive_sampling import AdaptiveSampler
+from sentry_sdk.local_aggregation import LocalAggregator, local_aggregation_supported
+from sentry_sdk.tail_sampling import (
+    DEFAULT_MAX_PER_SECOND,
+    DEFAULT_PERCENTILE,
+    TailSampler,
+)
 
 from sentry_sdk._types import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from typing import Any
+    from typing import Awaitable
     from typing import Callable
     from typing import Dict
     from typing import Optional
@@ -201,6 +211,13 @@ class _Client(object):
         # type: () -> None
         old_debug = _client_init_debug.get(False)
 
+        # Number of events dropped before the scope was applied to them and
+        # they were serialized, by reason.
+        self.debug_stats = Counter()  # type: Counter[str]
+        self.tail_sampler = None  # type: Optional[TailSampler]
+        self.adaptive_sampler = None  # type: Optional[AdaptiveSampler]
+        self.local_aggregator = None  # type: Optional[LocalAggregator]
+
         def _capture_envelope(envelope):
             # type: (Envelope) -> None
             if self.transport is not None:
@@ -210,7 +227,22 @@ class _Client(object):
             _client_init_debug.set(self.options["debug"])
             self.transport = make_transport(self.options)
 
-            self.session_flusher = SessionFlusher(capture_func=_capture_envelope)
+            aggregation_socket = self.options["_experiments"].get(
+                "local_aggregation_socket"
+            )
+            if aggregation_socket and self.transport is not None:
+                if local_aggregation_supported():
+                    self.local_aggregator = LocalAggregator(aggregation_socket)
+                    self.transport.local_aggregator = self.local_aggregator
+                else:
+                    logger.warning(
+                        "Local aggregation requires Unix sockets, sending "
+                        "sessions and client reports directly"
+                    )
+
+            self.session_flusher = SessionFlusher(
+                capture_func=_capture_envelope, aggregator=self.local_aggregator
+            )
 
             request_bodies = ("always", "never", "small", "medium")
             if self.options["request_bodies"] not in request_bodies:
@@ -226,6 +258,9 @@ class _Client(object):
                 with_auto_enabling_integrations=self.options[
                     "auto_enabling_integrations"
                 ],
+                defer_auto_enabling_integrations=self.options["_experiments"].get(
+                    "deferred_integrations", False
+                ),
             )
 
             sdk_name = get_sdk_name(list(self.integrations.keys()))
@@ -243,6 +278,34 @@ class _Client(object):
 
         self._setup_instrumentation(self.options.get("functions_to_trace", []))
 
+        experiments = self.options["_experiments"]
+        if (
+            "source_context_cache_bytes" in experiments
+            or "source_context_mmap" in experiments
+        ):
+            source_context_cache.configure(
+                max_bytes=experiments.get("source_context_cache_bytes"),
+                use_mmap=experiments.get("source_context_mmap"),
+            )
+        if "id_generator" in experiments:
+            set_id_generator(experiments["id_generator"])
+        if experiments.get("tail_sampling"):
+            self.tail_sampler = TailSampler(
+                percentile=experiments.get("tail_sampling_percentile")
+                or DEFAULT_PERCENTILE,
+                max_per_second=experiments.get("tail_sampling_max_per_second")
+                or DEFAULT_MAX_PER_SECOND,
+            )
+
+        if isinstance(self.options["traces_sampler"], AdaptiveSampler):
+            self.adaptive_sampler = self.options["traces_sampler"]
+        elif experiments.get("adaptive_sampling_target"):
+            # traces_sample_rate is the upper bound of the adaptive rate
+            self.adaptive_sampler = AdaptiveSampler(
+                experiments["adaptive_sampling_target"],
+                max_rate=self.options["traces_sample_rate"] or 0.0,
+            )
+
     @property
     def dsn(self):
         # type: () -> Optional[str]
@@ -320,7 +383,10 @@ class _Client(object):
         # Postprocess the event here so that annotated types do
         # generally not surface in before_send
         if event is not None:
-            event = serialize(event)
+            if self.options["_experiments"].get("iterative_serializer"):
+                event = serialize_iterative(event)
+            else:
+                event = serialize(event)
 
         before_send = self.options["before_send"]
         if before_send is not None and event.get("type") != "transaction":
@@ -412,6 +478,43 @@ class _Client(object):
 
         return True
 
+    def _is_rate_limited(
+        self,
+        event,  # type: SentryEvent
+        hint,  # type: Hint
+        scope,  # type: Optional[Scope]
+        profile,  # type: Optional[Any]
+    ):
+        # type: (...) -> bool
+        """
+        Checks whether the transport would drop the event because of a rate
+        limit anyway. Events carrying attachments or a profile are left to
+        the transport, as those items are limited separately.
+        """
+        if self.transport is None:
+            return False
+        if profile is not None or hint.get("attachments"):
+            return False
+        if scope is not None and scope._attachments:
+            return False
+
+        event_type = event.get("type")
+        if event_type == "transaction":
+            data_category = "transaction"
+        elif event_type in (None, "error", "default"):
+            data_category = "error"
+        else:
+            return False
+
+        if not self.transport.is_rate_limited(data_category):
+            return False
+
+        logger.info("Discarded %s because of a rate limit", data_category)
+        self.transport.record_lost_event(
+            "ratelimit_backoff", data_category=data_category
+        )
+        return True
+
     def _update_session_from_event(
         self,
         session,  # type: Session
@@ -448,6 +551,29 @@ class _Client(object):
             errors=session.errors + (errored or crashed),
         )
 
+    def _update_session_from_dropped_event(
+        self,
+        session,  # type: Session
+        event,  # type: SentryEvent
+        hint,  # type: Hint
+        scope,  # type: Optional[Scope]
+    ):
+        # type: (...) -> None
+        """
+        Updates the session from an event that is dropped before the scope is
+        applied to it, with the user and request the scope would have added.
+        """
+        if scope is not None:
+            if session.user_agent is None:
+                # The request, and with it the user agent, is only added by
+                # the scope's event processors.
+                with capture_internal_exceptions():
+                    event = scope.apply_to_event(dict(event), dict(hint)) or event
+            elif event.get("user") is None and scope._user is not None:
+                event = dict(event, user=scope._user)
+
+        self._update_session_from_event(session, event)
+
     def capture_event(
         self,
         event,  # type: SentryEvent
@@ -476,9 +602,27 @@ class _Client(object):
         if event_id is None:
             event["event_id"] = event_id = uuid.uuid4().hex
         if not self._should_capture(event, hint, scope):
+            self.debug_stats["ignored"] += 1
             return None
 
         profile = event.pop("profile", None)
+        session = scope._session if scope else None
+        is_transaction = event.get("type") == "transaction"
+
+        # Decide on dropping the event before doing the expensive work of
+        # applying the scope and serializing it.
+        if not is_transaction and not self._should_sample_error(event):
+            self.debug_stats["sample_rate"] += 1
+            # Sampled out errors still count towards the session.
+            if session:
+                self._update_session_from_dropped_event(session, event, hint, scope)
+            return None
+
+        if self._is_rate_limited(event, hint, scope, profile):
+            self.debug_stats["ratelimit_backoff"] += 1
+            if session:
+                self._update_session_from_dropped_event(session, event, hint, scope)
+            return None
 
         event_opt = self._prepare_event(event, hint, scope)
         if event_opt is None:
@@ -486,15 +630,11 @@ class _Client(object):
 
         # whenever we capture an event we also check if the session needs
         # to be updated based on that information.
-        session = scope._session if scope else None
         if session:
             self._update_session_from_event(session, event)
 
         is_transaction = event_opt.get("type") == "transaction"
 
-        if not is_transaction and not self._should_sample_error(event):
-            return None
-
         tracing_enabled = has_tracing_enabled(self.options)
         is_checkin = event_opt.get("type") == "check_in"
         attachments = hint.get("attachments")
@@ -561,6 +701,10 @@ class _Client(object):
         semantics as :py:meth:`Client.flush`.
         """
         if self.transport is not None:
+            if self.local_aggregator is not None:
+                # Other processes might be shutting down as well, send what
+                # is left directly.
+                self.local_aggregator.close()
             self.flush(timeout=timeout, callback=callback)
             self.session_flusher.kill()
             self.transport.kill()
@@ -571,19 +715,22 @@ class _Client(object):
         timeout=None,  # type: Optional[float]
         callback=None,  # type: Optional[Callable[[int, float], None]]
     ):
-        # type: (...) -> None
+        # type: (...) -> Optional[Awaitable[None]]
         """
         Wait for the current events to be sent.
 
         :param timeout: Wait for at most `timeout` seconds. If no `timeout` is provided, the `shutdown_timeout` option value is used.
 
         :param callback: Is invoked with the number of pending events and the configured timeout.
+
+        :returns: `None`, except for a transport that can not wait where it is called, like the async transport on its event loop. It returns an awaitable that needs to be awaited instead.
         """
         if self.transport is not None:
             if timeout is None:
                 timeout = self.options["shutdown_timeout"]
             self.session_flusher.flush()
-            self.transport.flush(timeout=timeout, callback=callback)
+            return self.transport.flush(timeout=timeout, callback=callback)
+        return None
 
     def __enter__(self):
         # type: () -> _Client
@@ -33,6 +33,24 @@ if TYPE_CHECKING:
         {
             "max_spans": Optional[int],
             "record_sql_params": Optional[bool],
+            "normalize_sql": Optional[bool],
+            "span_compression": Optional[bool],
+            "transaction_chunk_size": Optional[int],
+            "tail_sampling": Optional[bool],
+            "tail_sampling_percentile": Optional[float],
+            "tail_sampling_max_per_second": Optional[float],
+            "adaptive_sampling_target": Optional[float],
+            "iterative_serializer": Optional[bool],
+            "transport_batch_size": Optional[int],
+            "transport_batch_linger": Optional[float],
+            "async_transport": Optional[bool],
+            "transport_spool_dir": Optional[str],
+            "transport_spool_max_bytes": Optional[int],
+            "local_aggregation_socket": Optional[str],
+            "source_context_cache_bytes": Optional[int],
+            "source_context_mmap": Optional[bool],
+            "id_generator": Optional[Any],
+            "deferred_integrations": Optional[bool],
             # TODO: Remove these 2 profiling related experiments
             "profiles_sample_rate": Optional[float],
             "profiler_mode": Optional[ProfilerMode],
@@ -81,6 +99,7 @@ class OP:
     SUBPROCESS_WAIT = "subprocess.wait"
     SUBPROCESS_COMMUNICATE = "subprocess.communicate"
     TEMPLATE_RENDER = "template.render"
+    TRANSACTION_CHUNK = "transaction.chunk"
     VIEW_RENDER = "view.render"
     VIEW_RESPONSE_RENDER = "view.response.render"
     WEBSOCKET_SERVER = "websocket.server"
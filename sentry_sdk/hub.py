@@ -1,5 +1,6 @@
 import copy
 import sys
+import time
 
 from datetime import datetime
 from contextlib import contextmanager
@@ -23,6 +24,7 @@ from sentry_sdk._types import TYPE_CHECKING
 if TYPE_CHECKING:
     from typing import Union
     from typing import Any
+    from typing import Awaitable
     from typing import Optional
     from typing import Tuple
     from typing import Dict
@@ -145,6 +147,15 @@ else:
     init = (lambda: _init)()
 
 
+def _breadcrumb_from_kwargs(crumb, timestamp):
+    # type: (Breadcrumb, float) -> Breadcrumb
+    if crumb.get("timestamp") is None:
+        crumb["timestamp"] = datetime.utcfromtimestamp(timestamp)
+    if crumb.get("type") is None:
+        crumb["type"] = "default"
+    return crumb
+
+
 class HubMeta(type):
     @property
     def current(cls):
@@ -338,6 +349,12 @@ class Hub(with_metaclass(HubMeta)):  # type: ignore
             rv = client.capture_event(event, hint, scope)
             if rv is not None and not is_transaction:
                 self._last_event_id = rv
+                transaction = scope.transaction
+                if transaction is not None and (
+                    "exception" in event
+                    or event.get("level", "error") in ("error", "fatal")
+                ):
+                    transaction._error_captured = True
             return rv
         return None
 
@@ -423,11 +440,25 @@ class Hub(with_metaclass(HubMeta)):  # type: ignore
             logger.info("Dropped breadcrumb because no client bound")
             return
 
-        crumb = dict(crumb or ())  # type: Breadcrumb
-        crumb.update(kwargs)
+        if crumb is None:
+            crumb = kwargs
+        else:
+            crumb = dict(crumb)
+            crumb.update(kwargs)
         if not crumb:
             return
 
+        if client.options["before_breadcrumb"] is None:
+            # Nobody needs to see the breadcrumb now, only build it in case
+            # it is attached to an event.
+            scope._mutable("_breadcrumbs").append_lazy(
+                _breadcrumb_from_kwargs,
+                crumb,
+                time.time(),
+                client.options["max_breadcrumbs"],
+            )
+            return
+
         hint = dict(hint or ())  # type: Hint
 
         if crumb.get("timestamp") is None:
@@ -441,13 +472,59 @@ class Hub(with_metaclass(HubMeta)):  # type: ignore
             new_crumb = crumb
 
         if new_crumb is not None:
-            scope._breadcrumbs.append(new_crumb)
+            scope._mutable("_breadcrumbs").append(
+                new_crumb, client.options["max_breadcrumbs"]
+            )
         else:
             logger.info("before breadcrumb dropped breadcrumb (%s)", crumb)
 
-        max_breadcrumbs = client.options["max_breadcrumbs"]  # type: int
-        while len(scope._breadcrumbs) > max_breadcrumbs:
-            scope._breadcrumbs.popleft()
+    def _add_lazy_breadcrumb(
+        self,
+        factory,  # type: Callable[[Any, float], Optional[Breadcrumb]]
+        payload,  # type: Any
+        timestamp,  # type: float
+        make_hint=None,  # type: Optional[Callable[[Any], Hint]]
+    ):
+        # type: (...) -> None
+        """
+        Adds a breadcrumb that is only built by calling `factory` with
+        `payload` and `timestamp` when it is attached to an event, unless
+        `before_breadcrumb` needs to see it right away.
+        """
+        client, scope = self._stack[-1]
+        if client is None:
+            logger.info("Dropped breadcrumb because no client bound")
+            return
+
+        if client.options["before_breadcrumb"] is not None:
+            crumb = factory(payload, timestamp)
+            if crumb is not None:
+                hint = make_hint(payload) if make_hint is not None else None
+                self.add_breadcrumb(crumb, hint=hint)
+            return
+
+        scope._mutable("_breadcrumbs").append_lazy(
+            factory, payload, timestamp, client.options["max_breadcrumbs"]
+        )
+
+    def is_recording(self):
+        # type: () -> bool
+        """
+        Whether a span started now would be sent to Sentry, i.e. whether the
+        current span belongs to a sampled transaction that is still running.
+        """
+        span = self._stack[-1][1]._span
+        return span is not None and span.is_recording()
+
+    def span_is_unsampled(self):
+        # type: () -> bool
+        """
+        Whether there is a current span whose child spans would be discarded,
+        e.g. because its transaction is not sampled. Unlike `is_recording`
+        this is `False` if there is no current span at all.
+        """
+        span = self._stack[-1][1]._span
+        return span is not None and not span.is_recording()
 
     def start_span(
         self,
@@ -555,10 +632,13 @@ class Hub(with_metaclass(HubMeta)):  # type: ignore
         # we don't bother to keep spans if we already know we're not going to
         # send the transaction
         if transaction.sampled:
-            max_spans = (
-                self.client and self.client.options["_experiments"].get("max_spans")
-            ) or 1000
-            transaction.init_span_recorder(maxlen=max_spans)
+            experiments = (self.client and self.client.options["_experiments"]) or {}
+            max_spans = experiments.get("max_spans") or 1000
+            transaction.init_span_recorder(
+                maxlen=max_spans,
+                compress=bool(experiments.get("span_compression")),
+                chunk_size=experiments.get("transaction_chunk_size"),
+            )
 
         return transaction
 
@@ -706,7 +786,7 @@ class Hub(with_metaclass(HubMeta)):  # type: ignore
         timeout=None,  # type: Optional[float]
         callback=None,  # type: Optional[Callable[[int, float], None]]
     ):
-        # type: (...) -> None
+        # type: (...) -> Optional[Awaitable[None]]
         """
         Alias for :py:meth:`sentry_sdk.Client.flush`
         """
@@ -1,24 +1,32 @@
 """This package"""
 from __future__ import absolute_import
 
-from threading import Lock
+import itertools
+import sys
+from threading import Lock, RLock
 
 from sentry_sdk._compat import iteritems
-from sentry_sdk.utils import logger
+from sentry_sdk.utils import capture_internal_exceptions, logger
 
 from sentry_sdk._types import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from typing import Callable
     from typing import Dict
+    from typing import Any
     from typing import Iterator
     from typing import List
+    from typing import Optional
     from typing import Set
     from typing import Tuple
     from typing import Type
 
+    from sentry_sdk.client import Client
 
-_installer_lock = Lock()
+
+# Reentrant, as setting up a deferred integration can import the package of
+# another one and set that up as well.
+_installer_lock = RLock()
 _installed_integrations = set()  # type: Set[str]
 
 
@@ -69,6 +77,25 @@ _AUTO_ENABLING_INTEGRATIONS = (
     "sentry_sdk.integrations.boto3.Boto3Integration",
 )
 
+# The packages whose import sets up a deferred auto-enabling integration.
+_AUTO_ENABLING_INTEGRATION_PACKAGES = {
+    "sentry_sdk.integrations.django.DjangoIntegration": "django",
+    "sentry_sdk.integrations.flask.FlaskIntegration": "flask",
+    "sentry_sdk.integrations.starlette.StarletteIntegration": "starlette",
+    "sentry_sdk.integrations.fastapi.FastApiIntegration": "fastapi",
+    "sentry_sdk.integrations.bottle.BottleIntegration": "bottle",
+    "sentry_sdk.integrations.falcon.FalconIntegration": "falcon",
+    "sentry_sdk.integrations.sanic.SanicIntegration": "sanic",
+    "sentry_sdk.integrations.celery.CeleryIntegration": "celery",
+    "sentry_sdk.integrations.rq.RqIntegration": "rq",
+    "sentry_sdk.integrations.aiohttp.AioHttpIntegration": "aiohttp",
+    "sentry_sdk.integrations.tornado.TornadoIntegration": "tornado",
+    "sentry_sdk.integrations.sqlalchemy.SqlalchemyIntegration": "sqlalchemy",
+    "sentry_sdk.integrations.redis.RedisIntegration": "redis",
+    "sentry_sdk.integrations.pyramid.PyramidIntegration": "pyramid",
+    "sentry_sdk.integrations.boto3.Boto3Integration": "boto3",
+}
+
 
 iter_default_integrations = _generate_default_integrations_iterator(
     integrations=(
@@ -89,12 +116,21 @@ del _generate_default_integrations_iterator
 
 
 def setup_integrations(
-    integrations, with_defaults=True, with_auto_enabling_integrations=False
+    integrations,
+    with_defaults=True,
+    with_auto_enabling_integrations=False,
+    defer_auto_enabling_integrations=False,
 ):
-    # type: (List[Integration], bool, bool) -> Dict[str, Integration]
+    # type: (List[Integration], bool, bool, bool) -> Dict[str, Integration]
     """Given a list of integration instances this installs them all.  When
     `with_defaults` is set to `True` then all default integrations are added
     unless they were already provided before.
+
+    With `defer_auto_enabling_integrations`, auto-enabling integrations whose
+    package has not been imported yet are only imported and set up when the
+    application imports that package. They are then added to the integrations
+    of the current hub's client. Every call replaces the integrations that
+    are still waiting for their package.
     """
     integrations = dict(
         (integration.identifier, integration) for integration in integrations or ()
@@ -105,9 +141,20 @@ def setup_integrations(
     # Integrations that are not explicitly set up by the user.
     used_as_default_integration = set()
 
+    deferred = ()  # type: Tuple[str, ...]
+    if with_defaults and with_auto_enabling_integrations:
+        if defer_auto_enabling_integrations:
+            deferred = _AUTO_ENABLING_INTEGRATIONS
+            with_auto_enabling_integrations = False
+
+    # The integrations of packages that are imported already are set up
+    # right away.
+    imported = _replace_deferred_integrations(deferred)
+
     if with_defaults:
-        for integration_cls in iter_default_integrations(
-            with_auto_enabling_integrations
+        for integration_cls in itertools.chain(
+            iter_default_integrations(with_auto_enabling_integrations),
+            _import_integrations(imported),
         ):
             if integration_cls.identifier not in integrations:
                 instance = integration_cls()
@@ -115,32 +162,9 @@ def setup_integrations(
                 used_as_default_integration.add(instance.identifier)
 
     for identifier, integration in iteritems(integrations):
-        with _installer_lock:
-            if identifier not in _installed_integrations:
-                logger.debug(
-                    "Setting up previously not enabled integration %s", identifier
-                )
-                try:
-                    type(integration).setup_once()
-                except NotImplementedError:
-                    if getattr(integration, "install", None) is not None:
-                        logger.warning(
-                            "Integration %s: The install method is "
-                            "deprecated. Use `setup_once`.",
-                            identifier,
-                        )
-                        integration.install()
-                    else:
-                        raise
-                except DidNotEnable as e:
-                    if identifier not in used_as_default_integration:
-                        raise
-
-                    logger.debug(
-                        "Did not enable default integration %s: %s", identifier, e
-                    )
-
-                _installed_integrations.add(identifier)
+        _setup_integration(
+            identifier, integration, identifier in used_as_default_integration
+        )
 
     for identifier in integrations:
         logger.debug("Enabling integration %s", identifier)
@@ -148,6 +172,197 @@ def setup_integrations(
     return integrations
 
 
+def _setup_integration(identifier, integration, used_as_default_integration):
+    # type: (str, Integration, bool) -> None
+    with _installer_lock:
+        if identifier not in _installed_integrations:
+            logger.debug("Setting up previously not enabled integration %s", identifier)
+            try:
+                type(integration).setup_once()
+            except NotImplementedError:
+                if getattr(integration, "install", None) is not None:
+                    logger.warning(
+                        "Integration %s: The install method is "
+                        "deprecated. Use `setup_once`.",
+                        identifier,
+                    )
+                    integration.install()
+                else:
+                    raise
+            except DidNotEnable as e:
+                if not used_as_default_integration:
+                    raise
+
+                logger.debug("Did not enable default integration %s: %s", identifier, e)
+
+            _installed_integrations.add(identifier)
+
+
+_deferred_lock = Lock()
+# Package names mapped to the import strings of the integrations waiting for
+# them.
+_deferred_integrations = {}  # type: Dict[str, List[str]]
+_deferred_finder = None  # type: Optional[_DeferredIntegrationFinder]
+
+
+def _replace_deferred_integrations(import_strings):
+    # type: (Tuple[str, ...]) -> List[str]
+    """
+    Makes the given integrations wait for their package to be imported,
+    instead of the ones that were waiting so far. Returns the integrations
+    whose package is imported already.
+    """
+    global _deferred_finder
+
+    with _deferred_lock:
+        _deferred_integrations.clear()
+        for import_string in import_strings:
+            package = _AUTO_ENABLING_INTEGRATION_PACKAGES[import_string]
+            _deferred_integrations.setdefault(package, []).append(import_string)
+
+        if _deferred_integrations and _deferred_finder is None:
+            _deferred_finder = _DeferredIntegrationFinder()
+            sys.meta_path.insert(0, _deferred_finder)  # type: ignore
+
+        # Checked after registering, as a package imported in between would
+        # not trigger the setup anymore.
+        imported = []  # type: List[str]
+        for package in list(_deferred_integrations):
+            if package in sys.modules:
+                imported.extend(_deferred_integrations.pop(package))
+
+    for import_string in import_strings:
+        if import_string not in imported:
+            logger.debug(
+                "Deferring integration %s until %s is imported",
+                import_string,
+                _AUTO_ENABLING_INTEGRATION_PACKAGES[import_string],
+            )
+
+    return imported
+
+
+def _import_integrations(import_strings):
+    # type: (List[str]) -> Iterator[Type[Integration]]
+    from importlib import import_module
+
+    for import_string in import_strings:
+        try:
+            module, cls = import_string.rsplit(".", 1)
+            yield getattr(import_module(module), cls)
+        except (DidNotEnable, SyntaxError) as e:
+            logger.debug("Did not import default integration %s: %s", import_string, e)
+
+
+def _setup_deferred_integrations(package):
+    # type: (str) -> None
+    with _deferred_lock:
+        deferred = _deferred_integrations.pop(package, [])
+
+    from sentry_sdk.hub import Hub
+
+    client = Hub.current.client
+    if client is None:
+        return
+
+    # This runs while the application imports the package, which an
+    # integration failing to import or set up must not break.
+    for import_string in deferred:
+        with capture_internal_exceptions():
+            for integration_cls in _import_integrations([import_string]):
+                _setup_deferred_integration(client, integration_cls)
+
+
+def _setup_deferred_integration(client, integration_cls):
+    # type: (Client, Type[Integration]) -> None
+    identifier = integration_cls.identifier
+    if identifier in client.integrations:
+        return
+
+    integration = integration_cls()
+    _setup_integration(identifier, integration, True)
+
+    # Others may be reading the integrations, replace them instead of
+    # changing them.
+    with _deferred_lock:
+        integrations = dict(client.integrations)
+        integrations[identifier] = integration
+        client.integrations = integrations
+    logger.debug("Enabling integration %s", identifier)
+
+
+class _DeferredLoader(object):
+    """Runs the package's own loader, then sets up the integrations."""
+
+    def __init__(self, loader):
+        # type: (Any) -> None
+        self.loader = loader
+
+    def create_module(self, spec):
+        # type: (Any) -> Any
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # type: (Any) -> None
+        # The module should only ever see its own loader.
+        if getattr(module, "__loader__", None) is self:
+            module.__loader__ = self.loader
+        spec = getattr(module, "__spec__", None)
+        if spec is not None and spec.loader is self:
+            spec.loader = self.loader
+
+        self.loader.exec_module(module)
+        _setup_deferred_integrations(module.__name__)
+
+
+class _DeferredIntegrationFinder(object):
+    """
+    An import hook that sets up deferred integrations once their package has
+    been imported. It doesn't find anything itself, but wraps the loader of
+    the packages that are waited for.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        # Imports of the same module are serialized by the import system.
+        self._finding = set()  # type: Set[str]
+
+    def find_spec(self, fullname, path, target=None):
+        # type: (str, Any, Any) -> Any
+        if fullname not in _deferred_integrations or fullname in self._finding:
+            return None
+
+        from importlib.util import find_spec
+
+        self._finding.add(fullname)
+        try:
+            spec = find_spec(fullname)
+        finally:
+            self._finding.discard(fullname)
+
+        if spec is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _DeferredLoader(spec.loader)
+        return spec
+
+    def find_module(self, fullname, path=None):
+        # type: (str, Any) -> Any
+        # Python 2 only, Python 3 uses `find_spec`.
+        if fullname not in _deferred_integrations or fullname in self._finding:
+            return None
+        return self
+
+    def load_module(self, fullname):
+        # type: (str) -> Any
+        self._finding.add(fullname)
+        try:
+            __import__(fullname)
+        finally:
+            self._finding.discard(fullname)
+
+        _setup_deferred_integrations(fullname)
+        return sys.modules[fullname]
+
+
 class DidNotEnable(Exception):  # noqa: N818
     """
     The integration could not be enabled due to a trivial user error like
@@ -61,6 +61,9 @@ def _sentry_request_created(service_id, request, operation_name, **kwargs):
     if hub.get_integration(Boto3Integration) is None:
         return
 
+    if hub.span_is_unsampled():
+        return
+
     description = "aws.%s.%s" % (service_id, operation_name)
     span = hub.start_span(
         hub=hub,
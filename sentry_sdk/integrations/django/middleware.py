@@ -81,6 +81,9 @@ def _wrap_middleware(middleware, middleware_name):
         if integration is None or not integration.middleware_spans:
             return None
 
+        if hub.span_is_unsampled():
+            return None
+
         function_name = transaction_from_function(old_method)
 
         description = middleware_name
@@ -68,6 +68,9 @@ def patch_signals():
             return wrapper
 
         integration = hub.get_integration(DjangoIntegration)
+        if hub.span_is_unsampled():
+            return receivers
+
         if integration and integration.signals_spans:
             for idx, receiver in enumerate(receivers):
                 receivers[idx] = sentry_receiver_wrapper(receiver)
@@ -1,7 +1,11 @@
 from __future__ import absolute_import
 
+import atexit
+import copy
 import logging
 import datetime
+import sys
+import weakref
 from fnmatch import fnmatch
 
 from sentry_sdk.hub import Hub
@@ -10,7 +14,14 @@ from sentry_sdk.utils import (
     event_from_exception,
     current_stacktrace,
     capture_internal_exceptions,
+    get_errno,
+    safe_str,
+    serialize_frame,
+    should_hide_frame,
+    single_exception_from_error_tuple,
+    walk_exception_chain,
 )
+from sentry_sdk.worker import BackgroundWorker
 from sentry_sdk.integrations import Integration
 from sentry_sdk._compat import iteritems
 
@@ -18,9 +29,15 @@ from sentry_sdk._types import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from logging import LogRecord
+    from types import FrameType, TracebackType
     from typing import Any
     from typing import Dict
+    from typing import List
     from typing import Optional
+    from typing import Tuple
+
+    from sentry_sdk.client import Client
+    from sentry_sdk.scope import Scope
 
 DEFAULT_LEVEL = logging.INFO
 DEFAULT_EVENT_LEVEL = logging.ERROR
@@ -45,6 +62,21 @@ _IGNORED_LOGGERS = set(
     ["sentry_sdk.errors", "urllib3.connectionpool", "urllib3.connection"]
 )
 
+# Logger names mapped to whether their records can be recorded. The dict is
+# replaced whenever `_IGNORED_LOGGERS` changes, so that a decision made from
+# the old set can't end up in the new one.
+_can_record_cache = {}  # type: Dict[str, bool]
+
+MAX_CACHED_LOGGER_NAMES = 1000
+
+# The lowest level recorded by any logging integration. Records below it are
+# dropped before the integration is looked up.
+_min_level = sys.maxsize
+
+# Set when the integration hooks into logging with a handler on the root
+# logger instead of patching `Logger.callHandlers`.
+_root_handler = None  # type: Optional[_RootHandler]
+
 
 def ignore_logger(
     name,  # type: str
@@ -57,22 +89,62 @@ def ignore_logger(
 
     :param name: The name of the logger to ignore (same string you would pass to ``logging.getLogger``).
     """
+    global _can_record_cache
+
     _IGNORED_LOGGERS.add(name)
+    _can_record_cache = {}
+
+
+def _lower_min_level(level):
+    # type: (int) -> None
+    global _min_level
+
+    if level < _min_level:
+        _min_level = level
+        if _root_handler is not None:
+            _root_handler.setLevel(level)
 
 
 class LoggingIntegration(Integration):
+    """
+    With `background_events`, events for log records are built and sent
+    from a background thread, see :py:class:`EventHandler`.
+
+    By default, log records are picked up by patching
+    `logging.Logger.callHandlers`. With `root_handler`, a handler is added to
+    the root logger instead. Records from loggers that don't propagate are
+    missed then, and `logging.basicConfig` does nothing once the root logger
+    has a handler. The hook is installed by the first integration that is set
+    up in the process.
+    """
+
     identifier = "logging"
 
-    def __init__(self, level=DEFAULT_LEVEL, event_level=DEFAULT_EVENT_LEVEL):
-        # type: (Optional[int], Optional[int]) -> None
+    _use_root_handler = False
+
+    def __init__(
+        self,
+        level=DEFAULT_LEVEL,  # type: Optional[int]
+        event_level=DEFAULT_EVENT_LEVEL,  # type: Optional[int]
+        background_events=False,  # type: bool
+        root_handler=False,  # type: bool
+    ):
+        # type: (...) -> None
         self._handler = None
         self._breadcrumb_handler = None
 
         if level is not None:
             self._breadcrumb_handler = BreadcrumbHandler(level=level)
+            _lower_min_level(self._breadcrumb_handler.level)
 
         if event_level is not None:
-            self._handler = EventHandler(level=event_level)
+            self._handler = EventHandler(
+                level=event_level, background=background_events
+            )
+            _lower_min_level(self._handler.level)
+
+        if root_handler:
+            LoggingIntegration._use_root_handler = True
 
     def _handle_record(self, record):
         # type: (LogRecord) -> None
@@ -88,6 +160,13 @@ class LoggingIntegration(Integration):
     @staticmethod
     def setup_once():
         # type: () -> None
+        if LoggingIntegration._use_root_handler:
+            global _root_handler
+
+            _root_handler = _RootHandler(level=_min_level)
+            logging.getLogger().addHandler(_root_handler)
+            return
+
         old_callhandlers = logging.Logger.callHandlers
 
         def sentry_patched_callhandlers(self, record):
@@ -95,25 +174,52 @@ class LoggingIntegration(Integration):
             try:
                 return old_callhandlers(self, record)
             finally:
-                # This check is done twice, once also here before we even get
-                # the integration.  Otherwise we have a high chance of getting
-                # into a recursion error when the integration is resolved
-                # (this also is slower).
-                if record.name not in _IGNORED_LOGGERS:
-                    integration = Hub.current.get_integration(LoggingIntegration)
-                    if integration is not None:
-                        integration._handle_record(record)
+                if record.levelno >= _min_level:
+                    _dispatch_record(record)
 
         logging.Logger.callHandlers = sentry_patched_callhandlers  # type: ignore
 
 
+def _dispatch_record(record):
+    # type: (LogRecord) -> None
+    # This check is done twice, once also here before we even get the
+    # integration.  Otherwise we have a high chance of getting into a
+    # recursion error when the integration is resolved (this also is slower).
+    if _can_record(record):
+        integration = Hub.current.get_integration(LoggingIntegration)
+        if integration is not None:
+            integration._handle_record(record)
+
+
+class _RootHandler(logging.Handler, object):
+    """Passes the records reaching the root logger on to the integration."""
+
+    def handle(self, record):
+        # type: (LogRecord) -> bool
+        # The integration's handlers do their own locking and filtering.
+        _dispatch_record(record)
+        return True
+
+
 def _can_record(record):
     # type: (LogRecord) -> bool
     """Prevents ignored loggers from recording"""
+    cache = _can_record_cache
+    try:
+        return cache[record.name]
+    except KeyError:
+        pass
+
+    can_record = True
     for logger in _IGNORED_LOGGERS:
         if fnmatch(record.name, logger):
-            return False
-    return True
+            can_record = False
+            break
+
+    if len(cache) >= MAX_CACHED_LOGGER_NAMES:
+        cache.clear()
+    cache[record.name] = can_record
+    return can_record
 
 
 def _breadcrumb_from_record(record):
@@ -128,6 +234,31 @@ def _breadcrumb_from_record(record):
     }
 
 
+def _lazy_breadcrumb_payload(record):
+    # type: (LogRecord) -> Tuple[str, str, str, Dict[str, Any]]
+    # Breadcrumbs are kept around for a while, the record is not, as its
+    # `exc_info` holds on to a traceback and with it all of its frames.
+    return (
+        _logging_to_event_level(record),
+        record.name,
+        record.message,
+        _extra_from_record(record),
+    )
+
+
+def _breadcrumb_from_lazy_payload(payload, timestamp):
+    # type: (Tuple[str, str, str, Dict[str, Any]], float) -> Dict[str, Any]
+    level, name, message, extra = payload
+    return {
+        "type": "log",
+        "level": level,
+        "category": name,
+        "message": message,
+        "timestamp": datetime.datetime.utcfromtimestamp(timestamp),
+        "data": extra,
+    }
+
+
 def _logging_to_event_level(record):
     # type: (LogRecord) -> str
     return LOGGING_TO_EVENT_LEVEL.get(
@@ -175,19 +306,205 @@ def _extra_from_record(record):
     }
 
 
+def _add_record_data(event, hint, record):
+    # type: (Dict[str, Any], Dict[str, Any], LogRecord) -> None
+    hint["log_record"] = record
+
+    event["level"] = _logging_to_event_level(record)
+    event["logger"] = record.name
+
+    # Log records from `warnings` module as separate issues
+    record_caputured_from_warnings_module = (
+        record.name == "py.warnings" and record.msg == "%s"
+    )
+    if record_caputured_from_warnings_module:
+        # use the actual message and not "%s" as the message
+        # this prevents grouping all warnings under one "%s" issue
+        msg = record.args[0]  # type: ignore
+
+        event["logentry"] = {
+            "message": msg,
+            "params": (),
+        }
+
+    else:
+        event["logentry"] = {
+            "message": to_string(record.msg),
+            "params": record.args,
+        }
+
+    event["extra"] = _extra_from_record(record)
+
+
+class _FrameSnapshot(object):
+    """
+    The parts of a frame that end up in a stacktrace, with a copy of its
+    local variables as they were when the snapshot was taken.
+    """
+
+    __slots__ = ("f_code", "f_globals", "f_lineno", "f_locals")
+
+    def __init__(self, frame, lineno, include_local_variables):
+        # type: (FrameType, int, bool) -> None
+        self.f_code = frame.f_code
+        self.f_globals = frame.f_globals
+        self.f_lineno = lineno
+        self.f_locals = dict(frame.f_locals) if include_local_variables else {}
+
+
+class _TracebackSnapshot(object):
+    __slots__ = ("tb_frame", "tb_lineno", "tb_next")
+
+    def __init__(self, frame, tb_next):
+        # type: (_FrameSnapshot, Optional[_TracebackSnapshot]) -> None
+        self.tb_frame = frame
+        self.tb_lineno = frame.f_lineno
+        self.tb_next = tb_next
+
+
+class _ExceptionSnapshot(object):
+    """
+    An exception of a chain with a snapshot of its traceback. The exception
+    itself is only referenced weakly, as it holds on to the original
+    traceback.
+    """
+
+    __slots__ = ("type", "value", "errno", "tb", "_ref")
+
+    def __init__(self, exc_type, exc_value, tb, include_local_variables):
+        # type: (Any, Any, Optional[TracebackType], bool) -> None
+        self.type = exc_type
+        self.value = safe_str(exc_value)
+        self.errno = get_errno(exc_value)
+        self.tb = _snapshot_traceback(tb, include_local_variables)
+        try:
+            self._ref = weakref.ref(exc_value)  # type: Optional[weakref.ref[Any]]
+        except TypeError:
+            self._ref = None
+
+    def exc_info(self):
+        # type: () -> Tuple[Any, Any, Any]
+        """
+        The exception info for the event's hint. The value and traceback are
+        `None` if the exception is gone or can not be referenced weakly.
+        """
+        exc_value = self._ref() if self._ref is not None else None
+        return (self.type, exc_value, getattr(exc_value, "__traceback__", None))
+
+    def to_json(self, client_options):
+        # type: (Dict[str, Any]) -> Dict[str, Any]
+        mechanism = {"type": "logging", "handled": True}  # type: Dict[str, Any]
+        if self.errno is not None:
+            mechanism["meta"] = {"errno": {"number": self.errno}}
+
+        rv = single_exception_from_error_tuple(
+            self.type, None, self.tb, client_options, mechanism  # type: ignore
+        )
+        rv["value"] = self.value
+        return rv
+
+
+def _snapshot_traceback(tb, include_local_variables):
+    # type: (Optional[TracebackType], bool) -> Optional[_TracebackSnapshot]
+    frames = []
+    while tb is not None:
+        if not should_hide_frame(tb.tb_frame):
+            frames.append(
+                _FrameSnapshot(tb.tb_frame, tb.tb_lineno, include_local_variables)
+            )
+        tb = tb.tb_next
+
+    snapshot = None
+    for frame in reversed(frames):
+        snapshot = _TracebackSnapshot(frame, snapshot)
+    return snapshot
+
+
+def _snapshot_stack(include_local_variables):
+    # type: (bool) -> List[_FrameSnapshot]
+    frames = []
+    f = sys._getframe(1)  # type: Optional[FrameType]
+    while f is not None:
+        if not should_hide_frame(f):
+            frames.append(_FrameSnapshot(f, f.f_lineno, include_local_variables))
+        f = f.f_back
+
+    frames.reverse()
+    return frames
+
+
 class EventHandler(logging.Handler, object):
     """
     A logging handler that emits Sentry events for each log record
 
     Note that you do not have to use this class if the logging integration is enabled, which it is by default.
+
+    With `background`, only a snapshot of the record, its stack and the
+    current scope is taken on the logging thread. The event is built and
+    captured on a background thread. Local variables are copied, but the
+    objects they refer to are not. Call :py:meth:`flush` to wait for
+    pending events, which also happens when the interpreter exits.
     """
 
+    def __init__(self, level=logging.NOTSET, background=False):
+        # type: (int, bool) -> None
+        logging.Handler.__init__(self, level)
+        self.background = background
+        self._worker = None  # type: Optional[BackgroundWorker]
+
     def emit(self, record):
         # type: (LogRecord) -> Any
         with capture_internal_exceptions():
             self.format(record)
             return self._emit(record)
 
+    def flush(self):
+        # type: () -> None
+        worker = self._worker
+        if worker is not None:
+            client = Hub.current.client
+            timeout = client.options["shutdown_timeout"] if client else 2
+            worker.flush(timeout)
+
+    def _emit_in_background(self, hub, record):
+        # type: (Hub, LogRecord) -> None
+        client, scope = hub._stack[-1]
+        assert client is not None
+        include_local_variables = client.options["include_local_variables"]
+
+        exc_chain = None
+        stack = None
+        if record.exc_info and record.exc_info[0] is not None:
+            exc_chain = [
+                _ExceptionSnapshot(exc_type, exc_value, tb, include_local_variables)
+                for exc_type, exc_value, tb in walk_exception_chain(record.exc_info)
+            ]
+        elif record.exc_info and record.exc_info[0] is None:
+            with capture_internal_exceptions():
+                stack = _snapshot_stack(include_local_variables)
+
+        # The exception's traceback would keep the original frames alive.
+        record = copy.copy(record)
+        record.exc_info = None
+
+        # Scopes are copied on write, so this is cheap.
+        scope = copy.copy(scope)
+
+        def capture():
+            # type: () -> None
+            _capture_in_background(hub, client, scope, record, exc_chain, stack)
+
+        if self._worker is None:
+            # Handlers are locked while emitting, so there is only one worker.
+            self._worker = BackgroundWorker()
+            atexit.register(self.flush)
+
+        if not self._worker.submit(capture):
+            if client.transport is not None:
+                client.transport.record_lost_event(
+                    "queue_overflow", data_category="error"
+                )
+
     def _emit(self, record):
         # type: (LogRecord) -> None
         if not _can_record(record):
@@ -197,6 +514,10 @@ class EventHandler(logging.Handler, object):
         if hub.client is None:
             return
 
+        if self.background:
+            self._emit_in_background(hub, record)
+            return
+
         client_options = hub.client.options
 
         # exc_info might be None or (None, None, None)
@@ -230,34 +551,56 @@ class EventHandler(logging.Handler, object):
             event = {}
             hint = {}
 
-        hint["log_record"] = record
+        _add_record_data(event, hint, record)
 
-        event["level"] = _logging_to_event_level(record)
-        event["logger"] = record.name
+        hub.capture_event(event, hint=hint)
 
-        # Log records from `warnings` module as separate issues
-        record_caputured_from_warnings_module = (
-            record.name == "py.warnings" and record.msg == "%s"
-        )
-        if record_caputured_from_warnings_module:
-            # use the actual message and not "%s" as the message
-            # this prevents grouping all warnings under one "%s" issue
-            msg = record.args[0]  # type: ignore
-
-            event["logentry"] = {
-                "message": msg,
-                "params": (),
-            }
 
-        else:
-            event["logentry"] = {
-                "message": to_string(record.msg),
-                "params": record.args,
+def _capture_in_background(
+    hub,  # type: Hub
+    client,  # type: Client
+    scope,  # type: Scope
+    record,  # type: LogRecord
+    exc_chain,  # type: Optional[List[_ExceptionSnapshot]]
+    stack,  # type: Optional[List[_FrameSnapshot]]
+):
+    # type: (...) -> None
+    client_options = client.options
+
+    event = {}  # type: Dict[str, Any]
+    hint = {}  # type: Dict[str, Any]
+    if exc_chain is not None:
+        values = [snapshot.to_json(client_options) for snapshot in exc_chain]
+        values.reverse()
+        event = {"level": "error", "exception": {"values": values}}
+        hint = {"exc_info": exc_chain[0].exc_info()}
+    elif stack is not None:
+        with capture_internal_exceptions():
+            include_local_variables = client_options["include_local_variables"]
+            frames = [
+                serialize_frame(
+                    frame,  # type: ignore
+                    include_local_variables=include_local_variables,
+                )
+                for frame in stack
+            ]
+            event["threads"] = {
+                "values": [
+                    {
+                        "stacktrace": {"frames": frames},
+                        "crashed": False,
+                        "current": True,
+                    }
+                ]
             }
 
-        event["extra"] = _extra_from_record(record)
+    _add_record_data(event, hint, record)
 
-        hub.capture_event(event, hint=hint)
+    with Hub(client, scope) as background_hub:
+        event_id = background_hub.capture_event(event, hint=hint)
+
+    if event_id is not None:
+        hub._last_event_id = event_id
 
 
 # Legacy name
@@ -282,6 +625,17 @@ class BreadcrumbHandler(logging.Handler, object):
         if not _can_record(record):
             return
 
-        Hub.current.add_breadcrumb(
-            _breadcrumb_from_record(record), hint={"log_record": record}
+        hub = Hub.current
+        client = hub.client
+        if client is not None and client.options["before_breadcrumb"] is not None:
+            # The hint gives `before_breadcrumb` the record itself.
+            hub.add_breadcrumb(
+                _breadcrumb_from_record(record), hint={"log_record": record}
+            )
+            return
+
+        hub._add_lazy_breadcrumb(
+            _breadcrumb_from_lazy_payload,
+            _lazy_breadcrumb_payload(record),
+            record.created,
         )
@@ -119,21 +119,30 @@ class CommandTracer(monitoring.CommandListener):
             except TypeError:
                 pass
 
-            data = {"operation_ids": {}}  # type: Dict[str, Dict[str, Any]]
-
-            data["operation_ids"]["operation"] = event.operation_id
-            data["operation_ids"]["request"] = event.request_id
-
             try:
                 lsid = command.pop("lsid")["id"]
-                data["operation_ids"]["session"] = str(lsid)
             except KeyError:
-                pass
+                lsid = None
 
             if not _should_send_default_pii():
                 command = _strip_pii(command)
 
             query = "{} {}".format(event.command_name, command)
+
+            with capture_internal_exceptions():
+                hub.add_breadcrumb(message=query, category="query", type=op, data=tags)
+
+            if hub.span_is_unsampled():
+                return
+
+            data = {"operation_ids": {}}  # type: Dict[str, Dict[str, Any]]
+
+            data["operation_ids"]["operation"] = event.operation_id
+            data["operation_ids"]["request"] = event.request_id
+
+            if lsid is not None:
+                data["operation_ids"]["session"] = str(lsid)
+
             span = hub.start_span(op=op, description=query)
 
             for tag, value in tags.items():
@@ -142,9 +151,6 @@ class CommandTracer(monitoring.CommandListener):
             for key, value in data.items():
                 span.set_data(key, value)
 
-            with capture_internal_exceptions():
-                hub.add_breadcrumb(message=query, category="query", type=op, data=tags)
-
             self._ongoing_operations[self._operation_key(event)] = span.__enter__()
 
     def failed(self, event):
@@ -1,14 +1,27 @@
 from __future__ import absolute_import
 
+import time
+from datetime import datetime
+
 from sentry_sdk import Hub
+from sentry_sdk._compat import text_type
 from sentry_sdk.consts import OP
-from sentry_sdk.utils import capture_internal_exceptions, logger
+from sentry_sdk.utils import (
+    MAX_STRING_LENGTH,
+    ContextVar,
+    capture_internal_exceptions,
+    logger,
+    nanosecond_time,
+    now,
+)
 from sentry_sdk.integrations import Integration, DidNotEnable
 
 from sentry_sdk._types import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from typing import Any, Sequence
+    from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+    from sentry_sdk.tracing import Span, Transaction
 
 _SINGLE_KEY_COMMANDS = frozenset(
     ["decr", "decrby", "get", "incr", "incrby", "pttl", "set", "setex", "setnx", "ttl"]
@@ -18,6 +31,180 @@ _MULTI_KEY_COMMANDS = frozenset(["del", "touch", "unlink"])
 #: Trim argument lists to this many values
 _MAX_NUM_ARGS = 10
 
+#: Upper bounds of the buckets of the duration histogram of batched commands
+_HISTOGRAM_BOUNDS_MS = (0.1, 1, 10, 100)
+
+
+class _RedisBatch(object):
+    """Consecutive calls of the same command, reported as one span."""
+
+    __slots__ = ("span", "parent", "command", "data")
+
+    def __init__(self, span, parent, command, duration):
+        # type: (Span, Span, str, float) -> None
+        self.span = span
+        self.parent = parent
+        self.command = command
+        self.data = {
+            "count": 0,
+            "total_duration": 0.0,
+            "max_duration": 0.0,
+            "histogram": {
+                "bounds_ms": list(_HISTOGRAM_BOUNDS_MS),
+                "counts": [0] * (len(_HISTOGRAM_BOUNDS_MS) + 1),
+            },
+        }  # type: Dict[str, Any]
+        self.add(duration)
+
+    def add(self, duration):
+        # type: (float) -> None
+        data = self.data
+        data["count"] += 1
+        data["total_duration"] += duration
+        data["max_duration"] = max(data["max_duration"], duration)
+
+        bucket = 0
+        while (
+            bucket < len(_HISTOGRAM_BOUNDS_MS)
+            and duration * 1000 > _HISTOGRAM_BOUNDS_MS[bucket]
+        ):
+            bucket += 1
+        data["histogram"]["counts"][bucket] += 1
+
+    def extend(self, duration):
+        # type: (float) -> None
+        self.add(duration)
+
+        span = self.span
+        if self.data["count"] == 2:
+            # The keys of the individual calls are not reported.
+            span.description = self.command
+            span._tags.pop("redis.key", None)
+            span.set_data("redis.batch", self.data)
+
+        # Spans are only serialized when the transaction finishes, so the
+        # end of the already finished span can still be moved.
+        try:
+            span._end_timestamp_monotonic_ns = nanosecond_time()
+            span._timestamp = None
+        except AttributeError:
+            span._timestamp = datetime.utcnow()
+
+
+class _TransactionState(object):
+    """Redis related state of the transaction running in the current context."""
+
+    __slots__ = ("transaction_id", "description_bytes", "batch")
+
+    def __init__(self, transaction_id):
+        # type: (str) -> None
+        self.transaction_id = transaction_id
+        self.description_bytes = 0
+        self.batch = None  # type: Optional[_RedisBatch]
+
+
+_transaction_state = ContextVar("sentry_redis_transaction_state")
+
+
+def _get_transaction_state(transaction):
+    # type: (Transaction) -> _TransactionState
+    state = _transaction_state.get(None)
+    if state is None or state.transaction_id != transaction.span_id:
+        state = _TransactionState(transaction.span_id)
+        _transaction_state.set(state)
+    return state
+
+
+def _encoded_size(description):
+    # type: (str) -> int
+    if isinstance(description, text_type):
+        return len(description.encode("utf-8", "replace"))
+    return len(description)
+
+
+def _within_budget(hub, integration, descriptions):
+    # type: (Hub, RedisIntegration, Sequence[str]) -> bool
+    """
+    Whether the descriptions still fit into the description budget of the
+    current transaction, in which case they are counted against it.
+    """
+    if integration.max_description_bytes is None:
+        return True
+
+    transaction = hub.scope.transaction
+    if transaction is None:
+        return True
+
+    state = _get_transaction_state(transaction)
+    size = sum(_encoded_size(description) for description in descriptions)
+    if state.description_bytes + size > integration.max_description_bytes:
+        return False
+    state.description_bytes += size
+    return True
+
+
+def _get_recording_transaction(hub):
+    # type: (Hub) -> Optional[Transaction]
+    """Return the current transaction if spans started now would be sent."""
+    if not hub.is_recording():
+        return None
+    return hub.scope.transaction
+
+
+def _get_command_description(name, args):
+    # type: (str, Sequence[Any]) -> str
+    description_parts = [name]
+    for i, arg in enumerate(args):
+        if i > _MAX_NUM_ARGS:
+            break
+
+        description_parts.append(repr(arg))
+
+    return " ".join(description_parts)
+
+
+def _get_command_tags(name, args, is_cluster):
+    # type: (str, Sequence[Any], bool) -> Dict[str, Any]
+    tags = {"redis.is_cluster": is_cluster}  # type: Dict[str, Any]
+    if name:
+        tags["redis.command"] = name
+
+    if name and args:
+        name_low = name.lower()
+        if (name_low in _SINGLE_KEY_COMMANDS) or (
+            name_low in _MULTI_KEY_COMMANDS and len(args) == 1
+        ):
+            tags["redis.key"] = args[0]
+
+    return tags
+
+
+def _get_breadcrumb_args(args):
+    # type: (Sequence[Any]) -> Tuple[Any, ...]
+    """
+    Copy the arguments that end up in the breadcrumb, with long values cut
+    where the serializer would cut them, so a lazy breadcrumb does not keep
+    the values the command was called with alive.
+    """
+    return tuple(
+        arg[:MAX_STRING_LENGTH]
+        if isinstance(arg, (bytes, bytearray, text_type))
+        else arg
+        for arg in args[: _MAX_NUM_ARGS + 1]
+    )
+
+
+def _breadcrumb_from_command(payload, timestamp):
+    # type: (Tuple[str, Sequence[Any], bool], float) -> Dict[str, Any]
+    name, args, is_cluster = payload
+    return {
+        "type": "redis",
+        "category": "redis",
+        "message": _get_command_description(name, args),
+        "data": _get_command_tags(name, args, is_cluster),
+        "timestamp": datetime.utcfromtimestamp(timestamp),
+    }
+
 
 def patch_redis_pipeline(pipeline_cls, is_cluster, get_command_args_fn):
     # type: (Any, bool, Any) -> None
@@ -26,8 +213,17 @@ def patch_redis_pipeline(pipeline_cls, is_cluster, get_command_args_fn):
     def sentry_patched_execute(self, *args, **kwargs):
         # type: (Any, *Any, **Any) -> Any
         hub = Hub.current
+        integration = hub.get_integration(RedisIntegration)
+
+        if integration is None:
+            return old_execute(self, *args, **kwargs)
 
-        if hub.get_integration(RedisIntegration) is None:
+        if (
+            integration.batch_commands or hub.scope.span is not None
+        ) and not hub.is_recording():
+            hub.add_breadcrumb(
+                message="redis.pipeline.execute", type="redis", category="redis"
+            )
             return old_execute(self, *args, **kwargs)
 
         with hub.start_span(
@@ -49,6 +245,9 @@ def patch_redis_pipeline(pipeline_cls, is_cluster, get_command_args_fn):
                         command_args.append(command_arg)
                     commands.append(" ".join(command_args))
 
+                if not _within_budget(hub, integration, commands):
+                    commands = []
+
                 span.set_data(
                     "redis.commands",
                     {"count": len(self.command_stack), "first_ten": commands},
@@ -94,8 +293,24 @@ def _patch_rediscluster():
 
 
 class RedisIntegration(Integration):
+    """
+    With `batch_commands`, consecutive calls of the same command within the
+    same parent span are reported as a single span with the number of calls
+    and a histogram of their durations, and no spans are created without a
+    sampled transaction.
+
+    `max_description_bytes` limits the total UTF-8 encoded size of command
+    descriptions per transaction. Commands beyond it are only described by
+    their name.
+    """
+
     identifier = "redis"
 
+    def __init__(self, batch_commands=False, max_description_bytes=None):
+        # type: (bool, Optional[int]) -> None
+        self.batch_commands = batch_commands
+        self.max_description_bytes = max_description_bytes
+
     @staticmethod
     def setup_once():
         # type: () -> None
@@ -139,34 +354,102 @@ def patch_redis_client(cls, is_cluster):
     def sentry_patched_execute_command(self, name, *args, **kwargs):
         # type: (Any, str, *Any, **Any) -> Any
         hub = Hub.current
+        integration = hub.get_integration(RedisIntegration)
 
-        if hub.get_integration(RedisIntegration) is None:
+        if integration is None:
+            return old_execute_command(self, name, *args, **kwargs)
+
+        if integration.batch_commands:
+            return _execute_batched(
+                hub,
+                integration,
+                is_cluster,
+                old_execute_command,
+                self,
+                name,
+                args,
+                kwargs,
+            )
+
+        if hub.span_is_unsampled():
+            with capture_internal_exceptions():
+                hub._add_lazy_breadcrumb(
+                    _breadcrumb_from_command,
+                    (name, _get_breadcrumb_args(args), is_cluster),
+                    time.time(),
+                )
             return old_execute_command(self, name, *args, **kwargs)
 
         description = name
 
         with capture_internal_exceptions():
-            description_parts = [name]
-            for i, arg in enumerate(args):
-                if i > _MAX_NUM_ARGS:
-                    break
-
-                description_parts.append(repr(arg))
-
-            description = " ".join(description_parts)
+            description = _get_command_description(name, args)
+            if not _within_budget(hub, integration, (description,)):
+                description = name
 
         with hub.start_span(op=OP.DB_REDIS, description=description) as span:
-            span.set_tag("redis.is_cluster", is_cluster)
-            if name:
-                span.set_tag("redis.command", name)
-
-            if name and args:
-                name_low = name.lower()
-                if (name_low in _SINGLE_KEY_COMMANDS) or (
-                    name_low in _MULTI_KEY_COMMANDS and len(args) == 1
-                ):
-                    span.set_tag("redis.key", args[0])
+            for key, value in _get_command_tags(name, args, is_cluster).items():
+                span.set_tag(key, value)
 
             return old_execute_command(self, name, *args, **kwargs)
 
     cls.execute_command = sentry_patched_execute_command
+
+
+def _execute_batched(
+    hub,  # type: Hub
+    integration,  # type: RedisIntegration
+    is_cluster,  # type: bool
+    execute_command,  # type: Any
+    client,  # type: Any
+    name,  # type: str
+    args,  # type: Tuple[Any, ...]
+    kwargs,  # type: Dict[str, Any]
+):
+    # type: (...) -> Any
+    transaction = _get_recording_transaction(hub)
+    if transaction is None:
+        # No span would be sent, only leave a breadcrumb. It is only built
+        # if an event is sent.
+        with capture_internal_exceptions():
+            hub._add_lazy_breadcrumb(
+                _breadcrumb_from_command,
+                (name, _get_breadcrumb_args(args), is_cluster),
+                time.time(),
+            )
+        return execute_command(client, name, *args, **kwargs)
+
+    state = _get_transaction_state(transaction)
+    parent = hub.scope.span
+    batch = state.batch
+    spans = transaction._span_recorder.spans  # type: List[Span]
+
+    if (
+        batch is not None
+        and batch.command == name
+        and batch.parent is parent
+        and spans
+        and spans[-1] is batch.span
+    ):
+        start = now()
+        try:
+            return execute_command(client, name, *args, **kwargs)
+        finally:
+            with capture_internal_exceptions():
+                batch.extend(now() - start)
+
+    description = name
+    with capture_internal_exceptions():
+        description = _get_command_description(name, args)
+        if not _within_budget(hub, integration, (description,)):
+            description = name
+
+    with hub.start_span(op=OP.DB_REDIS, description=description) as span:
+        for key, value in _get_command_tags(name, args, is_cluster).items():
+            span.set_tag(key, value)
+
+        start = now()
+        try:
+            return execute_command(client, name, *args, **kwargs)
+        finally:
+            state.batch = _RedisBatch(span, parent, name, now() - start)
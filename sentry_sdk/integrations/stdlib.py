@@ -2,6 +2,9 @@ import os
 import subprocess
 import sys
 import platform
+import time
+from datetime import datetime
+
 from sentry_sdk.consts import OP
 
 from sentry_sdk.hub import Hub
@@ -23,8 +26,10 @@ if TYPE_CHECKING:
     from typing import Dict
     from typing import Optional
     from typing import List
+    from typing import Tuple
 
-    from sentry_sdk._types import SentryEvent, Hint
+    from sentry_sdk._types import Breadcrumb, SentryEvent, Hint
+    from sentry_sdk.tracing import Span
 
 
 try:
@@ -84,6 +89,15 @@ def _install_httplib():
                 url,
             )
 
+        if hub.span_is_unsampled():
+            # The span would be discarded anyway, only keep what is needed
+            # for propagating the trace and for the breadcrumb.
+            rv = real_putrequest(self, method, url, *args, **kwargs)
+            _propagate_trace(self, hub, real_url, hub.scope.span)
+            self._sentrysdk_span = None
+            self._sentrysdk_request = (method, real_url)
+            return rv
+
         parsed_url = parse_url(real_url, sanitize=False)
 
         span = hub.start_span(
@@ -98,16 +112,10 @@ def _install_httplib():
 
         rv = real_putrequest(self, method, url, *args, **kwargs)
 
-        if should_propagate_trace(hub, real_url):
-            for key, value in hub.iter_trace_propagation_headers(span):
-                logger.debug(
-                    "[Tracing] Adding `{key}` header {value} to outgoing request to {real_url}.".format(
-                        key=key, value=value, real_url=real_url
-                    )
-                )
-                self.putheader(key, value)
+        _propagate_trace(self, hub, real_url, span)
 
         self._sentrysdk_span = span
+        self._sentrysdk_request = None
 
         return rv
 
@@ -116,7 +124,18 @@ def _install_httplib():
         span = getattr(self, "_sentrysdk_span", None)
 
         if span is None:
-            return real_getresponse(self, *args, **kwargs)
+            request = getattr(self, "_sentrysdk_request", None)
+            rv = real_getresponse(self, *args, **kwargs)
+            if request is not None:
+                self._sentrysdk_request = None
+                method, real_url = request
+                Hub.current._add_lazy_breadcrumb(
+                    _breadcrumb_from_response,
+                    (method, real_url, rv.status, rv.reason),
+                    time.time(),
+                    make_hint=lambda payload: {"httplib_response": rv},
+                )
+            return rv
 
         rv = real_getresponse(self, *args, **kwargs)
 
@@ -131,6 +150,37 @@ def _install_httplib():
     HTTPConnection.getresponse = getresponse
 
 
+def _propagate_trace(connection, hub, real_url, span):
+    # type: (HTTPConnection, Hub, str, Span) -> None
+    if should_propagate_trace(hub, real_url):
+        for key, value in hub.iter_trace_propagation_headers(span):
+            logger.debug(
+                "[Tracing] Adding `{key}` header {value} to outgoing request to {real_url}.".format(
+                    key=key, value=value, real_url=real_url
+                )
+            )
+            connection.putheader(key, value)
+
+
+def _breadcrumb_from_response(payload, timestamp):
+    # type: (Tuple[str, str, int, str], float) -> Breadcrumb
+    method, real_url, status_code, reason = payload
+    parsed_url = parse_url(real_url, sanitize=False)
+    return {
+        "type": "http",
+        "category": "httplib",
+        "data": {
+            "method": method,
+            "url": parsed_url.url,
+            "http.query": parsed_url.query,
+            "http.fragment": parsed_url.fragment,
+            "status_code": status_code,
+            "reason": reason,
+        },
+        "timestamp": datetime.utcfromtimestamp(timestamp),
+    }
+
+
 def _init_argument(args, kwargs, name, position, setdefault_callback=None):
     # type: (List[Any], Dict[Any, Any], str, int, Optional[Callable[[Any], Any]]) -> Any
     """
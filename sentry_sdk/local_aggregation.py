@@ -0,0 +1,260 @@
+import errno
+import json
+import os
+import socket
+import threading
+from contextlib import contextmanager
+
+from sentry_sdk.utils import json_dumps, logger
+
+from sentry_sdk._types import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import Dict
+    from typing import Generator
+    from typing import List
+    from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+
+# Messages are single datagrams, anything larger is sent directly instead
+MAX_MESSAGE_BYTES = 64 * 1024
+
+_COLLECTOR_GONE = (errno.ECONNREFUSED, errno.ENOENT)
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+def local_aggregation_supported():
+    # type: () -> bool
+    return hasattr(socket, "AF_UNIX") and fcntl is not None
+
+
+@contextmanager
+def _locked(path):
+    # type: (str) -> Generator[None, None, None]
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class LocalAggregator(object):
+    """
+    Lets the processes of a pre-fork server send their session aggregates
+    and client reports through one of them.
+
+    The first process to bind the Unix datagram socket at `path` becomes the
+    collector. The other processes publish what they would have sent to it,
+    and the collector merges the published data into its own envelopes. If
+    the collector goes away, the next process that fails to reach it takes
+    over.
+
+    The socket is only set up when it is first used, so that processes which
+    fork after initializing the SDK don't share it.
+    """
+
+    def __init__(self, path):
+        # type: (str) -> None
+        self.path = path
+        self.is_collector = False
+        self.closed = False
+        self._socket = None  # type: Optional[socket.socket]
+        self._pid = None  # type: Optional[int]
+        self._inode = None  # type: Optional[int]
+        self._received = {
+            "sessions": [],
+            "discarded_events": [],
+        }  # type: Dict[str, List[Any]]
+        self._lock = threading.Lock()
+
+    def _ensure_socket(self):
+        # type: () -> None
+        if self._pid == os.getpid():
+            return
+
+        # Sockets inherited from the parent process stay with the parent
+        if self._socket is not None:
+            self._socket.close()
+        self._socket = None
+        self.is_collector = False
+        for received in self._received.values():
+            del received[:]
+        self._pid = os.getpid()
+
+        self._elect()
+
+    def _collector_reachable(self, sock):
+        # type: (socket.socket) -> bool
+        try:
+            # The collector ignores empty messages
+            sock.sendto(b"", self.path)
+        except socket.error as e:
+            if e.errno in _COLLECTOR_GONE:
+                return False
+        return True
+
+    def _elect(self):
+        # type: () -> None
+        """Become the collector unless another process is one already."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        self.is_collector = False
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        try:
+            with _locked(self.path + ".lock"):
+                if not self._collector_reachable(sock):
+                    if os.path.exists(self.path):
+                        # Left behind by a collector that died
+                        os.unlink(self.path)
+                    sock.bind(self.path)
+                    self._inode = os.stat(self.path).st_ino
+                    self.is_collector = True
+        except Exception:
+            sock.close()
+            raise
+
+        self._socket = sock
+        logger.debug(
+            "Local aggregation: %s %s",
+            "collecting on" if self.is_collector else "publishing to",
+            self.path,
+        )
+
+    def _receive(self):
+        # type: () -> None
+        assert self._socket is not None
+        while True:
+            try:
+                data = self._socket.recv(MAX_MESSAGE_BYTES)
+            except socket.error as e:
+                if e.errno in _WOULD_BLOCK:
+                    return
+                raise
+
+            if not data:
+                continue
+
+            try:
+                message = json.loads(data.decode("utf-8"))
+                for key, items in message.items():
+                    self._received[key].extend(items)
+            except (ValueError, KeyError, AttributeError):
+                logger.debug("Local aggregation: dropping invalid message")
+
+    def _publish(self, key, items):
+        # type: (str, List[Any]) -> bool
+        with self._lock:
+            if self.closed:
+                return False
+
+            try:
+                self._ensure_socket()
+            except Exception:
+                logger.warning(
+                    "Local aggregation: cannot use %s", self.path, exc_info=True
+                )
+                return False
+
+            if self.is_collector:
+                return False
+
+            data = json_dumps({key: items})
+            if len(data) > MAX_MESSAGE_BYTES:
+                return False
+
+            assert self._socket is not None
+            try:
+                self._socket.sendto(data, self.path)
+                return True
+            except socket.error as e:
+                if e.errno in _COLLECTOR_GONE:
+                    try:
+                        self._elect()
+                    except Exception:
+                        logger.warning(
+                            "Local aggregation: cannot use %s",
+                            self.path,
+                            exc_info=True,
+                        )
+                # A full queue or an oversized message is sent directly too
+                return False
+
+    def _take(self, key):
+        # type: (str) -> List[Any]
+        with self._lock:
+            if not self.closed:
+                try:
+                    self._ensure_socket()
+                    if self.is_collector:
+                        self._receive()
+                except Exception:
+                    logger.warning(
+                        "Local aggregation: cannot receive from %s",
+                        self.path,
+                        exc_info=True,
+                    )
+
+            received = self._received[key]
+            self._received[key] = []
+            return received
+
+    def publish_sessions(self, aggregates):
+        # type: (List[Any]) -> bool
+        """
+        Hand session aggregates over to the collector. Returns `False` if
+        this process has to send them itself.
+        """
+        return self._publish("sessions", aggregates)
+
+    def take_sessions(self):
+        # type: () -> List[Any]
+        """Returns the session aggregates published to this collector."""
+        return self._take("sessions")
+
+    def publish_discarded_events(self, discarded_events):
+        # type: (List[Any]) -> bool
+        """
+        Hand discarded event counts over to the collector. Returns `False` if
+        this process has to send them itself.
+        """
+        return self._publish("discarded_events", discarded_events)
+
+    def take_discarded_events(self):
+        # type: () -> List[Any]
+        """Returns the discarded event counts published to this collector."""
+        return self._take("discarded_events")
+
+    def close(self):
+        # type: () -> None
+        """
+        Stop aggregating. A collector keeps what was published to it until
+        it is taken, everything else is sent directly from now on.
+        """
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+
+            if self._socket is None or self._pid != os.getpid():
+                return
+
+            try:
+                if self.is_collector:
+                    self._receive()
+                    if os.stat(self.path).st_ino == self._inode:
+                        os.unlink(self.path)
+            except Exception:
+                logger.debug("Local aggregation: failed to clean up", exc_info=True)
+            finally:
+                self._socket.close()
+                self._socket = None
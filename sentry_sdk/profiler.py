@@ -33,7 +33,8 @@ import sys
 import threading
 import time
 import uuid
-from collections import deque
+from array import array
+from collections import deque, OrderedDict
 
 import sentry_sdk
 from sentry_sdk._compat import PY33, PY311
@@ -77,6 +78,7 @@ if TYPE_CHECKING:
     ]
     RawStack = Tuple[RawFrame, ...]
     RawSample = Sequence[Tuple[str, Tuple[RawStackId, RawStack, Deque[FrameType]]]]
+    InternedSample = Sequence[Tuple[str, "InternedStack"]]
 
     ProcessedSample = TypedDict(
         "ProcessedSample",
@@ -159,6 +161,14 @@ DEFAULT_SAMPLING_FREQUENCY = 101
 # considered valid.
 PROFILE_MINIMUM_SAMPLES = 2
 
+# The maximum number of stacks and frames kept by the `StackInterner`.
+MAX_INTERNED_STACKS = 4096
+MAX_INTERNED_FRAMES = 16384
+
+# Array type code for the nanosecond offsets of samples. Python 2 has no
+# 64 bit array type, but the profiler does not run on it anyway.
+_OFFSET_TYPECODE = "q" if PY33 else "l"
+
 
 def has_profiling_enabled(options):
     # type: (Dict[str, Any]) -> bool
@@ -447,6 +457,84 @@ def get_current_thread_id(thread=None):
     return None
 
 
+class InternedStack(object):
+    """A stack whose frames have been extracted, shared between profiles."""
+
+    __slots__ = ("raw_frames", "frames")
+
+    def __init__(
+        self,
+        raw_frames,  # type: RawStack
+        frames,  # type: Tuple[ProcessedFrame, ...]
+    ):
+        # type: (...) -> None
+        self.raw_frames = raw_frames
+        self.frames = frames
+
+
+class StackInterner(object):
+    """
+    Process wide table of the stacks seen by the sampler, so that every stack
+    is only processed once no matter how many profiles are active.
+
+    The least recently sampled stacks and frames are evicted once there are
+    more than `max_stacks`/`max_frames` of them. Profiles hold on to the
+    `InternedStack` objects they sampled, so eviction only means that a stack
+    is processed again the next time it is sampled.
+    """
+
+    def __init__(
+        self,
+        max_stacks=MAX_INTERNED_STACKS,  # type: int
+        max_frames=MAX_INTERNED_FRAMES,  # type: int
+    ):
+        # type: (...) -> None
+        self.max_stacks = max_stacks
+        self.max_frames = max_frames
+        self.stacks = OrderedDict()  # type: OrderedDict[RawStackId, InternedStack]
+        self.frames = OrderedDict()  # type: OrderedDict[RawFrame, ProcessedFrame]
+
+    def intern(
+        self,
+        cwd,  # type: str
+        stack_id,  # type: RawStackId
+        raw_stack,  # type: RawStack
+        frames,  # type: Deque[FrameType]
+    ):
+        # type: (...) -> InternedStack
+        stacks = self.stacks
+        interned = stacks.get(stack_id)
+        if interned is not None:
+            stacks.move_to_end(stack_id)
+            return interned
+
+        processed_frames = self.frames
+        stack = []
+        for i, raw_frame in enumerate(raw_stack):
+            processed_frame = processed_frames.get(raw_frame)
+            if processed_frame is None:
+                processed_frame = extract_frame(frames[i], cwd)
+                processed_frames[raw_frame] = processed_frame
+                if len(processed_frames) > self.max_frames:
+                    processed_frames.popitem(last=False)
+            else:
+                processed_frames.move_to_end(raw_frame)
+            stack.append(processed_frame)
+
+        interned = stacks[stack_id] = InternedStack(raw_stack, tuple(stack))
+        if len(stacks) > self.max_stacks:
+            stacks.popitem(last=False)
+        return interned
+
+    def intern_sample(
+        self,
+        cwd,  # type: str
+        sample,  # type: RawSample
+    ):
+        # type: (...) -> InternedSample
+        return [(tid, self.intern(cwd, *data)) for tid, data in sample]
+
+
 class Profile(object):
     def __init__(
         self,
@@ -465,6 +553,10 @@ class Profile(object):
         # We cannot keep a reference to the transaction around here because it'll create
         # a reference cycle. So we opt to pull out just the necessary attributes.
         self.sampled = transaction.sampled  # type: Optional[bool]
+        if transaction._sampling_deferred:
+            # Most of these transactions are dropped, profiling them is too
+            # expensive.
+            self.sampled = False
 
         # Various framework integrations are capable of overwriting the active thread id.
         # If it is set to `None` at the end of the profile, we fall back to the default.
@@ -479,11 +571,15 @@ class Profile(object):
         self.stop_ns = 0  # type: int
         self.active = False  # type: bool
 
-        self.indexed_frames = {}  # type: Dict[RawFrame, int]
-        self.indexed_stacks = {}  # type: Dict[RawStackId, int]
-        self.frames = []  # type: List[ProcessedFrame]
-        self.stacks = []  # type: List[ProcessedStack]
-        self.samples = []  # type: List[ProcessedSample]
+        # Samples are stored column wise and only turned into dicts when the
+        # profile is processed. Stacks are interned by the scheduler and
+        # only indexed into frames and stacks for this profile when it is
+        # processed.
+        self.indexed_threads = {}  # type: Dict[ThreadId, int]
+        self.threads = []  # type: List[ThreadId]
+        self.sample_offsets = array(_OFFSET_TYPECODE)
+        self.sample_thread_ids = array("i")
+        self.sample_stacks = []  # type: List[InternedStack]
 
         self.unique_samples = 0
 
@@ -620,8 +716,8 @@ class Profile(object):
 
         scope.profile = old_profile
 
-    def write(self, cwd, ts, sample, frame_cache):
-        # type: (str, int, RawSample, Dict[RawFrame, ProcessedFrame]) -> None
+    def write(self, ts, sample):
+        # type: (int, InternedSample) -> None
         if not self.active:
             return
 
@@ -635,33 +731,19 @@ class Profile(object):
 
         self.unique_samples += 1
 
-        elapsed_since_start_ns = str(offset)
-
-        for tid, (stack_id, raw_stack, frames) in sample:
-            # Check if the stack is indexed first, this lets us skip
-            # indexing frames if it's not necessary
-            if stack_id not in self.indexed_stacks:
-                for i, raw_frame in enumerate(raw_stack):
-                    if raw_frame not in self.indexed_frames:
-                        self.indexed_frames[raw_frame] = len(self.indexed_frames)
-                        processed_frame = frame_cache.get(raw_frame)
-                        if processed_frame is None:
-                            processed_frame = extract_frame(frames[i], cwd)
-                            frame_cache[raw_frame] = processed_frame
-                        self.frames.append(processed_frame)
-
-                self.indexed_stacks[stack_id] = len(self.indexed_stacks)
-                self.stacks.append(
-                    [self.indexed_frames[raw_frame] for raw_frame in raw_stack]
-                )
+        append_offset = self.sample_offsets.append
+        append_thread_id = self.sample_thread_ids.append
+        append_stack = self.sample_stacks.append
 
-            self.samples.append(
-                {
-                    "elapsed_since_start_ns": elapsed_since_start_ns,
-                    "thread_id": tid,
-                    "stack_id": self.indexed_stacks[stack_id],
-                }
-            )
+        for tid, stack in sample:
+            thread_id = self.indexed_threads.get(tid)
+            if thread_id is None:
+                thread_id = self.indexed_threads[tid] = len(self.threads)
+                self.threads.append(tid)
+
+            append_offset(offset)
+            append_thread_id(thread_id)
+            append_stack(stack)
 
     def process(self):
         # type: () -> ProcessedProfile
@@ -676,10 +758,39 @@ class Profile(object):
             for thread in threading.enumerate()
         }  # type: Dict[str, ProcessedThreadMetadata]
 
+        indexed_frames = {}  # type: Dict[RawFrame, int]
+        indexed_stacks = {}  # type: Dict[InternedStack, int]
+        frames = []  # type: List[ProcessedFrame]
+        stacks = []  # type: List[ProcessedStack]
+
+        for stack in self.sample_stacks:
+            if stack in indexed_stacks:
+                continue
+            indexed_stacks[stack] = len(stacks)
+            for raw_frame, frame in zip(stack.raw_frames, stack.frames):
+                if raw_frame not in indexed_frames:
+                    indexed_frames[raw_frame] = len(frames)
+                    # Frames are shared between profiles, copy them as
+                    # they are modified when the profile is sent.
+                    frames.append(dict(frame))  # type: ignore
+            stacks.append([indexed_frames[raw_frame] for raw_frame in stack.raw_frames])
+
+        threads = self.threads
+        samples = [
+            {
+                "elapsed_since_start_ns": str(offset),
+                "thread_id": threads[thread_id],
+                "stack_id": indexed_stacks[stack],
+            }
+            for offset, thread_id, stack in zip(
+                self.sample_offsets, self.sample_thread_ids, self.sample_stacks
+            )
+        ]  # type: List[ProcessedSample]
+
         return {
-            "frames": self.frames,
-            "stacks": self.stacks,
-            "samples": self.samples,
+            "frames": frames,
+            "stacks": stacks,
+            "samples": samples,
             "thread_metadata": thread_metadata,
         }
 
@@ -759,6 +870,8 @@ class Scheduler(object):
         self.new_profiles = deque(maxlen=128)  # type: Deque[Profile]
         self.active_profiles = set()  # type: Set[Profile]
 
+        self.stack_interner = StackInterner()
+
     def __enter__(self):
         # type: () -> Scheduler
         self.setup()
@@ -834,7 +947,10 @@ class Scheduler(object):
             # the most recent stack for better cache hits
             last_sample[0] = raw_sample
 
-            sample = [(str(tid), data) for tid, data in raw_sample.items()]
+            # Stacks are processed once here for all active profiles.
+            sample = self.stack_interner.intern_sample(
+                cwd, [(str(tid), data) for tid, data in raw_sample.items()]
+            )
 
             # Move the new profiles into the active_profiles set.
             #
@@ -851,11 +967,9 @@ class Scheduler(object):
 
             inactive_profiles = []
 
-            frame_cache = {}  # type: Dict[RawFrame, ProcessedFrame]
-
             for profile in self.active_profiles:
                 if profile.active:
-                    profile.write(cwd, now, sample, frame_cache)
+                    profile.write(now, sample)
                 else:
                     # If a thread is marked inactive, we buffer it
                     # to `inactive_profiles` so it can be removed.
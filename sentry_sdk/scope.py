@@ -1,9 +1,9 @@
 from copy import copy
-from collections import deque
 from itertools import chain
 
 from sentry_sdk._functools import wraps
 from sentry_sdk._types import TYPE_CHECKING
+from sentry_sdk.consts import DEFAULT_MAX_BREADCRUMBS
 from sentry_sdk.utils import logger, capture_internal_exceptions
 from sentry_sdk.tracing import Transaction
 from sentry_sdk.attachments import Attachment
@@ -11,9 +11,11 @@ from sentry_sdk.attachments import Attachment
 if TYPE_CHECKING:
     from typing import Any
     from typing import Dict
+    from typing import FrozenSet
     from typing import Optional
-    from typing import Deque
+    from typing import Iterator
     from typing import List
+    from typing import Tuple
     from typing import Callable
     from typing import TypeVar
 
@@ -34,15 +36,163 @@ if TYPE_CHECKING:
     F = TypeVar("F", bound=Callable[..., Any])
     T = TypeVar("T")
 
+    BreadcrumbFactory = Callable[[Any, float], Optional[Breadcrumb]]
+
 
 global_event_processors = []  # type: List[EventProcessor]
 
+# Containers of a scope that are shared with its copies until either side
+# mutates them, see `Scope._mutable`.
+_COPY_ON_WRITE = frozenset(
+    (
+        "_transaction_info",
+        "_tags",
+        "_contexts",
+        "_extras",
+        "_breadcrumbs",
+        "_event_processors",
+        "_error_processors",
+        "_attachments",
+    )
+)
+
 
 def add_global_event_processor(processor):
     # type: (EventProcessor) -> None
     global_event_processors.append(processor)
 
 
+class BreadcrumbBuffer(object):
+    """
+    Ring buffer of the most recent breadcrumbs of a scope.
+
+    Breadcrumbs can be added lazily as a factory together with its raw
+    payload and timestamp, in which case the breadcrumb dict is only built
+    when the buffer is iterated, e.g. when the breadcrumbs are attached to
+    an event. Most breadcrumbs are evicted before that ever happens.
+    """
+
+    __slots__ = ("_crumbs", "_factories", "_timestamps", "_start", "_len")
+
+    def __init__(self, maxlen=DEFAULT_MAX_BREADCRUMBS):
+        # type: (int) -> None
+        self._crumbs = [None] * maxlen  # type: List[Any]
+        self._factories = [None] * maxlen  # type: List[Optional[BreadcrumbFactory]]
+        self._timestamps = [0.0] * maxlen  # type: List[float]
+        self._start = 0
+        self._len = 0
+
+    @property
+    def maxlen(self):
+        # type: () -> int
+        return len(self._crumbs)
+
+    def __len__(self):
+        # type: () -> int
+        return self._len
+
+    def _entries(self):
+        # type: () -> Iterator[Tuple[Any, Optional[BreadcrumbFactory], float]]
+        crumbs, factories, timestamps = self._crumbs, self._factories, self._timestamps
+        maxlen = len(crumbs)
+        for n in range(self._len):
+            i = (self._start + n) % maxlen
+            yield crumbs[i], factories[i], timestamps[i]
+
+    def _resize(self, maxlen):
+        # type: (int) -> None
+        entries = list(self._entries())[-maxlen:] if maxlen else []
+        self.__init__(maxlen)  # type: ignore
+        for entry in entries:
+            self._push(*entry)
+
+    def _push(
+        self,
+        crumb,  # type: Any
+        factory,  # type: Optional[BreadcrumbFactory]
+        timestamp,  # type: float
+        maxlen=None,  # type: Optional[int]
+    ):
+        # type: (...) -> None
+        if maxlen is not None and maxlen != len(self._crumbs):
+            self._resize(maxlen)
+
+        capacity = len(self._crumbs)
+        if not capacity:
+            return
+
+        i = (self._start + self._len) % capacity
+        self._crumbs[i] = crumb
+        self._factories[i] = factory
+        self._timestamps[i] = timestamp
+        if self._len < capacity:
+            self._len += 1
+        else:
+            self._start = (self._start + 1) % capacity
+
+    def append(
+        self,
+        crumb,  # type: Breadcrumb
+        maxlen=None,  # type: Optional[int]
+    ):
+        # type: (...) -> None
+        """Adds a breadcrumb, dropping the oldest one if the buffer is full."""
+        self._push(crumb, None, 0.0, maxlen)
+
+    def append_lazy(
+        self,
+        factory,  # type: BreadcrumbFactory
+        payload,  # type: Any
+        timestamp,  # type: float
+        maxlen=None,  # type: Optional[int]
+    ):
+        # type: (...) -> None
+        """
+        Adds a breadcrumb that is built by calling `factory` with `payload`
+        and `timestamp` once it is needed.
+        """
+        self._push(payload, factory, timestamp, maxlen)
+
+    def extend(self, other):
+        # type: (BreadcrumbBuffer) -> None
+        for entry in other._entries():
+            self._push(*entry)
+
+    def clear(self):
+        # type: () -> None
+        self.__init__(len(self._crumbs))  # type: ignore
+
+    def __iter__(self):
+        # type: () -> Iterator[Breadcrumb]
+        # Built breadcrumbs are not stored back, as the entries may be shared
+        # with copies of the buffer that are iterated by other threads.
+        for crumb, factory, timestamp in list(self._entries()):
+            if factory is not None:
+                payload, crumb = crumb, None
+                with capture_internal_exceptions():
+                    crumb = factory(payload, timestamp)
+            if crumb is not None:
+                yield crumb
+
+    def __copy__(self):
+        # type: () -> BreadcrumbBuffer
+        rv = object.__new__(self.__class__)  # type: BreadcrumbBuffer
+        rv._crumbs = list(self._crumbs)
+        rv._factories = list(self._factories)
+        rv._timestamps = list(self._timestamps)
+        rv._start = self._start
+        rv._len = self._len
+        return rv
+
+    def __repr__(self):
+        # type: () -> str
+        return "<%s len=%s maxlen=%s>" % (
+            self.__class__.__name__,
+            self._len,
+            self.maxlen,
+        )
+
+
 def _attr_setter(fn):
     # type: (Any) -> Any
     return property(fset=fn, doc=fn.__doc__)
@@ -96,10 +246,12 @@ class Scope(object):
         "_attachments",
         "_force_auto_session_tracking",
         "_profile",
+        "_shared",
     )
 
     def __init__(self):
         # type: () -> None
+        self._shared = frozenset()  # type: FrozenSet[str]
         self._event_processors = []  # type: List[EventProcessor]
         self._error_processors = []  # type: List[ErrorProcessor]
 
@@ -119,6 +271,9 @@ class Scope(object):
         self._contexts = {}  # type: Dict[str, Dict[str, Any]]
         self._extras = {}  # type: Dict[str, Any]
         self._attachments = []  # type: List[Attachment]
+        self._shared = self._shared & frozenset(
+            ("_event_processors", "_error_processors")
+        )
 
         self.clear_breadcrumbs()
         self._should_capture = True
@@ -129,6 +284,19 @@ class Scope(object):
 
         self._profile = None  # type: Optional[Profile]
 
+    def _mutable(self, name):
+        # type: (str) -> Any
+        """
+        Returns the container stored in the attribute `name`, copying it
+        first if it is still shared with another scope.
+        """
+        value = getattr(self, name)
+        if name in self._shared:
+            value = copy(value)
+            setattr(self, name, value)
+            self._shared = self._shared - frozenset((name,))
+        return value
+
     @_attr_setter
     def level(self, value):
         # type: (Optional[str]) -> None
@@ -200,7 +368,7 @@ class Scope(object):
                 self._span.containing_transaction.source = source
 
         if source:
-            self._transaction_info["source"] = source
+            self._mutable("_transaction_info")["source"] = source
 
     @_attr_setter
     def user(self, value):
@@ -250,14 +418,14 @@ class Scope(object):
     ):
         # type: (...) -> None
         """Sets a tag for a key to a specific value."""
-        self._tags[key] = value
+        self._mutable("_tags")[key] = value
 
     def remove_tag(
         self, key  # type: str
     ):
         # type: (...) -> None
         """Removes a specific tag."""
-        self._tags.pop(key, None)
+        self._mutable("_tags").pop(key, None)
 
     def set_context(
         self,
@@ -266,14 +434,14 @@ class Scope(object):
     ):
         # type: (...) -> None
         """Binds a context at a certain key to a specific value."""
-        self._contexts[key] = value
+        self._mutable("_contexts")[key] = value
 
     def remove_context(
         self, key  # type: str
     ):
         # type: (...) -> None
         """Removes a context."""
-        self._contexts.pop(key, None)
+        self._mutable("_contexts").pop(key, None)
 
     def set_extra(
         self,
@@ -282,19 +450,20 @@ class Scope(object):
     ):
         # type: (...) -> None
         """Sets an extra key to a specific value."""
-        self._extras[key] = value
+        self._mutable("_extras")[key] = value
 
     def remove_extra(
         self, key  # type: str
     ):
         # type: (...) -> None
         """Removes a specific extra key."""
-        self._extras.pop(key, None)
+        self._mutable("_extras").pop(key, None)
 
     def clear_breadcrumbs(self):
         # type: () -> None
         """Clears breadcrumb buffer."""
-        self._breadcrumbs = deque()  # type: Deque[Breadcrumb]
+        self._breadcrumbs = BreadcrumbBuffer()  # type: BreadcrumbBuffer
+        self._shared = self._shared - frozenset(("_breadcrumbs",))
 
     def add_attachment(
         self,
@@ -306,7 +475,7 @@ class Scope(object):
     ):
         # type: (...) -> None
         """Adds an attachment to future events sent."""
-        self._attachments.append(
+        self._mutable("_attachments").append(
             Attachment(
                 bytes=bytes,
                 path=path,
@@ -324,14 +493,15 @@ class Scope(object):
 
         :param func: This function behaves like `before_send.`
         """
-        if len(self._event_processors) > 20:
+        event_processors = self._mutable("_event_processors")
+        if len(event_processors) > 20:
             logger.warning(
                 "Too many event processors on scope! Clearing list to free up some memory: %r",
-                self._event_processors,
+                event_processors,
             )
-            del self._event_processors[:]
+            del event_processors[:]
 
-        self._event_processors.append(func)
+        event_processors.append(func)
 
     def add_error_processor(
         self,
@@ -359,7 +529,7 @@ class Scope(object):
                     return real_func(event, exc_info)
                 return event
 
-        self._error_processors.append(func)
+        self._mutable("_error_processors").append(func)
 
     @_disable_capture
     def apply_to_event(
@@ -447,21 +617,21 @@ class Scope(object):
         if scope._transaction is not None:
             self._transaction = scope._transaction
         if scope._transaction_info is not None:
-            self._transaction_info.update(scope._transaction_info)
+            self._mutable("_transaction_info").update(scope._transaction_info)
         if scope._user is not None:
             self._user = scope._user
         if scope._tags:
-            self._tags.update(scope._tags)
+            self._mutable("_tags").update(scope._tags)
         if scope._contexts:
-            self._contexts.update(scope._contexts)
+            self._mutable("_contexts").update(scope._contexts)
         if scope._extras:
-            self._extras.update(scope._extras)
+            self._mutable("_extras").update(scope._extras)
         if scope._breadcrumbs:
-            self._breadcrumbs.extend(scope._breadcrumbs)
+            self._mutable("_breadcrumbs").extend(scope._breadcrumbs)
         if scope._span:
             self._span = scope._span
         if scope._attachments:
-            self._attachments.extend(scope._attachments)
+            self._mutable("_attachments").extend(scope._attachments)
         if scope._profile:
             self._profile = scope._profile
 
@@ -480,11 +650,11 @@ class Scope(object):
         if user is not None:
             self._user = user
         if extras is not None:
-            self._extras.update(extras)
+            self._mutable("_extras").update(extras)
         if contexts is not None:
-            self._contexts.update(contexts)
+            self._mutable("_contexts").update(contexts)
         if tags is not None:
-            self._tags.update(tags)
+            self._mutable("_tags").update(tags)
         if fingerprint is not None:
             self._fingerprint = fingerprint
 
@@ -496,22 +666,24 @@ class Scope(object):
         rv._name = self._name
         rv._fingerprint = self._fingerprint
         rv._transaction = self._transaction
-        rv._transaction_info = dict(self._transaction_info)
         rv._user = self._user
 
-        rv._tags = dict(self._tags)
-        rv._contexts = dict(self._contexts)
-        rv._extras = dict(self._extras)
-
-        rv._breadcrumbs = copy(self._breadcrumbs)
-        rv._event_processors = list(self._event_processors)
-        rv._error_processors = list(self._error_processors)
+        # Containers are shared until the first mutation on either scope,
+        # which makes pushing a scope O(1).
+        rv._transaction_info = self._transaction_info
+        rv._tags = self._tags
+        rv._contexts = self._contexts
+        rv._extras = self._extras
+        rv._breadcrumbs = self._breadcrumbs
+        rv._event_processors = self._event_processors
+        rv._error_processors = self._error_processors
+        rv._attachments = self._attachments
+        rv._shared = self._shared = _COPY_ON_WRITE
 
         rv._should_capture = self._should_capture
         rv._span = self._span
         rv._session = self._session
         rv._force_auto_session_tracking = self._force_auto_session_tracking
-        rv._attachments = list(self._attachments)
 
         rv._profile = self._profile
 
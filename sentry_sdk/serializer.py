@@ -33,7 +33,7 @@ if TYPE_CHECKING:
     from typing import Type
     from typing import Union
 
-    from sentry_sdk._types import NotImplementedType, Event
+    from sentry_sdk._types import NotImplementedType, Event, SentryEvent
 
     Span = Dict[str, Any]
 
@@ -70,6 +70,7 @@ MAX_EVENT_BYTES = 10**6
 MAX_DATABAG_DEPTH = 5
 MAX_DATABAG_BREADTH = 10
 CYCLE_MARKER = "<cyclic>"
+FAILED_TO_SERIALIZE = "<failed to serialize, use init(debug=True) to see error logs>"
 
 
 global_repr_processors = []  # type: List[ReprProcessor]
@@ -226,7 +227,7 @@ def serialize(event, **kwargs):
             capture_internal_exception(sys.exc_info())
 
             if is_databag:
-                return "<failed to serialize, use init(debug=True) to see error logs>"
+                return FAILED_TO_SERIALIZE
 
             return None
         finally:
@@ -376,3 +377,393 @@ def serialize(event, **kwargs):
         return serialized_event
     finally:
         disable_capture_event.set(False)
+
+
+class _PathSchemaNode(object):
+    """
+    One node of the precompiled path schema used by `serialize_iterative`.
+
+    The schema encodes the same rules as `_should_repr_strings` and
+    `_is_databag` in `serialize`, but is walked one segment at a time while
+    descending into the event instead of being re-evaluated against the full
+    path at every node. Any path that is not part of the schema resolves to
+    `False` for both modes.
+    """
+
+    __slots__ = (
+        "children",
+        "wildcard",
+        "should_repr_strings",
+        "is_databag",
+        "keep_raw_strings",
+    )
+
+    def __init__(self):
+        # type: () -> None
+        self.children = {}  # type: Dict[Segment, _PathSchemaNode]
+        self.wildcard = None  # type: Optional[_PathSchemaNode]
+        self.should_repr_strings = False  # type: Optional[bool]
+        self.is_databag = False  # type: Optional[bool]
+        self.keep_raw_strings = False
+
+    def child(self, segment):
+        # type: (Segment) -> Optional[_PathSchemaNode]
+        rv = self.children.get(segment)
+        if rv is None:
+            rv = self.wildcard
+        return rv
+
+
+def _compile_path_schema(repr_paths, databag_paths, raw_string_paths):
+    # type: (List[List[Optional[str]]], List[List[Optional[str]]], List[List[Optional[str]]]) -> _PathSchemaNode
+    """
+    Build the path schema tree. In the given paths `None` matches any segment.
+    """
+    root = _PathSchemaNode()
+    nodes = [root]
+
+    def _insert(path):
+        # type: (List[Optional[str]]) -> List[_PathSchemaNode]
+        node = root
+        rv = [root]
+        for segment in path:
+            if segment is None:
+                if node.wildcard is None:
+                    node.wildcard = _PathSchemaNode()
+                    nodes.append(node.wildcard)
+                node = node.wildcard
+            else:
+                if segment not in node.children:
+                    node.children[segment] = _PathSchemaNode()
+                    nodes.append(node.children[segment])
+                node = node.children[segment]
+            rv.append(node)
+        return rv
+
+    # Prefixes of a path resolve to `None` ("maybe soon"), the full path
+    # resolves to `True`.
+    for path in repr_paths:
+        prefix = _insert(path)
+        for node in prefix[:-1]:
+            if node.should_repr_strings is False:
+                node.should_repr_strings = None
+        prefix[-1].should_repr_strings = True
+
+    for path in databag_paths:
+        prefix = _insert(path)
+        for node in prefix[:-1]:
+            if node.is_databag is False:
+                node.is_databag = None
+        prefix[-1].is_databag = True
+
+    for path in raw_string_paths:
+        _insert(path)[-1].keep_raw_strings = True
+
+    # `_is_databag` defers to `_should_repr_strings` whenever that one is not
+    # `False`.
+    for node in nodes:
+        if node.should_repr_strings is not False:
+            node.is_databag = node.should_repr_strings
+
+    return root
+
+
+_PATH_SCHEMA = _compile_path_schema(
+    repr_paths=[
+        ["stacktrace", "frames", None, "vars"],
+        ["threads", "values", None, "stacktrace", "frames", None, "vars"],
+        ["exception", "values", None, "stacktrace", "frames", None, "vars"],
+    ],
+    databag_paths=[
+        ["request", "data"],
+        ["breadcrumbs", "values", None],
+        ["extra"],
+    ],
+    raw_string_paths=[
+        ["spans", None, "description"],
+    ],
+)
+
+
+class _MetaNode(object):
+    """
+    Lazily created entry of the `_meta` tree, pointing to the entry of the
+    parent node. Only nodes that actually get annotated (and their
+    ancestors) ever materialize a dictionary.
+    """
+
+    __slots__ = ("parent", "segment", "meta")
+
+    def __init__(self, parent, segment):
+        # type: (Optional[_MetaNode], Optional[Segment]) -> None
+        self.parent = parent
+        self.segment = segment
+        self.meta = None  # type: Optional[Dict[str, Any]]
+
+    def get(self):
+        # type: () -> Dict[str, Any]
+        if self.meta is None:
+            if self.parent is None:
+                self.meta = {}
+            else:
+                self.meta = self.parent.get().setdefault(text_type(self.segment), {})
+        return self.meta
+
+    def annotate(self, **meta):
+        # type: (**Any) -> None
+        self.get().setdefault("", {}).update(meta)
+
+
+# Marks the end of a container on the work stack of `serialize_iterative`.
+_EXIT_NODE = object()
+
+
+def serialize_iterative(
+    event,  # type: SentryEvent
+    is_databag=None,  # type: Optional[bool]
+    should_repr_strings=None,  # type: Optional[bool]
+    segment=None,  # type: Optional[Segment]
+    remaining_breadth=None,  # type: Optional[int]
+    remaining_depth=None,  # type: Optional[int]
+):
+    # type: (...) -> Event
+    """
+    Alternative implementation of `serialize` producing the same output
+    (including `_meta` annotations).
+
+    Instead of recursing, the event is walked with an explicit work stack.
+    Whether a subtree is a databag or should have its strings repr'd is read
+    from a precompiled path schema once per node instead of being derived
+    from the full path, and cycles are detected with a plain dictionary of the
+    containers currently being serialized.
+
+    Enabled with the `iterative_serializer` experiment.
+    """
+    memo = Memo()
+    active = memo._ids
+    meta_root = _MetaNode(None, None)
+    rv = [None]  # type: List[Any]
+
+    schema = _PATH_SCHEMA  # type: Optional[_PathSchemaNode]
+    if segment is not None:
+        schema = _PATH_SCHEMA.child(segment)
+
+    # Each work item is a tuple of (obj, parent meta node, segment, result
+    # container, key in result container, schema node, is_databag,
+    # should_repr_strings, remaining_depth, remaining_breadth).
+    stack = [
+        (
+            event,
+            meta_root,
+            segment,
+            rv,
+            0,
+            schema,
+            is_databag,
+            should_repr_strings,
+            remaining_depth,
+            remaining_breadth,
+        )
+    ]  # type: List[Any]
+
+    disable_capture_event.set(True)
+    try:
+        while stack:
+            item = stack.pop()
+            obj = item[0]
+            if obj is _EXIT_NODE:
+                active.pop(item[1], None)
+                continue
+
+            (
+                obj,
+                parent_meta,
+                segment,
+                container,
+                key,
+                schema,
+                is_databag,
+                should_repr_strings,
+                remaining_depth,
+                remaining_breadth,
+            ) = item
+
+            obj_id = id(obj)
+            if obj_id in active:
+                container[key] = CYCLE_MARKER
+                continue
+
+            # The root node shares the meta node of the event itself.
+            if segment is None:
+                meta = parent_meta
+            else:
+                meta = _MetaNode(parent_meta, segment)
+
+            try:
+                if isinstance(obj, AnnotatedValue):
+                    node_should_repr_strings = False  # type: Optional[bool]
+                    meta.annotate(**obj.metadata)
+                    original_obj = obj
+                    obj = obj.value
+                else:
+                    node_should_repr_strings = should_repr_strings
+                    original_obj = obj
+
+                if node_should_repr_strings is None:
+                    node_should_repr_strings = (
+                        schema.should_repr_strings if schema is not None else False
+                    )
+
+                node_is_databag = is_databag
+                if node_is_databag is None:
+                    node_is_databag = schema.is_databag if schema is not None else False
+
+                if node_is_databag:
+                    if remaining_depth is None:
+                        remaining_depth = MAX_DATABAG_DEPTH
+                    if remaining_breadth is None:
+                        remaining_breadth = MAX_DATABAG_BREADTH
+
+                if remaining_depth is not None and remaining_depth <= 0:
+                    meta.annotate(rem=[["!limit", "x"]])
+                    if node_is_databag:
+                        value = strip_string(safe_repr(obj))
+                        if isinstance(value, AnnotatedValue):
+                            meta.annotate(**value.metadata)
+                            value = value.value
+                        container[key] = value
+                    else:
+                        container[key] = None
+                    continue
+
+                if node_is_databag and global_repr_processors:
+                    hints = {"memo": memo, "remaining_depth": remaining_depth}
+                    for processor in global_repr_processors:
+                        result = processor(obj, hints)
+                        if result is not NotImplemented:
+                            break
+                    else:
+                        result = NotImplemented
+
+                    if result is not NotImplemented:
+                        if isinstance(result, AnnotatedValue):
+                            meta.annotate(**result.metadata)
+                            result = result.value
+                        container[key] = result
+                        continue
+
+                sentry_repr = getattr(type(obj), "__sentry_repr__", None)
+
+                if obj is None or isinstance(obj, (bool, number_types)):
+                    if node_should_repr_strings or (
+                        isinstance(obj, float) and (math.isinf(obj) or math.isnan(obj))
+                    ):
+                        container[key] = safe_repr(obj)
+                    else:
+                        container[key] = obj
+                    continue
+
+                elif callable(sentry_repr):
+                    container[key] = sentry_repr(obj)
+                    continue
+
+                elif isinstance(obj, datetime):
+                    container[key] = (
+                        text_type(format_timestamp(obj))
+                        if not node_should_repr_strings
+                        else safe_repr(obj)
+                    )
+                    continue
+
+                elif isinstance(obj, Mapping):
+                    # Create temporary copy here to avoid calling too much code
+                    # that might mutate our dictionary while we're still
+                    # iterating over it.
+                    obj = dict(iteritems(obj))
+
+                    rv_dict = {}  # type: Dict[str, Any]
+                    children = []  # type: List[Any]
+                    for i, (k, v) in enumerate(iteritems(obj)):
+                        if remaining_breadth is not None and i >= remaining_breadth:
+                            meta.annotate(len=len(obj))
+                            break
+
+                        str_k = text_type(k)
+                        # Reserve the slot to keep the key order.
+                        rv_dict[str_k] = None
+                        children.append((str_k, str_k, v))
+
+                    result_container = rv_dict  # type: Any
+
+                elif not isinstance(obj, serializable_str_types) and isinstance(
+                    obj, (Set, Sequence)
+                ):
+                    children = []
+                    for i, v in enumerate(obj):
+                        if remaining_breadth is not None and i >= remaining_breadth:
+                            meta.annotate(len=len(obj))
+                            break
+
+                        children.append((i, i, v))
+
+                    result_container = [None] * len(children)
+
+                else:
+                    if node_should_repr_strings:
+                        obj = safe_repr(obj)
+                    else:
+                        if isinstance(obj, bytes) or isinstance(obj, bytearray):
+                            obj = obj.decode("utf-8", "replace")
+
+                        if not isinstance(obj, string_types):
+                            obj = safe_repr(obj)
+
+                    if schema is not None and schema.keep_raw_strings:
+                        container[key] = obj
+                        continue
+
+                    value = strip_string(obj)
+                    if isinstance(value, AnnotatedValue):
+                        meta.annotate(**value.metadata)
+                        value = value.value
+                    container[key] = value
+                    continue
+
+            except BaseException:
+                capture_internal_exception(sys.exc_info())
+                container[key] = FAILED_TO_SERIALIZE if is_databag else None
+                continue
+
+            container[key] = result_container
+            if not children:
+                continue
+
+            child_depth = remaining_depth - 1 if remaining_depth is not None else None
+
+            # Children are pushed in reverse so that they are serialized in
+            # their original order, after which the container is left again.
+            active[obj_id] = original_obj
+            stack.append((_EXIT_NODE, obj_id))
+            for child_segment, child_key, child in reversed(children):
+                stack.append(
+                    (
+                        child,
+                        meta,
+                        child_segment,
+                        result_container,
+                        child_key,
+                        schema.child(child_segment) if schema is not None else None,
+                        node_is_databag,
+                        node_should_repr_strings,
+                        child_depth,
+                        remaining_breadth,
+                    )
+                )
+
+        serialized_event = rv[0]
+        if meta_root.meta and isinstance(serialized_event, dict):
+            serialized_event["_meta"] = meta_root.meta
+
+        return serialized_event
+    finally:
+        disable_capture_event.set(False)
@@ -4,20 +4,26 @@ from threading import Thread, Lock
 from contextlib import contextmanager
 
 import sentry_sdk
+from sentry_sdk._compat import get_ident, iteritems
 from sentry_sdk.envelope import Envelope
 from sentry_sdk.session import Session
 from sentry_sdk._types import TYPE_CHECKING
-from sentry_sdk.utils import format_timestamp
+from sentry_sdk.utils import capture_internal_exceptions, format_timestamp
 
 if TYPE_CHECKING:
+    from datetime import datetime
     from typing import Any
     from typing import Callable
     from typing import Dict
     from typing import Generator
+    from typing import Iterable
     from typing import List
     from typing import Optional
+    from typing import Tuple
     from typing import Union
 
+    from sentry_sdk.local_aggregation import LocalAggregator
+
 
 def is_auto_session_tracking_enabled(hub=None):
     # type: (Optional[sentry_sdk.Hub]) -> Union[Any, bool, None]
@@ -53,37 +59,130 @@ def auto_session_tracking(hub=None, session_mode="application"):
 TERMINAL_SESSION_STATES = ("exited", "abnormal", "crashed")
 MAX_ENVELOPE_ITEMS = 100
 
+# The states request mode sessions are counted by, in order of precedence
+AGGREGATE_STATES = ("crashed", "abnormal", "errored", "exited")
+
 
 def make_aggregate_envelope(aggregate_states, attrs):
     # type: (Any, Any) -> Any
     return {"attrs": dict(attrs), "aggregates": list(aggregate_states.values())}
 
 
+class _AggregateShard(object):
+    """
+    Counts of the request mode sessions ended by one thread, per release,
+    environment and start minute, with one count per `AGGREGATE_STATES`.
+    """
+
+    __slots__ = ("lock", "counts", "retired")
+
+    def __init__(self):
+        # type: () -> None
+        # Only contended while the shard is being flushed
+        self.lock = Lock()
+        self.counts = {}  # type: Dict[Tuple[Any, Any, datetime], List[int]]
+        self.retired = False
+
+
+def _merge_state(states, new_state, counts):
+    # type: (Dict[str, Dict[str, Any]], Dict[str, Any], Iterable[Tuple[str, int]]) -> None
+    state = states.setdefault(new_state["started"], new_state)
+    for name, count in counts:
+        if count:
+            state[name] = state.get(name, 0) + count
+
+
 class SessionFlusher(object):
     def __init__(
         self,
         capture_func,  # type: Callable[[Envelope], None]
         flush_interval=60,  # type: int
+        aggregator=None,  # type: Optional[LocalAggregator]
     ):
         # type: (...) -> None
         self.capture_func = capture_func
         self.flush_interval = flush_interval
+        self.aggregator = aggregator
         self.pending_sessions = []  # type: List[Any]
-        self.pending_aggregates = {}  # type: Dict[Any, Any]
+        self._shards = {}  # type: Dict[int, _AggregateShard]
         self._thread = None  # type: Optional[Thread]
         self._thread_lock = Lock()
         self._aggregate_lock = Lock()
         self._thread_for_pid = None  # type: Optional[int]
         self._running = True
 
+    def _collect_aggregates(self):
+        # type: (...) -> Dict[Any, Dict[str, Dict[str, Any]]]
+        """
+        Takes the counts of all threads and merges them into aggregates per
+        attributes and start minute. Shards of threads that didn't end any
+        sessions since the last flush are dropped.
+        """
+        pending_aggregates = {}  # type: Dict[Any, Dict[str, Dict[str, Any]]]
+
+        with self._aggregate_lock:
+            for ident, shard in list(self._shards.items()):
+                with shard.lock:
+                    counts, shard.counts = shard.counts, {}
+                    if not counts:
+                        shard.retired = True
+                        del self._shards[ident]
+
+                for (release, environment, started), shard_counts in iteritems(counts):
+                    attrs = {}
+                    if release is not None:
+                        attrs["release"] = release
+                    if environment is not None:
+                        attrs["environment"] = environment
+                    states = pending_aggregates.setdefault(
+                        tuple(sorted(attrs.items())), {}
+                    )
+                    _merge_state(
+                        states,
+                        {"started": format_timestamp(started)},
+                        zip(AGGREGATE_STATES, shard_counts),
+                    )
+
+        return pending_aggregates
+
+    def _exchange_aggregates(self, pending_aggregates):
+        # type: (Dict[Any, Dict[str, Dict[str, Any]]]) -> Dict[Any, Dict[str, Dict[str, Any]]]
+        """
+        Publishes the aggregates to the local collector, or merges what was
+        published to it if this process is the collector.
+        """
+        aggregator = self.aggregator
+        if aggregator is None:
+            return pending_aggregates
+
+        published = [
+            [attrs, list(states.values())]
+            for attrs, states in pending_aggregates.items()
+        ]
+        if published and aggregator.publish_sessions(published):
+            return {}
+
+        for attrs, states in aggregator.take_sessions():
+            merged_states = pending_aggregates.setdefault(
+                tuple(tuple(item) for item in attrs), {}
+            )
+            for state in states:
+                _merge_state(
+                    merged_states,
+                    {"started": state["started"]},
+                    ((name, state.get(name, 0)) for name in AGGREGATE_STATES),
+                )
+
+        return pending_aggregates
+
     def flush(self):
         # type: (...) -> None
         pending_sessions = self.pending_sessions
         self.pending_sessions = []
 
-        with self._aggregate_lock:
-            pending_aggregates = self.pending_aggregates
-            self.pending_aggregates = {}
+        pending_aggregates = self._collect_aggregates()
+        with capture_internal_exceptions():
+            pending_aggregates = self._exchange_aggregates(pending_aggregates)
 
         envelope = Envelope()
         for session in pending_sessions:
@@ -134,27 +233,37 @@ class SessionFlusher(object):
         # in practice we expect the python SDK to have an extremely high cardinality
         # here, effectively making aggregation useless, therefore we do not
         # aggregate per-did.
+        if session.status == "crashed":
+            index = 0
+        elif session.status == "abnormal":
+            index = 1
+        elif session.errors > 0:
+            index = 2
+        else:
+            index = 3
 
-        # For this part we can get away with using the global interpreter lock
-        with self._aggregate_lock:
-            attrs = session.get_json_attrs(with_user_info=False)
-            primary_key = tuple(sorted(attrs.items()))
-            secondary_key = session.truncated_started  # (, session.did)
-            states = self.pending_aggregates.setdefault(primary_key, {})
-            state = states.setdefault(secondary_key, {})
-
-            if "started" not in state:
-                state["started"] = format_timestamp(session.truncated_started)
-            # if session.did is not None:
-            #     state["did"] = session.did
-            if session.status == "crashed":
-                state["crashed"] = state.get("crashed", 0) + 1
-            elif session.status == "abnormal":
-                state["abnormal"] = state.get("abnormal", 0) + 1
-            elif session.errors > 0:
-                state["errored"] = state.get("errored", 0) + 1
-            else:
-                state["exited"] = state.get("exited", 0) + 1
+        # Only the attributes without user info end up in aggregates
+        key = (session.release, session.environment, session.truncated_started)
+
+        # Every thread counts into its own shard, so that threads don't wait
+        # for each other. The shards are merged when flushing.
+        ident = get_ident()
+        while True:
+            shard = self._shards.get(ident)
+            if shard is None:
+                with self._aggregate_lock:
+                    shard = self._shards.setdefault(ident, _AggregateShard())
+
+            with shard.lock:
+                # The shard was dropped by a flush in the meantime
+                if shard.retired:
+                    continue
+
+                counts = shard.counts.get(key)
+                if counts is None:
+                    counts = shard.counts[key] = [0] * len(AGGREGATE_STATES)
+                counts[index] += 1
+                return
 
     def add_session(
         self, session  # type: Session
@@ -0,0 +1,268 @@
+import os
+import struct
+import threading
+import zlib
+
+from sentry_sdk.utils import logger
+
+from sentry_sdk._types import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+
+DEFAULT_SPOOL_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+
+# Every record is prefixed with the length of its payload and a crc32 of it,
+# so that records torn by a crash can be detected and skipped.
+_RECORD_HEADER = struct.Struct(">II")
+_SEGMENT_SUFFIX = ".seg"
+_CURSOR_FILE = "cursor"
+_LOCK_FILE = "lock"
+
+
+class SpoolLocked(Exception):
+    """Raised when the spool directory is in use by another process."""
+
+
+def _replace(src, dst):
+    # type: (str, str) -> None
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # Python 2
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+class EnvelopeSpool(object):
+    """
+    Append-only log of serialized envelopes on local disk.
+
+    Records are appended to numbered segment files and read back in order.
+    The position of the reader is persisted in a cursor file after every
+    committed record, so that records which have not been committed yet are
+    replayed when a new spool is opened on the same directory, e.g. after
+    the process was restarted. Fully consumed segments are deleted.
+
+    Data is flushed to the operating system but not fsync'ed, so records
+    survive the process getting killed, not necessarily the machine going
+    down.
+
+    Only one process can use a directory at a time.
+    """
+
+    def __init__(
+        self,
+        directory,  # type: str
+        max_bytes=DEFAULT_SPOOL_MAX_BYTES,  # type: int
+        segment_bytes=DEFAULT_SEGMENT_BYTES,  # type: int
+    ):
+        # type: (...) -> None
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.pid = os.getpid()
+        self.closed = False
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._lock_file = open(os.path.join(directory, _LOCK_FILE), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                self._lock_file.close()
+                raise SpoolLocked(directory)
+
+        self._segments = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(_SEGMENT_SUFFIX)
+            and name[: -len(_SEGMENT_SUFFIX)].isdigit()
+        )  # type: List[int]
+
+        self._read_segment, self._read_offset = self._load_cursor()
+        for segment in [s for s in self._segments if s < self._read_segment]:
+            self._remove_segment(segment)
+        if self._segments and self._read_segment < self._segments[0]:
+            self._read_segment, self._read_offset = self._segments[0], 0
+
+        self._reader = None  # type: Optional[Any]
+        self._reader_segment = None  # type: Optional[int]
+        self._peeked_offset = None  # type: Optional[int]
+        self._writer = None  # type: Optional[Any]
+
+        if self._segments:
+            self._truncate_torn_tail(self._segments[-1])
+
+        self._size = sum(
+            os.path.getsize(self._segment_path(segment)) for segment in self._segments
+        )
+        if self._read_segment in self._segments:
+            self._size -= self._read_offset
+
+    def __len__(self):
+        # type: () -> int
+        """Number of bytes waiting to be read."""
+        return self._size
+
+    def _segment_path(self, segment):
+        # type: (int) -> str
+        return os.path.join(self.directory, "%010d%s" % (segment, _SEGMENT_SUFFIX))
+
+    def _remove_segment(self, segment):
+        # type: (int) -> None
+        try:
+            os.remove(self._segment_path(segment))
+        except OSError:
+            pass
+        self._segments.remove(segment)
+
+    def _load_cursor(self):
+        # type: () -> Tuple[int, int]
+        try:
+            with open(os.path.join(self.directory, _CURSOR_FILE)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (IOError, OSError, ValueError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self):
+        # type: () -> None
+        path = os.path.join(self.directory, _CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write("%d %d" % (self._read_segment, self._read_offset))
+        _replace(path + ".tmp", path)
+
+    def _read_record(self, f):
+        # type: (Any) -> Optional[bytes]
+        header = f.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return None
+        length, checksum = _RECORD_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) & 0xFFFFFFFF != checksum:
+            return None
+        return payload
+
+    def _truncate_torn_tail(self, segment):
+        # type: (int) -> None
+        """Cut off a record in the last segment that was only partially written."""
+        path = self._segment_path(segment)
+        with open(path, "rb+") as f:
+            valid = 0
+            while self._read_record(f) is not None:
+                valid = f.tell()
+            f.seek(0, os.SEEK_END)
+            if f.tell() != valid:
+                logger.warning("Discarding torn record in envelope spool %s", path)
+                f.truncate(valid)
+
+    def append(
+        self, payload  # type: bytes
+    ):
+        # type: (...) -> bool
+        """Append a record. Returns `False` if the spool is full."""
+        record = _RECORD_HEADER.pack(len(payload), zlib.crc32(payload) & 0xFFFFFFFF)
+        record += payload
+
+        with self._lock:
+            if self.closed or self._size + len(record) > self.max_bytes:
+                return False
+
+            if self._writer is None and self._segments:
+                self._writer = open(self._segment_path(self._segments[-1]), "ab")
+                self._writer.seek(0, os.SEEK_END)
+
+            # Start a new segment unless the record would be the first one
+            # in the current segment.
+            if self._writer is None or (
+                self._writer.tell() > 0
+                and self._writer.tell() + len(record) > self.segment_bytes
+            ):
+                if self._writer is not None:
+                    self._writer.close()
+                self._segments.append(self._segments[-1] + 1 if self._segments else 0)
+                self._writer = open(self._segment_path(self._segments[-1]), "ab")
+
+            self._writer.write(record)
+            self._writer.flush()
+            self._size += len(record)
+            return True
+
+    def peek(self):
+        # type: () -> Optional[bytes]
+        """
+        Return the oldest record that was not committed yet, without
+        removing it.
+        """
+        with self._lock:
+            while self._segments and not self.closed:
+                if self._read_segment not in self._segments:
+                    self._read_segment, self._read_offset = self._segments[0], 0
+
+                if self._reader_segment != self._read_segment:
+                    if self._reader is not None:
+                        self._reader.close()
+                    self._reader = open(self._segment_path(self._read_segment), "rb")
+                    self._reader_segment = self._read_segment
+
+                assert self._reader is not None
+                self._reader.seek(self._read_offset)
+                payload = self._read_record(self._reader)
+                if payload is not None:
+                    self._peeked_offset = self._reader.tell()
+                    return payload
+
+                if self._read_segment == self._segments[-1]:
+                    # Nothing more was written yet.
+                    return None
+
+                # Done with this segment, the rest of it is either empty or
+                # unreadable.
+                self._reader.close()
+                self._reader = self._reader_segment = None
+                self._size -= max(
+                    0,
+                    os.path.getsize(self._segment_path(self._read_segment))
+                    - self._read_offset,
+                )
+                self._remove_segment(self._read_segment)
+                self._read_segment, self._read_offset = self._segments[0], 0
+                self._save_cursor()
+
+            return None
+
+    def commit(self):
+        # type: () -> None
+        """Mark the record returned by the last `peek` as consumed."""
+        with self._lock:
+            if self.closed or self._peeked_offset is None:
+                return
+            self._size -= self._peeked_offset - self._read_offset
+            self._read_offset = self._peeked_offset
+            self._peeked_offset = None
+            self._save_cursor()
+
+    def close(self):
+        # type: () -> None
+        with self._lock:
+            self.closed = True
+            for f in (self._reader, self._writer, self._lock_file):
+                if f is not None:
+                    f.close()
+            self._reader = self._writer = None
+            self._reader_segment = None
@@ -0,0 +1,119 @@
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+
+from sentry_sdk.utils import now
+
+from sentry_sdk._types import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Deque
+    from typing import List
+
+    from sentry_sdk.tracing import Transaction
+
+
+DEFAULT_PERCENTILE = 0.95
+DEFAULT_MAX_PER_SECOND = 10.0
+
+# Number of recent durations per transaction name the percentile is computed
+# from, and how many of them are needed before it is used at all
+DURATION_WINDOW = 1000
+MIN_DURATIONS = 20
+
+MAX_TRANSACTION_NAMES = 500
+
+
+class _DurationWindow(object):
+    """The most recent durations of a transaction, in insertion and sorted order."""
+
+    __slots__ = ("recent", "sorted")
+
+    def __init__(self):
+        # type: () -> None
+        self.recent = deque()  # type: Deque[float]
+        self.sorted = []  # type: List[float]
+
+    def add(self, duration):
+        # type: (float) -> None
+        if len(self.recent) >= DURATION_WINDOW:
+            oldest = self.recent.popleft()
+            del self.sorted[bisect_left(self.sorted, oldest)]
+        self.recent.append(duration)
+        insort(self.sorted, duration)
+
+    def percentile(self, percentile):
+        # type: (float) -> float
+        index = min(int(len(self.sorted) * percentile), len(self.sorted) - 1)
+        return self.sorted[index]
+
+
+class TailSampler(object):
+    """
+    Decides whether to keep a transaction once it finished.
+
+    Transactions are kept if they failed, if an error was captured while
+    they were running, or if they took longer than the given percentile of
+    the recent transactions with the same name. At most
+    `max_per_second` transactions are kept per second on average, so that
+    bursts of failures don't turn into bursts of transactions.
+    """
+
+    def __init__(
+        self,
+        percentile=DEFAULT_PERCENTILE,  # type: float
+        max_per_second=DEFAULT_MAX_PER_SECOND,  # type: float
+    ):
+        # type: (...) -> None
+        self.percentile = percentile
+        self.max_per_second = max_per_second
+        self._durations = OrderedDict()  # type: OrderedDict[str, _DurationWindow]
+        # Allow bursts of at least one transaction for budgets below one
+        self._capacity = max(max_per_second, 1.0)
+        self._tokens = self._capacity
+        self._last_refill = now()
+        self._lock = threading.Lock()
+
+    def _is_slow(self, name, duration):
+        # type: (str, float) -> bool
+        window = self._durations.pop(name, None)
+        if window is None:
+            window = _DurationWindow()
+            if len(self._durations) >= MAX_TRANSACTION_NAMES:
+                self._durations.popitem(last=False)
+        self._durations[name] = window
+
+        slow = len(window.sorted) >= MIN_DURATIONS and duration > window.percentile(
+            self.percentile
+        )
+        window.add(duration)
+        return slow
+
+    def _take_token(self):
+        # type: () -> bool
+        current = now()
+        self._tokens = min(
+            self._capacity,
+            self._tokens + (current - self._last_refill) * self.max_per_second,
+        )
+        self._last_refill = current
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def should_keep(self, transaction):
+        # type: (Transaction) -> bool
+        duration = (
+            transaction.timestamp - transaction.start_timestamp  # type: ignore
+        ).total_seconds()
+        failed = transaction._error_captured or transaction.status not in (
+            None,
+            "ok",
+        )
+
+        with self._lock:
+            slow = self._is_slow(transaction.name, duration)
+            if not (failed or slow):
+                return False
+            return self._take_token()
@@ -1,10 +1,12 @@
-import uuid
+import os
 import random
+import binascii
+import threading
 
 from datetime import datetime, timedelta
 
 import sentry_sdk
-from sentry_sdk.consts import INSTRUMENTER
+from sentry_sdk.consts import INSTRUMENTER, OP
 from sentry_sdk.utils import is_valid_sample_rate, logger, nanosecond_time
 from sentry_sdk._compat import PY2
 from sentry_sdk._types import TYPE_CHECKING
@@ -37,6 +39,10 @@ TRANSACTION_SOURCE_VIEW = "view"
 TRANSACTION_SOURCE_COMPONENT = "component"
 TRANSACTION_SOURCE_TASK = "task"
 
+# Appended to the name of a transaction for the chunks of its spans that are
+# sent while it is still running.
+TRANSACTION_CHUNK_SUFFIX = "[chunk]"
+
 # These are typically high cardinality and the server hates them
 LOW_QUALITY_TRANSACTION_SOURCES = [
     TRANSACTION_SOURCE_URL,
@@ -55,13 +61,95 @@ SOURCE_FOR_STYLE = {
 }
 
 
+class RandomIdGenerator(object):
+    """
+    Generates trace and span ids from a pseudo random number generator.
+
+    Every thread gets its own generator seeded from `os.urandom`, which is a
+    lot cheaper than asking the operating system for fresh randomness for
+    every id, as `uuid.uuid4` does. Generators are reseeded in forked
+    children so that they don't produce the same ids as their parent.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._local = threading.local()
+        self._generation = 0
+        self._check_pid = not hasattr(os, "register_at_fork")
+        if not self._check_pid:
+            os.register_at_fork(after_in_child=self._reseed)
+
+    def _reseed(self):
+        # type: () -> None
+        self._generation += 1
+
+    def _random(self):
+        # type: () -> random.Random
+        local = self._local
+        try:
+            if local.generation == self._generation and (
+                not self._check_pid or local.pid == os.getpid()
+            ):
+                return local.random
+        except AttributeError:
+            pass
+
+        local.random = random.Random(int(binascii.hexlify(os.urandom(16)), 16))
+        local.generation = self._generation
+        local.pid = os.getpid()
+        return local.random
+
+    def trace_id(self):
+        # type: () -> str
+        return "%032x" % self._random().getrandbits(128)
+
+    def span_id(self):
+        # type: () -> str
+        return "%016x" % self._random().getrandbits(64)
+
+
+_default_id_generator = RandomIdGenerator()
+_id_generator = _default_id_generator  # type: Any
+
+
+def set_id_generator(generator):
+    # type: (Optional[Any]) -> None
+    """
+    Replace the generator used for new trace and span ids. The generator
+    needs `trace_id()` and `span_id()` methods returning 32 and 16 lowercase
+    hex characters. Passing `None` restores the default generator.
+    """
+    global _id_generator
+    _id_generator = generator or _default_id_generator
+
+
 class _SpanRecorder(object):
-    """Limits the number of spans recorded in a transaction."""
+    """
+    Limits the number of spans recorded in a transaction.
 
-    __slots__ = ("maxlen", "spans")
+    With `compress` enabled, a span which does the same thing as the span
+    recorded right before it (e.g. the queries of an N+1 query pattern) is
+    merged into that span instead of being recorded on its own, and doesn't
+    count towards the limit.
 
-    def __init__(self, maxlen):
-        # type: (int) -> None
+    With a `chunk_size`, the transaction sends its finished spans whenever
+    that many spans have finished, so that the limit only applies to the
+    spans held in memory at a time.
+    """
+
+    __slots__ = (
+        "maxlen",
+        "spans",
+        "compress",
+        "chunk_size",
+        "finished",
+        "chunks",
+        "_compressed",
+        "_lock",
+    )
+
+    def __init__(self, maxlen, compress=False, chunk_size=None):
+        # type: (int, bool, Optional[int]) -> None
         # FIXME: this is `maxlen - 1` only to preserve historical behavior
         # enforced by tests.
         # Either this should be changed to `maxlen` or the JS SDK implementation
@@ -69,13 +157,140 @@ class _SpanRecorder(object):
         # limits: either transaction+spans or only child spans.
         self.maxlen = maxlen - 1
         self.spans = []  # type: List[Span]
+        self.compress = compress
+        self.chunk_size = chunk_size
+        #: Number of spans finished since the last chunk was sent
+        self.finished = 0
+        #: Number of chunks sent
+        self.chunks = 0
+        # Spans merged into a recorded span, by the span_id of that span
+        self._compressed = {}  # type: Dict[str, List[Span]]
+        # Spans are started and finished from any thread.
+        self._lock = threading.Lock()
 
     def add(self, span):
         # type: (Span) -> None
-        if len(self.spans) > self.maxlen:
-            span._span_recorder = None
-        else:
-            self.spans.append(span)
+        with self._lock:
+            if (
+                self.compress
+                and self.spans
+                and spans_are_compressible(self.spans[-1], span)
+            ):
+                self._compressed.setdefault(self.spans[-1].span_id, []).append(span)
+            elif len(self.spans) > self.maxlen:
+                span._span_recorder = None
+            else:
+                self.spans.append(span)
+
+    def span_finished(self):
+        # type: () -> bool
+        """
+        Counts a finished span. Returns `True` if a chunk is complete, which
+        it does for only one of the spans finishing at the same time.
+        """
+        with self._lock:
+            self.finished += 1
+            if self.chunk_size is None or self.finished < self.chunk_size:
+                return False
+            self.finished = 0
+            return True
+
+    def to_json(self):
+        # type: () -> List[Dict[str, Any]]
+        """Serialize all finished spans, merging compressed ones."""
+        with self._lock:
+            spans = list(self.spans)
+            compressed = dict(
+                (span_id, list(merged)) for span_id, merged in self._compressed.items()
+            )
+        return _spans_to_json(spans, compressed)
+
+    def flush(self):
+        # type: () -> Tuple[int, List[Dict[str, Any]]]
+        """
+        Serialize and forget all finished spans, and return them with the
+        index of their chunk. Unfinished spans, and spans merged with
+        unfinished spans, are kept.
+        """
+        finished = []
+        pending = []
+        compressed = {}  # type: Dict[str, List[Span]]
+        with self._lock:
+            for span in self.spans:
+                group = [span] + self._compressed.get(span.span_id, [])
+                if all(s._is_finished() for s in group):
+                    finished.append(span)
+                else:
+                    pending.append(span)
+
+            self.spans = pending
+            for span in finished:
+                merged = self._compressed.pop(span.span_id, None)
+                if merged is not None:
+                    compressed[span.span_id] = merged
+
+            index = self.chunks
+            if finished:
+                self.chunks += 1
+
+        # The spans are no longer reachable from the recorder, so nothing
+        # else touches them anymore.
+        return index, _spans_to_json(finished, compressed)
+
+
+def _spans_to_json(spans, compressed):
+    # type: (List[Span], Dict[str, List[Span]]) -> List[Dict[str, Any]]
+    rv = []
+    reparented = {}  # type: Dict[str, str]
+    for span in spans:
+        merged = compressed.get(span.span_id)
+        if merged is None:
+            if span._is_finished():
+                rv.append(span.to_json())
+            continue
+
+        group = [span] + merged
+        finished = [s for s in group if s._is_finished()]
+        if not finished:
+            continue
+
+        # Children of merged spans are attached to the reported span.
+        for s in group:
+            if s is not finished[0]:
+                reparented[s.span_id] = finished[0].span_id
+
+        rv.append(_compressed_span_to_json(finished))
+
+    if reparented:
+        for span_json in rv:
+            parent_span_id = span_json["parent_span_id"]
+            if parent_span_id in reparented:
+                span_json["parent_span_id"] = reparented[parent_span_id]
+
+    return rv
+
+
+def _compressed_span_to_json(spans):
+    # type: (List[Span]) -> Dict[str, Any]
+    rv = spans[0].to_json()
+    if len(spans) == 1:
+        return rv
+
+    durations = [
+        (s.timestamp - s.start_timestamp).total_seconds() for s in spans  # type: ignore
+    ]
+    rv["start_timestamp"] = min(s.start_timestamp for s in spans)
+    rv["timestamp"] = max(s.timestamp for s in spans)  # type: ignore
+    if any(s.description != rv["description"] for s in spans):
+        rv["description"] = normalize_sql(rv["description"])
+
+    rv["data"] = dict(rv.get("data") or ())
+    rv["data"]["compressed_spans"] = {
+        "count": len(spans),
+        "total_duration": sum(durations),
+        "max_duration": max(durations),
+    }
+    return rv
 
 
 class Span(object):
@@ -87,16 +302,19 @@ class Span(object):
         "sampled",
         "op",
         "description",
-        "start_timestamp",
+        "_start_timestamp",
         "_start_timestamp_monotonic_ns",
+        "_timestamp",
+        "_end_timestamp_monotonic_ns",
+        "_clock_anchor",
         "status",
-        "timestamp",
         "_tags",
         "_data",
         "_span_recorder",
         "hub",
         "_context_manager_state",
         "_containing_transaction",
+        "_propagation_headers",
     )
 
     def __new__(cls, **kwargs):
@@ -129,8 +347,8 @@ class Span(object):
         start_timestamp=None,  # type: Optional[datetime]
     ):
         # type: (...) -> None
-        self.trace_id = trace_id or uuid.uuid4().hex
-        self.span_id = span_id or uuid.uuid4().hex[16:]
+        self.trace_id = trace_id or _id_generator.trace_id()
+        self.span_id = span_id or _id_generator.span_id()
         self.parent_span_id = parent_span_id
         self.same_process_as_parent = same_process_as_parent
         self.sampled = sampled
@@ -141,25 +359,49 @@ class Span(object):
         self._tags = {}  # type: Dict[str, str]
         self._data = {}  # type: Dict[str, Any]
         self._containing_transaction = containing_transaction
-        self.start_timestamp = start_timestamp or datetime.utcnow()
+        self._start_timestamp = start_timestamp
+        self._timestamp = None  # type: Optional[datetime]
+        self._end_timestamp_monotonic_ns = None  # type: Optional[int]
+        self._clock_anchor = None  # type: Optional[Tuple[datetime, int]]
         try:
             # profiling depends on this value and requires that
             # it is measured in nanoseconds
             self._start_timestamp_monotonic_ns = nanosecond_time()
         except AttributeError:
-            pass
-
-        #: End timestamp of span
-        self.timestamp = None  # type: Optional[datetime]
+            if start_timestamp is None:
+                self._start_timestamp = datetime.utcnow()
+        else:
+            # Datetimes are only computed when the span is serialized, from
+            # the monotonic clock and a single reading of the wall clock
+            # shared by all spans of a transaction.
+            if start_timestamp is not None:
+                self._clock_anchor = (
+                    start_timestamp,
+                    self._start_timestamp_monotonic_ns,
+                )
+            elif (
+                containing_transaction is not None
+                and containing_transaction._clock_anchor is not None
+            ):
+                self._clock_anchor = containing_transaction._clock_anchor
+            else:
+                self._clock_anchor = (
+                    datetime.utcnow(),
+                    self._start_timestamp_monotonic_ns,
+                )
 
         self._span_recorder = None  # type: Optional[_SpanRecorder]
+        # The key the propagation headers were computed for, and the headers
+        self._propagation_headers = None  # type: Optional[Tuple[Any, Any]]
 
     # TODO this should really live on the Transaction class rather than the Span
     # class
-    def init_span_recorder(self, maxlen):
-        # type: (int) -> None
+    def init_span_recorder(self, maxlen, compress=False, chunk_size=None):
+        # type: (int, bool, Optional[int]) -> None
         if self._span_recorder is None:
-            self._span_recorder = _SpanRecorder(maxlen)
+            self._span_recorder = _SpanRecorder(
+                maxlen, compress=compress, chunk_size=chunk_size
+            )
 
     def __repr__(self):
         # type: () -> str
@@ -197,6 +439,46 @@ class Span(object):
         self.finish(hub)
         scope.span = old_span
 
+    @property
+    def start_timestamp(self):
+        # type: () -> datetime
+        if self._start_timestamp is None:
+            anchor, anchor_ns = self._clock_anchor  # type: ignore
+            self._start_timestamp = anchor + timedelta(
+                microseconds=(self._start_timestamp_monotonic_ns - anchor_ns) / 1000
+            )
+        return self._start_timestamp
+
+    @start_timestamp.setter
+    def start_timestamp(self, value):
+        # type: (datetime) -> None
+        self._start_timestamp = value
+
+    @property
+    def timestamp(self):
+        # type: () -> Optional[datetime]
+        """End timestamp of span"""
+        if self._timestamp is None and self._end_timestamp_monotonic_ns is not None:
+            elapsed = (
+                self._end_timestamp_monotonic_ns - self._start_timestamp_monotonic_ns
+            )
+            self._timestamp = self.start_timestamp + timedelta(
+                microseconds=elapsed / 1000
+            )
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, value):
+        # type: (Optional[datetime]) -> None
+        self._timestamp = value
+        self._end_timestamp_monotonic_ns = None
+
+    def _is_finished(self):
+        # type: () -> bool
+        return (
+            self._timestamp is not None or self._end_timestamp_monotonic_ns is not None
+        )
+
     @property
     def containing_transaction(self):
         # type: () -> Optional[Transaction]
@@ -313,13 +595,31 @@ class Span(object):
         Creates a generator which returns the span's `sentry-trace` and `baggage` headers.
         If the span's containing transaction doesn't yet have a `baggage` value,
         this will cause one to be generated and stored.
+
+        The headers are computed once and reused until the span's ids, its
+        sampling decision or the transaction's baggage change.
         """
-        yield SENTRY_TRACE_HEADER_NAME, self.to_traceparent()
+        transaction = self.containing_transaction
+        baggage = transaction.get_baggage() if transaction else None
+        key = (
+            self.trace_id,
+            self.span_id,
+            self.sampled,
+            transaction is not None and transaction._sampling_deferred,
+            baggage,
+        )
 
-        if self.containing_transaction:
-            baggage = self.containing_transaction.get_baggage().serialize()
-            if baggage:
-                yield BAGGAGE_HEADER_NAME, baggage
+        cached = self._propagation_headers
+        if cached is None or cached[0] != key:
+            headers = [(SENTRY_TRACE_HEADER_NAME, self.to_traceparent())]
+            if baggage is not None:
+                serialized = baggage.serialize()
+                if serialized:
+                    headers.append((BAGGAGE_HEADER_NAME, serialized))
+            cached = self._propagation_headers = (key, headers)
+
+        for header in cached[1]:
+            yield header
 
     @classmethod
     def from_traceparent(
@@ -354,6 +654,10 @@ class Span(object):
             sampled = "1"
         if self.sampled is False:
             sampled = "0"
+        transaction = self.containing_transaction
+        if transaction is not None and transaction._sampling_deferred:
+            # Let downstream services make their own decision until ours is known
+            sampled = ""
         return "%s-%s-%s" % (self.trace_id, self.span_id, sampled)
 
     def set_tag(self, key, value):
@@ -405,28 +709,47 @@ class Span(object):
         # type: () -> bool
         return self.status == "ok"
 
+    def is_recording(self):
+        # type: () -> bool
+        """
+        Whether this span will end up being sent to Sentry.
+
+        Integrations can check this before doing any work that only serves
+        the span, like formatting descriptions or collecting tags.
+        """
+        if self.sampled is not True:
+            return False
+        transaction = self.containing_transaction
+        return transaction is not None and transaction._span_recorder is not None
+
     def finish(self, hub=None, end_timestamp=None):
         # type: (Optional[sentry_sdk.Hub], Optional[datetime]) -> Optional[str]
         # XXX: would be type: (Optional[sentry_sdk.Hub]) -> None, but that leads
         # to incompatible return types for Span.finish and Transaction.finish.
-        if self.timestamp is not None:
+        if self._is_finished():
             # This span is already finished, ignore.
             return None
 
         hub = hub or self.hub or sentry_sdk.Hub.current
 
-        try:
-            if end_timestamp:
-                self.timestamp = end_timestamp
-            else:
-                elapsed = nanosecond_time() - self._start_timestamp_monotonic_ns
-                self.timestamp = self.start_timestamp + timedelta(
-                    microseconds=elapsed / 1000
-                )
-        except AttributeError:
-            self.timestamp = datetime.utcnow()
+        if end_timestamp:
+            self._timestamp = end_timestamp
+        else:
+            try:
+                self._end_timestamp_monotonic_ns = nanosecond_time()
+            except AttributeError:
+                self._timestamp = datetime.utcnow()
 
         maybe_create_breadcrumbs_from_span(hub, self)
+
+        # Only child spans count towards a chunk, the transaction itself is
+        # sent in its own event.
+        transaction = self._containing_transaction
+        span_recorder = transaction and transaction._span_recorder
+        if span_recorder and span_recorder.chunk_size and transaction is not self:
+            if span_recorder.span_finished():
+                transaction._flush_chunk(hub)  # type: ignore
+
         return None
 
     def to_json(self):
@@ -486,6 +809,9 @@ class Transaction(Span):
         "_contexts",
         "_profile",
         "_baggage",
+        "_sampling_deferred",
+        "_error_captured",
+        "_adaptive_sampling_name",
     )
 
     def __init__(
@@ -517,6 +843,11 @@ class Transaction(Span):
         self._contexts = {}  # type: Dict[str, Any]
         self._profile = None  # type: Optional[sentry_sdk.profiler.Profile]
         self._baggage = baggage
+        #: Whether the sampling decision is made when the transaction finishes
+        self._sampling_deferred = False
+        self._error_captured = False
+        #: The name the adaptive sampler computed the sample rate for
+        self._adaptive_sampling_name = None  # type: Optional[str]
 
     def __repr__(self):
         # type: () -> str
@@ -561,7 +892,7 @@ class Transaction(Span):
 
     def finish(self, hub=None, end_timestamp=None):
         # type: (Optional[sentry_sdk.Hub], Optional[datetime]) -> Optional[str]
-        if self.timestamp is not None:
+        if self._is_finished():
             # This transaction is already finished, ignore.
             return None
 
@@ -602,11 +933,26 @@ class Transaction(Span):
 
             return None
 
-        finished_spans = [
-            span.to_json()
-            for span in self._span_recorder.spans
-            if span.timestamp is not None
-        ]
+        if self._sampling_deferred:
+            tail_sampler = client.tail_sampler
+            if tail_sampler is None or not tail_sampler.should_keep(self):
+                logger.debug("Discarding transaction because of tail sampling")
+                self.sampled = False
+                self._span_recorder = None
+                if client.transport:
+                    client.transport.record_lost_event(
+                        "sample_rate", data_category="transaction"
+                    )
+                return None
+
+        if (
+            client.adaptive_sampler is not None
+            and self._adaptive_sampling_name is not None
+        ):
+            client.adaptive_sampler.record_finished(self._adaptive_sampling_name)
+
+        finished_spans = self._span_recorder.to_json()
+        chunks = self._span_recorder.chunks
 
         # we do this to break the circular reference of transaction -> span
         # recorder -> span -> containing transaction (which is where we started)
@@ -614,28 +960,73 @@ class Transaction(Span):
         # to be garbage collected
         self._span_recorder = None
 
+        event = self._to_event(finished_spans, self.timestamp)
+        if chunks:
+            event["contexts"]["transaction_chunk"] = {"index": chunks, "final": True}
+
+        if self._profile is not None and self._profile.valid():
+            event["profile"] = self._profile
+            self._profile = None
+
+        event["measurements"] = self._measurements
+
+        return hub.capture_event(event)
+
+    def _to_event(self, finished_spans, timestamp):
+        # type: (List[Dict[str, Any]], Optional[datetime]) -> SentryEvent
         contexts = {}
         contexts.update(self._contexts)
         contexts.update({"trace": self.get_trace_context()})
 
-        event = {
+        return {
             "type": "transaction",
             "transaction": self.name,
             "transaction_info": {"source": self.source},
             "contexts": contexts,
             "tags": self._tags,
-            "timestamp": self.timestamp,
+            "timestamp": timestamp,
             "start_timestamp": self.start_timestamp,
             "spans": finished_spans,
-        }  # type: Event
+        }
 
-        if self._profile is not None and self._profile.valid():
-            event["profile"] = self._profile
-            self._profile = None
+    def _flush_chunk(self, hub):
+        # type: (sentry_sdk.Hub) -> None
+        """
+        Send the finished spans of a transaction that is still running.
 
-        event["measurements"] = self._measurements
+        The chunk is sent as a transaction event for a segment of the
+        transaction, a span of its own that is a child of the transaction and
+        covers the time of the spans in the chunk. The spans keep their
+        parents, so that the trace shows them where they belong. The segment
+        has its own name and op, so that it isn't taken for the transaction.
+        """
+        span_recorder = self._span_recorder
+        if (
+            span_recorder is None
+            or not self.sampled
+            or self._sampling_deferred
+            or hub.client is None
+        ):
+            return
 
-        return hub.capture_event(event)
+        index, finished_spans = span_recorder.flush()
+        if not finished_spans:
+            return
+
+        event = self._to_event(
+            finished_spans, max(span["timestamp"] for span in finished_spans)
+        )
+        event["transaction"] = "{} {}".format(self.name, TRANSACTION_CHUNK_SUFFIX)
+        event["start_timestamp"] = min(
+            span["start_timestamp"] for span in finished_spans
+        )
+        trace_context = event["contexts"]["trace"]
+        trace_context["op"] = OP.TRANSACTION_CHUNK
+        trace_context["parent_span_id"] = self.span_id
+        trace_context["span_id"] = _id_generator.span_id()
+        event["contexts"]["transaction_chunk"] = {"index": index, "final": False}
+
+        hub.capture_event(event)
 
     def set_measurement(self, name, value, unit=""):
         # type: (str, float, MeasurementUnit) -> None
@@ -709,16 +1100,18 @@ class Transaction(Span):
         # we would have bailed already if neither `traces_sampler` nor
         # `traces_sample_rate` were defined, so one of these should work; prefer
         # the hook if so
-        sample_rate = (
-            options["traces_sampler"](sampling_context)
-            if callable(options.get("traces_sampler"))
-            else (
-                # default inheritance behavior
-                sampling_context["parent_sampled"]
-                if sampling_context["parent_sampled"] is not None
-                else options["traces_sample_rate"]
-            )
-        )
+        if callable(options.get("traces_sampler")):
+            sample_rate = options["traces_sampler"](sampling_context)
+        elif sampling_context["parent_sampled"] is not None:
+            # default inheritance behavior
+            sample_rate = sampling_context["parent_sampled"]
+        elif client.adaptive_sampler is not None:
+            sample_rate = client.adaptive_sampler.sample_rate(self.name)
+        else:
+            sample_rate = options["traces_sample_rate"]
+
+        if client.adaptive_sampler is not None:
+            self._adaptive_sampling_name = self.name
 
         # Since this is coming from the user (or from a function provided by the
         # user), who knows what we might get. (The only valid values are
@@ -768,6 +1161,28 @@ class Transaction(Span):
                     sample_rate=float(sample_rate),
                 )
             )
+            self._maybe_defer_sampling_decision(client, sampling_context)
+
+    def _maybe_defer_sampling_decision(self, client, sampling_context):
+        # type: (sentry_sdk.Client, SamplingContext) -> None
+        """
+        Record a transaction that was not sampled anyway if tail sampling is
+        enabled, so that it can still be kept when it finishes. Decisions
+        inherited from an incoming trace are respected.
+        """
+        if (
+            client.tail_sampler is None
+            or sampling_context["parent_sampled"] is not None
+        ):
+            return
+
+        logger.debug(
+            "[Tracing] Deferring sampling decision for transaction <{name}>".format(
+                name=self.name
+            )
+        )
+        self.sampled = True
+        self._sampling_deferred = True
 
 
 class NoOpSpan(Span):
@@ -799,6 +1214,10 @@ class NoOpSpan(Span):
         # type: (int) -> None
         pass
 
+    def is_recording(self):
+        # type: () -> bool
+        return False
+
     def finish(self, hub=None, end_timestamp=None):
         # type: (Optional[sentry_sdk.Hub], Optional[datetime]) -> Optional[str]
         pass
@@ -841,5 +1260,7 @@ from sentry_sdk.tracing_utils import (
     EnvironHeaders,
     extract_sentrytrace_data,
     has_tracing_enabled,
+    normalize_sql,
+    spans_are_compressible,
     maybe_create_breadcrumbs_from_span,
 )
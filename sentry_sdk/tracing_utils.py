@@ -1,8 +1,10 @@
 import re
 import contextlib
+import threading
+from collections import OrderedDict
 
 import sentry_sdk
-from sentry_sdk.consts import OP
+from sentry_sdk.consts import MATCH_ALL, OP
 
 from sentry_sdk.utils import (
     capture_internal_exceptions,
@@ -25,6 +27,7 @@ if TYPE_CHECKING:
     from typing import Any
     from typing import Dict
     from typing import Generator
+    from typing import List
     from typing import Optional
     from typing import Union
 
@@ -37,6 +40,31 @@ SENTRY_TRACE_REGEX = re.compile(
     "[ \t]*$"  # whitespace
 )
 
+# Literals in SQL queries, which are replaced to tell apart queries that only
+# differ in their parameters
+SQL_LITERAL_REGEX = re.compile(
+    r"""
+    '(?:[^']|'')*'                  # string
+    | (?<![\w$:])\d+(?:\.\d+)?\b    # number, not part of a name or placeholder
+    """,
+    re.VERBOSE,
+)
+_SQL_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)"
+# IN lists of any length are collapsed, as ORMs generate one placeholder per
+# value
+SQL_IN_LIST_REGEX = re.compile(
+    r"\b(IN)\s*\(\s*{0}(?:\s*,\s*{0})*\s*\)".format(_SQL_PLACEHOLDER),
+    re.IGNORECASE,
+)
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+DEFAULT_SQL_CACHE_ENTRIES = 1000
+# Longer queries are normalized every time instead of being kept in memory
+MAX_CACHED_SQL_LENGTH = 64 * 1024
+
+# Number of URLs whose trace propagation decision is remembered
+MAX_CACHED_PROPAGATION_URLS = 1000
+
 # This is a normal base64 regex, modified to reflect that fact that we strip the
 # trailing = or == off
 base64_stripped = (
@@ -106,10 +134,10 @@ def record_sql_queries(
 ):
     # type: (...) -> Generator[Span, None, None]
 
+    experiments = hub.client.options["_experiments"] if hub.client else {}
+
     # TODO: Bring back capturing of params by default
-    if hub.client and hub.client.options["_experiments"].get(
-        "record_sql_params", False
-    ):
+    if experiments.get("record_sql_params", False):
         if not params_list or params_list == [None]:
             params_list = None
 
@@ -120,6 +148,8 @@ def record_sql_queries(
         paramstyle = None
 
     query = _format_sql(cursor, query)
+    if query is not None and experiments.get("normalize_sql"):
+        query = normalize_sql(query)
 
     data = {}
     if params_list is not None:
@@ -155,6 +185,109 @@ def maybe_create_breadcrumbs_from_span(hub, span):
         )
 
 
+def _normalize_sql(sql):
+    # type: (str) -> str
+    sql = SQL_LITERAL_REGEX.sub("?", sql)
+    sql = SQL_IN_LIST_REGEX.sub(r"\1 (...)", sql)
+    return WHITESPACE_REGEX.sub(" ", sql).strip()
+
+
+class SqlFingerprintCache(object):
+    """
+    LRU cache of normalized SQL queries, keyed by the raw query.
+
+    Executions of the same query share one normalized string, which is used
+    as the description of their spans.
+    """
+
+    def __init__(self, max_entries=DEFAULT_SQL_CACHE_ENTRIES):
+        # type: (int) -> None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # type: OrderedDict[str, str]
+        # Normalized queries with the number of entries using them, so that
+        # raw queries with the same fingerprint share one string.
+        self._fingerprints = {}  # type: Dict[str, List[Any]]
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        # type: () -> float
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+
+    def get(self, sql):
+        # type: (str) -> str
+        with self._lock:
+            normalized = self._entries.pop(sql, None)
+            if normalized is not None:
+                self._entries[sql] = normalized
+                self.hits += 1
+                return normalized
+            self.misses += 1
+
+        normalized = _normalize_sql(sql)
+        if len(sql) > MAX_CACHED_SQL_LENGTH:
+            return normalized
+
+        with self._lock:
+            if sql in self._entries:
+                return self._entries[sql]
+
+            fingerprint = self._fingerprints.setdefault(normalized, [normalized, 0])
+            fingerprint[1] += 1
+            normalized = self._entries[sql] = fingerprint[0]
+
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                fingerprint = self._fingerprints[evicted]
+                fingerprint[1] -= 1
+                if not fingerprint[1]:
+                    del self._fingerprints[evicted]
+
+        return normalized
+
+
+sql_fingerprints = SqlFingerprintCache()
+
+
+def normalize_sql(sql):
+    # type: (str) -> str
+    """
+    Fingerprint a SQL query: literals are replaced with placeholders, IN
+    lists are collapsed and whitespace is collapsed.
+    """
+    return sql_fingerprints.get(sql)
+
+
+def spans_are_compressible(span, other):
+    # type: (Span, Span) -> bool
+    """
+    Whether two sibling spans describe the same operation and can be
+    reported as a single span.
+    """
+    if span.op is None or span.op != other.op:
+        return False
+    if span.parent_span_id != other.parent_span_id:
+        return False
+    if span.description == other.description:
+        return True
+    if (
+        span.op.startswith(OP.DB)
+        and span.description is not None
+        and other.description is not None
+    ):
+        return normalize_sql(span.description) == normalize_sql(other.description)
+    return False
+
+
 def extract_sentrytrace_data(header):
     # type: (Optional[str]) -> Optional[typing.Mapping[str, Union[str, bool, None]]]
     """
@@ -208,7 +341,7 @@ def _format_sql(cursor, sql):
 
 
 class Baggage(object):
-    __slots__ = ("sentry_items", "third_party_items", "mutable")
+    __slots__ = ("sentry_items", "third_party_items", "mutable", "_serialized")
 
     SENTRY_PREFIX = "sentry-"
     SENTRY_PREFIX_REGEX = re.compile("^sentry-")
@@ -222,6 +355,7 @@ class Baggage(object):
         self.sentry_items = sentry_items
         self.third_party_items = third_party_items
         self.mutable = mutable
+        self._serialized = None  # type: Optional[str]
 
     @classmethod
     def from_incoming_header(cls, header):
@@ -312,6 +446,17 @@ class Baggage(object):
         return header
 
     def serialize(self, include_third_party=False):
+        # type: (bool) -> str
+        # The sentry items of frozen baggage don't change anymore, so they
+        # are only serialized once.
+        if not include_third_party and not self.mutable:
+            if self._serialized is None:
+                self._serialized = self._serialize(include_third_party)
+            return self._serialized
+
+        return self._serialize(include_third_party)
+
+    def _serialize(self, include_third_party):
         # type: (bool) -> str
         items = []
 
@@ -326,23 +471,61 @@ class Baggage(object):
         return ",".join(items)
 
 
+class PropagationTargetMatcher(object):
+    """
+    Matches URLs against `trace_propagation_targets`.
+
+    The targets are compiled once, and the results for recently seen URLs
+    are remembered.
+    """
+
+    def __init__(self, targets):
+        # type: (List[str]) -> None
+        self.targets = list(targets)
+        self._match_all = MATCH_ALL in self.targets
+        self._patterns = [re.compile(target) for target in self.targets]
+        self._results = {}  # type: Dict[str, bool]
+
+    def matches(self, url):
+        # type: (str) -> bool
+        if self._match_all:
+            return True
+
+        try:
+            return self._results[url]
+        except KeyError:
+            pass
+
+        matched = any(pattern.search(url) for pattern in self._patterns)
+        if len(self._results) >= MAX_CACHED_PROPAGATION_URLS:
+            self._results.clear()
+        self._results[url] = matched
+        return matched
+
+
+_propagation_target_matcher = None  # type: Optional[PropagationTargetMatcher]
+
+
 def should_propagate_trace(hub, url):
     # type: (sentry_sdk.Hub, str) -> bool
     """
     Returns True if url matches trace_propagation_targets configured in the given hub. Otherwise, returns False.
     """
+    global _propagation_target_matcher
+
     client = hub.client  # type: Any
     trace_propagation_targets = client.options["trace_propagation_targets"]
 
     if trace_propagation_targets is None:
         return False
 
-    for target in trace_propagation_targets:
-        matched = re.search(target, url)
-        if matched:
-            return True
+    matcher = _propagation_target_matcher
+    if matcher is None or matcher.targets != trace_propagation_targets:
+        matcher = _propagation_target_matcher = PropagationTargetMatcher(
+            trace_propagation_targets
+        )
 
-    return False
+    return matcher.matches(url)
 
 
 # Circular imports
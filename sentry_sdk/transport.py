@@ -1,25 +1,31 @@
 from __future__ import print_function
 
 import io
+import os
 import urllib3  # type: ignore
 import certifi
 import gzip
+import threading
 import time
 
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from sentry_sdk.utils import Dsn, logger, capture_internal_exceptions, json_dumps
 from sentry_sdk.worker import BackgroundWorker
 from sentry_sdk.envelope import Envelope, Item, PayloadRef
+from sentry_sdk.spool import DEFAULT_SPOOL_MAX_BYTES, EnvelopeSpool, SpoolLocked
 
 from sentry_sdk._types import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from typing import Any
+    from typing import Awaitable
     from typing import Callable
+    from typing import Deque
     from typing import Dict
     from typing import Iterable
+    from typing import List
     from typing import Optional
     from typing import Tuple
     from typing import Type
@@ -30,6 +36,7 @@ if TYPE_CHECKING:
     from urllib3.poolmanager import ProxyManager
 
     from sentry_sdk._types import SentryEvent, EndpointType
+    from sentry_sdk.local_aggregation import LocalAggregator
 
     DataCategory = Optional[str]
 
@@ -47,6 +54,9 @@ class Transport(object):
 
     parsed_dsn = None  # type: Optional[Dsn]
 
+    # Set by the client when processes aggregate client reports locally
+    local_aggregator = None  # type: Optional[LocalAggregator]
+
     def __init__(
         self, options=None  # type: Optional[Dict[str, Any]]
     ):
@@ -86,8 +96,12 @@ class Transport(object):
         timeout,  # type: float
         callback=None,  # type: Optional[Any]
     ):
-        # type: (...) -> None
-        """Wait `timeout` seconds for the current events to be sent out."""
+        # type: (...) -> Optional[Awaitable[None]]
+        """
+        Wait `timeout` seconds for the current events to be sent out. A
+        transport that can not wait where it is called returns an awaitable
+        instead.
+        """
         pass
 
     def kill(self):
@@ -107,6 +121,22 @@ class Transport(object):
         """
         return None
 
+    def is_rate_limited(
+        self, data_category  # type: str
+    ):
+        # type: (...) -> bool
+        """Returns whether events of the given data category are currently
+        being dropped because of a rate limit.
+        """
+        return False
+
+    def queue_load(self):
+        # type: () -> float
+        """Returns how full the queue of events waiting to be sent is,
+        between 0 and 1.
+        """
+        return 0.0
+
     def __del__(self):
         # type: () -> None
         try:
@@ -130,6 +160,31 @@ def _parse_rate_limits(header, now=None):
             continue
 
 
+# Item types that carry no event payload and can be sent together in a single
+# envelope without envelope headers.
+_MERGEABLE_ITEM_TYPES = frozenset(("session", "sessions", "client_report"))
+
+# Upper bound for the number of items in a merged envelope, same as the one
+# used by the session flusher.
+_MAX_MERGED_ENVELOPE_ITEMS = 100
+
+# Seconds to wait before sending spooled envelopes again after a network
+# error or a response asking to retry. The wait doubles with every failed
+# attempt in a row, up to the maximum.
+_SPOOL_RETRY_INTERVAL = 10
+_SPOOL_MAX_RETRY_INTERVAL = 300
+
+
+def _is_retryable_status(status):
+    # type: (int) -> bool
+    return status == 429 or status >= 500
+
+
+def _ignore_loss(reason):
+    # type: (str) -> None
+    pass
+
+
 class HttpTransport(Transport):
     """The default HTTP transport."""
 
@@ -151,6 +206,41 @@ class HttpTransport(Transport):
         )  # type: DefaultDict[Tuple[str, str], int]
         self._last_client_report_sent = time.time()
 
+        experiments = options.get("_experiments", {})
+        self._batch_size = experiments.get("transport_batch_size")
+        self._batch_linger = experiments.get("transport_batch_linger") or 0.0
+        self._batch_condition = threading.Condition(threading.Lock())
+        self._batch_scheduled = False
+        self._batch_flushing = False
+        self._pending_envelopes = deque()  # type: Deque[Envelope]
+
+        self._spool = None  # type: Optional[EnvelopeSpool]
+        self._spool_lock = threading.Lock()
+        self._spool_draining = False
+        self._spool_retry_after = 0.0
+        self._spool_failures = 0
+        self._spool_retry_timer = None  # type: Optional[threading.Timer]
+        spool_dir = experiments.get("transport_spool_dir")
+        if spool_dir:
+            try:
+                self._spool = EnvelopeSpool(
+                    spool_dir,
+                    max_bytes=experiments.get("transport_spool_max_bytes")
+                    or DEFAULT_SPOOL_MAX_BYTES,
+                )
+            except SpoolLocked:
+                logger.warning(
+                    "Envelope spool %s is used by another process, "
+                    "keeping envelopes in memory",
+                    spool_dir,
+                )
+            except (IOError, OSError):
+                logger.warning(
+                    "Failed to open envelope spool %s, keeping envelopes in memory",
+                    spool_dir,
+                    exc_info=True,
+                )
+
         self._pool = self._make_pool(
             self.parsed_dsn,
             http_proxy=options["http_proxy"],
@@ -163,6 +253,10 @@ class HttpTransport(Transport):
 
         self.hub_cls = Hub
 
+        if self._spool is not None and len(self._spool):
+            logger.debug("Sending %s bytes of spooled envelopes", len(self._spool))
+            self._schedule_spool_drain()
+
     def record_lost_event(
         self,
         reason,  # type: str
@@ -204,15 +298,10 @@ class HttpTransport(Transport):
                 seconds=self._retry.get_retry_after(response) or 60
             )
 
-    def _send_request(
-        self,
-        body,  # type: bytes
-        headers,  # type: Dict[str, str]
-        endpoint_type="store",  # type: EndpointType
-        envelope=None,  # type: Optional[Envelope]
+    def _make_record_loss(
+        self, envelope  # type: Optional[Envelope]
     ):
-        # type: (...) -> None
-
+        # type: (...) -> Callable[[str], None]
         def record_loss(reason):
             # type: (str) -> None
             if envelope is None:
@@ -221,46 +310,80 @@ class HttpTransport(Transport):
                 for item in envelope.items:
                     self.record_lost_event(reason, item=item)
 
+        return record_loss
+
+    def _get_request_headers(
+        self, headers  # type: Dict[str, str]
+    ):
+        # type: (...) -> Dict[str, str]
         headers.update(
             {
                 "User-Agent": str(self._auth.client),
                 "X-Sentry-Auth": str(self._auth.to_header()),
             }
         )
+        return headers
+
+    def _handle_response(
+        self,
+        response,  # type: Any
+        record_loss,  # type: Callable[[str], None]
+    ):
+        # type: (...) -> None
+        self._update_rate_limits(response)
+
+        if response.status == 429:
+            # if we hit a 429.  Something was rate limited but we already
+            # acted on this in `self._update_rate_limits`.  Note that we
+            # do not want to record event loss here as we will have recorded
+            # an outcome in relay already.
+            self.on_dropped_event("status_429")
+            pass
+
+        elif response.status >= 300 or response.status < 200:
+            logger.error(
+                "Unexpected status code: %s (body: %s)",
+                response.status,
+                response.data,
+            )
+            self.on_dropped_event("status_{}".format(response.status))
+            record_loss("network_error")
+
+    def _send_request(
+        self,
+        body,  # type: bytes
+        headers,  # type: Dict[str, str]
+        endpoint_type="store",  # type: EndpointType
+        envelope=None,  # type: Optional[Envelope]
+        record_network_errors=True,  # type: bool
+    ):
+        # type: (...) -> int
+        record_loss = self._make_record_loss(envelope)
+
         try:
             response = self._pool.request(
                 "POST",
                 str(self._auth.get_api_url(endpoint_type)),
                 body=body,
-                headers=headers,
+                headers=self._get_request_headers(headers),
             )
         except Exception:
-            self.on_dropped_event("network")
-            record_loss("network_error")
+            if record_network_errors:
+                self.on_dropped_event("network")
+                record_loss("network_error")
             raise
 
+        if not record_network_errors and _is_retryable_status(response.status):
+            # The caller sends the data again, nothing is lost (yet).
+            record_loss = _ignore_loss
+
         try:
-            self._update_rate_limits(response)
-
-            if response.status == 429:
-                # if we hit a 429.  Something was rate limited but we already
-                # acted on this in `self._update_rate_limits`.  Note that we
-                # do not want to record event loss here as we will have recorded
-                # an outcome in relay already.
-                self.on_dropped_event("status_429")
-                pass
-
-            elif response.status >= 300 or response.status < 200:
-                logger.error(
-                    "Unexpected status code: %s (body: %s)",
-                    response.status,
-                    response.data,
-                )
-                self.on_dropped_event("status_{}".format(response.status))
-                record_loss("network_error")
+            self._handle_response(response, record_loss)
         finally:
             response.close()
 
+        return response.status
+
     def on_dropped_event(self, reason):
         # type: (str) -> None
         return None
@@ -277,6 +400,18 @@ class HttpTransport(Transport):
         self._discarded_events = defaultdict(int)
         self._last_client_report_sent = time.time()
 
+        aggregator = self.local_aggregator
+        if aggregator is not None:
+            with capture_internal_exceptions():
+                published = [
+                    [category, reason, quantity]
+                    for (category, reason), quantity in discarded_events.items()
+                ]
+                if published and aggregator.publish_discarded_events(published):
+                    return None
+                for category, reason, quantity in aggregator.take_discarded_events():
+                    discarded_events[category, reason] += quantity
+
         if not discarded_events:
             return None
 
@@ -311,11 +446,29 @@ class HttpTransport(Transport):
 
         return _disabled(category) or _disabled(None)
 
-    def _send_event(
-        self, event  # type: Event
+    def is_rate_limited(
+        self, data_category  # type: str
     ):
-        # type: (...) -> None
+        # type: (...) -> bool
+        return self._check_disabled(data_category)
+
+    def queue_load(self):
+        # type: () -> float
+        # With batching, the backlog waits in the pending envelopes while
+        # the worker's queue holds a single drain job.
+        pending = len(self._pending_envelopes) / float(
+            self.options["transport_queue_size"] or 1
+        )
+        return min(1.0, self._worker.load + pending)
 
+    def _prepare_event(
+        self, event  # type: Event
+    ):
+        # type: (...) -> Optional[bytes]
+        """
+        Check rate limits and compress the event. Returns `None` if the event
+        should not be sent.
+        """
         if self._check_disabled("error"):
             self.on_dropped_event("self_rate_limits")
             self.record_lost_event("ratelimit_backoff", data_category="error")
@@ -336,16 +489,30 @@ class HttpTransport(Transport):
                 self.parsed_dsn.host,
             )
         )
+        return body.getvalue()
+
+    def _send_event(
+        self, event  # type: Event
+    ):
+        # type: (...) -> None
+        body = self._prepare_event(event)
+        if body is None:
+            return None
+
         self._send_request(
-            body.getvalue(),
+            body,
             headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
         )
         return None
 
-    def _send_envelope(
+    def _prepare_envelope(
         self, envelope  # type: Envelope
     ):
-        # type: (...) -> None
+        # type: (...) -> Optional[Tuple[Envelope, bytes]]
+        """
+        Drop items which are rate limited, attach pending client reports and
+        compress the envelope. Returns `None` if there is nothing left to send.
+        """
 
         # remove all items from the envelope which are over quota
         new_items = []
@@ -384,17 +551,237 @@ class HttpTransport(Transport):
             self.parsed_dsn.project_id,
             self.parsed_dsn.host,
         )
+        return envelope, body.getvalue()
 
-        self._send_request(
-            body.getvalue(),
+    def _send_envelope(
+        self,
+        envelope,  # type: Envelope
+        record_network_errors=True,  # type: bool
+    ):
+        # type: (...) -> Optional[int]
+        """
+        Returns the response's status code, or `None` if nothing was sent
+        because everything in the envelope was rate limited.
+        """
+        prepared = self._prepare_envelope(envelope)
+        if prepared is None:
+            return None
+
+        envelope, body = prepared
+        return self._send_request(
+            body,
             headers={
                 "Content-Type": "application/x-sentry-envelope",
                 "Content-Encoding": "gzip",
             },
             endpoint_type="envelope",
             envelope=envelope,
+            record_network_errors=record_network_errors,
         )
-        return None
+
+    def _drain_spool(self):
+        # type: () -> None
+        spool = self._spool
+        try:
+            while spool is not None:
+                payload = spool.peek()
+                if payload is None:
+                    return
+
+                try:
+                    envelope = Envelope.deserialize(payload)
+                except Exception:
+                    logger.warning(
+                        "Dropping unreadable envelope from spool", exc_info=True
+                    )
+                    spool.commit()
+                    continue
+
+                try:
+                    # Envelopes that fail to send stay in the spool, so this
+                    # is not a lost event (yet).
+                    status = self._send_envelope(envelope, record_network_errors=False)
+                except Exception:
+                    logger.warning("Failed to send spooled envelope", exc_info=True)
+                    self._retry_spool_drain_later()
+                    return
+
+                if status is not None and _is_retryable_status(status):
+                    logger.warning(
+                        "Spooled envelope was answered with status %s", status
+                    )
+                    self._retry_spool_drain_later()
+                    return
+
+                # Sent, or rejected for good.
+                self._spool_failures = 0
+                spool.commit()
+                with capture_internal_exceptions():
+                    self._flush_client_reports()
+        finally:
+            with self._spool_lock:
+                self._spool_draining = False
+
+    def _retry_spool_drain_later(self):
+        # type: () -> None
+        interval = min(
+            _SPOOL_RETRY_INTERVAL * 2**self._spool_failures, _SPOOL_MAX_RETRY_INTERVAL
+        )
+        self._spool_failures += 1
+        self._spool_retry_after = time.time() + interval
+        logger.debug("Sending spooled envelopes again in %ss", interval)
+
+        with self._spool_lock:
+            if self._spool_retry_timer is not None:
+                self._spool_retry_timer.cancel()
+            self._spool_retry_timer = threading.Timer(
+                interval, self._schedule_spool_drain, kwargs={"force": True}
+            )
+            self._spool_retry_timer.daemon = True
+            self._spool_retry_timer.start()
+
+    def _schedule_spool_drain(self, force=False):
+        # type: (bool) -> None
+        with self._spool_lock:
+            if self._spool_draining:
+                return
+            if not force and time.time() < self._spool_retry_after:
+                return
+            self._spool_draining = True
+
+        hub = self.hub_cls.current
+
+        def drain_spool_wrapper():
+            # type: () -> None
+            with hub:
+                self._drain_spool()
+
+        if not self._worker.submit(drain_spool_wrapper):
+            # The envelopes are safe on disk, try again later.
+            with self._spool_lock:
+                self._spool_draining = False
+            self._retry_spool_drain_later()
+
+    def _use_spool(self):
+        # type: () -> bool
+        # The spool can only be used by the process that opened it, forked
+        # processes keep envelopes in memory.
+        return self._spool is not None and self._spool.pid == os.getpid()
+
+    def _capture_envelope_spooled(
+        self, envelope  # type: Envelope
+    ):
+        # type: (...) -> None
+        assert self._spool is not None
+        if not self._spool.append(envelope.serialize()):
+            self.on_dropped_event("full_queue")
+            for item in envelope.items:
+                self.record_lost_event("queue_overflow", item=item)
+            return
+
+        self._schedule_spool_drain()
+
+    def _send_envelope_batch(
+        self, envelopes  # type: List[Envelope]
+    ):
+        # type: (...) -> None
+        """
+        Send envelopes that were drained from the queue together.
+
+        Envelopes without headers that only hold sessions and client reports
+        are merged into as few envelopes as possible. Everything else still
+        goes out as one request per envelope over the pooled connection, as
+        the envelope endpoint accepts a single envelope per request. Rate
+        limits are checked again for every envelope, so that limits received
+        in the middle of a batch apply to the rest of it.
+        """
+        merged = None  # type: Optional[Envelope]
+        for envelope in envelopes:
+            mergeable = not envelope.headers and all(
+                item.type in _MERGEABLE_ITEM_TYPES for item in envelope.items
+            )
+            if not mergeable:
+                self._send_envelope(envelope)
+                continue
+
+            if (
+                merged is not None
+                and len(merged.items) + len(envelope.items) > _MAX_MERGED_ENVELOPE_ITEMS
+            ):
+                self._send_envelope(merged)
+                merged = None
+
+            if merged is None:
+                merged = Envelope()
+            merged.items.extend(envelope.items)
+
+        if merged is not None:
+            self._send_envelope(merged)
+
+    def _drain_envelope_batches(self):
+        # type: () -> None
+        assert self._batch_size is not None
+        with self._batch_condition:
+            if (
+                self._batch_linger > 0
+                and not self._batch_flushing
+                and len(self._pending_envelopes) < self._batch_size
+            ):
+                self._batch_condition.wait(self._batch_linger)
+
+        while True:
+            with self._batch_condition:
+                pending = self._pending_envelopes
+                batch = [
+                    pending.popleft()
+                    for _ in range(min(self._batch_size, len(pending)))
+                ]
+                if not batch:
+                    self._batch_scheduled = False
+                    self._batch_flushing = False
+                    return
+
+            with capture_internal_exceptions():
+                self._send_envelope_batch(batch)
+                self._flush_client_reports()
+
+    def _capture_envelope_batched(
+        self, envelope  # type: Envelope
+    ):
+        # type: (...) -> None
+        assert self._batch_size is not None
+        with self._batch_condition:
+            if len(self._pending_envelopes) >= self.options["transport_queue_size"]:
+                self.on_dropped_event("full_queue")
+                for item in envelope.items:
+                    self.record_lost_event("queue_overflow", item=item)
+                return
+
+            self._pending_envelopes.append(envelope)
+            if len(self._pending_envelopes) >= self._batch_size:
+                self._batch_condition.notify()
+
+            if self._batch_scheduled:
+                return
+            self._batch_scheduled = True
+
+        hub = self.hub_cls.current
+
+        def drain_envelopes_wrapper():
+            # type: () -> None
+            with hub:
+                self._drain_envelope_batches()
+
+        if not self._worker.submit(drain_envelopes_wrapper):
+            with self._batch_condition:
+                self._batch_scheduled = False
+                dropped = list(self._pending_envelopes)
+                self._pending_envelopes.clear()
+
+            self.on_dropped_event("full_queue")
+            for dropped_envelope in dropped:
+                for item in dropped_envelope.items:
+                    self.record_lost_event("queue_overflow", item=item)
 
     def _get_pool_options(self, ca_certs):
         # type: (Optional[Any]) -> Dict[str, Any]
@@ -415,15 +802,13 @@ class HttpTransport(Transport):
                 return True
         return False
 
-    def _make_pool(
+    def _get_proxy(
         self,
         parsed_dsn,  # type: Dsn
         http_proxy,  # type: Optional[str]
         https_proxy,  # type: Optional[str]
-        ca_certs,  # type: Optional[Any]
-        proxy_headers,  # type: Optional[Dict[str, str]]
     ):
-        # type: (...) -> Union[PoolManager, ProxyManager]
+        # type: (...) -> Optional[str]
         proxy = None
         no_proxy = self._in_no_proxy(parsed_dsn)
 
@@ -435,6 +820,18 @@ class HttpTransport(Transport):
         if not proxy and (http_proxy != ""):
             proxy = http_proxy or (not no_proxy and getproxies().get("http"))
 
+        return proxy or None
+
+    def _make_pool(
+        self,
+        parsed_dsn,  # type: Dsn
+        http_proxy,  # type: Optional[str]
+        https_proxy,  # type: Optional[str]
+        ca_certs,  # type: Optional[Any]
+        proxy_headers,  # type: Optional[Dict[str, str]]
+    ):
+        # type: (...) -> Union[PoolManager, ProxyManager]
+        proxy = self._get_proxy(parsed_dsn, http_proxy, https_proxy)
         opts = self._get_pool_options(ca_certs)
 
         if proxy:
@@ -449,6 +846,11 @@ class HttpTransport(Transport):
         self, event  # type: Event
     ):
         # type: (...) -> None
+        if self._use_spool():
+            envelope = Envelope()
+            envelope.add_event(event)
+            return self._capture_envelope_spooled(envelope)
+
         hub = self.hub_cls.current
 
         def send_event_wrapper():
@@ -466,6 +868,12 @@ class HttpTransport(Transport):
         self, envelope  # type: Envelope
     ):
         # type: (...) -> None
+        if self._use_spool():
+            return self._capture_envelope_spooled(envelope)
+
+        if self._batch_size:
+            return self._capture_envelope_batched(envelope)
+
         hub = self.hub_cls.current
 
         def send_envelope_wrapper():
@@ -489,6 +897,17 @@ class HttpTransport(Transport):
         logger.debug("Flushing HTTP transport")
 
         if timeout > 0:
+            if self._use_spool():
+                self._schedule_spool_drain(force=True)
+
+            if self._batch_size:
+                # Stop waiting for more envelopes to fill the current batch.
+                # The drain resets the flag once it is done.
+                with self._batch_condition:
+                    if self._batch_scheduled:
+                        self._batch_flushing = True
+                        self._batch_condition.notify()
+
             self._worker.submit(lambda: self._flush_client_reports(force=True))
             self._worker.flush(timeout, callback)
 
@@ -496,6 +915,24 @@ class HttpTransport(Transport):
         # type: () -> None
         logger.debug("Killing HTTP transport")
         self._worker.kill()
+        if self._batch_size:
+            with self._batch_condition:
+                dropped = list(self._pending_envelopes)
+                self._pending_envelopes.clear()
+                self._batch_condition.notify()
+
+            if dropped:
+                self.on_dropped_event("full_queue")
+            for dropped_envelope in dropped:
+                for item in dropped_envelope.items:
+                    self.record_lost_event("queue_overflow", item=item)
+        if self._use_spool():
+            with self._spool_lock:
+                if self._spool_retry_timer is not None:
+                    self._spool_retry_timer.cancel()
+            # Releases the lock on the spool directory, pending envelopes are
+            # sent by the next process using it.
+            self._spool.close()  # type: ignore
 
 
 class _FunctionTransport(Transport):
@@ -521,6 +958,17 @@ def make_transport(options):
     # If no transport is given, we use the http transport class
     if ref_transport is None:
         transport_cls = HttpTransport  # type: Type[Transport]
+        if options.get("_experiments", {}).get("async_transport"):
+            try:
+                from sentry_sdk.async_transport import AsyncHttpTransport
+            except ImportError as e:
+                logger.warning(
+                    "Cannot use the async transport, falling back to the default "
+                    "HTTP transport: %s",
+                    e,
+                )
+            else:
+                transport_cls = AsyncHttpTransport
     elif isinstance(ref_transport, Transport):
         return ref_transport
     elif isinstance(ref_transport, type) and issubclass(ref_transport, Transport):
@@ -3,13 +3,15 @@ import json
 import linecache
 import logging
 import math
+import mmap
 import os
 import re
 import subprocess
 import sys
 import threading
 import time
-from collections import namedtuple
+import tokenize
+from collections import namedtuple, OrderedDict
 from decimal import Decimal
 from numbers import Real
 
@@ -458,6 +460,232 @@ def iter_stacks(tb):
         tb_ = tb_.tb_next
 
 
+DEFAULT_SOURCE_CACHE_BYTES = 10 * 1024 * 1024
+
+# Every mapped file keeps a file descriptor and a mapping open, which the byte
+# budget does not see.
+DEFAULT_SOURCE_CACHE_MMAPS = 64
+
+
+class _SourceLines(object):
+    """
+    Source of a file together with the offsets at which its lines start, so
+    single lines can be sliced out without splitting the whole file.
+    """
+
+    __slots__ = ("source", "offsets", "encoding", "size")
+
+    def __init__(
+        self,
+        source,  # type: Any
+        encoding=None,  # type: Optional[str]
+    ):
+        # type: (...) -> None
+        # `source` is either a string or, if `encoding` is given, a bytes-like
+        # object such as a mmap of the file.
+        self.source = source
+        self.encoding = encoding
+
+        newline = "\n" if encoding is None else b"\n"
+        offsets = [0]
+        find = source.find
+        i = find(newline)
+        while i != -1:
+            offsets.append(i + 1)
+            i = find(newline, i + 1)
+        if offsets[-1] != len(source):
+            offsets.append(len(source))
+        self.offsets = offsets
+
+        # A mmap is not part of the Python heap, only count the offsets.
+        self.size = 8 * len(offsets)
+        if encoding is None:
+            self.size += len(source)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.offsets) - 1
+
+    @property
+    def is_mapped(self):
+        # type: () -> bool
+        return isinstance(self.source, mmap.mmap)
+
+    def close(self):
+        # type: () -> None
+        if self.is_mapped:
+            self.source.close()
+
+    def lines(self, start, stop):
+        # type: (int, int) -> List[str]
+        offsets = self.offsets
+        try:
+            rv = [
+                self.source[offsets[i] : offsets[i + 1]]
+                for i in range(max(start, 0), min(stop, len(self)))
+            ]
+        except ValueError:
+            # The mmap was closed because the entry got evicted meanwhile.
+            return []
+        if self.encoding is not None:
+            rv = [line.decode(self.encoding, "replace") for line in rv]
+        return rv
+
+
+class SourceContextCache(object):
+    """
+    Size-bounded LRU cache of source files used for the context lines of
+    stack frames.
+
+    Files are keyed by their name and modification time, so changed files
+    are read again. Sources returned by module loaders are keyed by module
+    as well. Files that only `linecache` knows about are not cached here.
+
+    With `use_mmap` at most `max_mmaps` files are kept mapped, evicted files
+    are unmapped.
+    """
+
+    def __init__(
+        self,
+        max_bytes=DEFAULT_SOURCE_CACHE_BYTES,  # type: int
+        use_mmap=False,  # type: bool
+        max_mmaps=DEFAULT_SOURCE_CACHE_MMAPS,  # type: int
+    ):
+        # type: (...) -> None
+        self.max_bytes = max_bytes
+        self.use_mmap = use_mmap
+        self.max_mmaps = max_mmaps
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._mmaps = 0
+        self._entries = OrderedDict()  # type: OrderedDict[Any, _SourceLines]
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        # type: () -> float
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+    def configure(
+        self,
+        max_bytes=None,  # type: Optional[int]
+        use_mmap=None,  # type: Optional[bool]
+    ):
+        # type: (...) -> None
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if use_mmap is not None:
+            self.use_mmap = use_mmap
+        self.clear()
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            for entry in self._entries.values():
+                entry.close()
+            self._entries.clear()
+            self._size = 0
+            self._mmaps = 0
+
+    def _remove(self, entry):
+        # type: (_SourceLines) -> None
+        self._size -= entry.size
+        if entry.is_mapped:
+            self._mmaps -= 1
+        entry.close()
+
+    def get(
+        self,
+        filename,  # type: str
+        loader=None,  # type: Optional[Any]
+        module=None,  # type: Optional[str]
+    ):
+        # type: (...) -> Optional[_SourceLines]
+        try:
+            mtime = os.stat(filename).st_mtime  # type: Optional[float]
+        except (OSError, IOError, TypeError, ValueError):
+            mtime = None
+
+        has_loader = loader is not None and hasattr(loader, "get_source")
+        key = (filename, mtime, module if has_loader else None)
+
+        if has_loader or mtime is not None:
+            with self._lock:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+
+        entry = None
+        if has_loader:
+            try:
+                source_str = loader.get_source(module)  # type: ignore
+            except (ImportError, IOError):
+                source_str = None
+            if source_str is not None:
+                entry = _SourceLines(source_str)
+
+        if entry is None and mtime is not None:
+            try:
+                entry = self._read_file(filename)
+            except (OSError, IOError, SyntaxError, ValueError):
+                entry = None
+
+        if entry is None:
+            try:
+                lines = linecache.getlines(filename)
+            except (OSError, IOError):
+                return None
+            return _SourceLines("".join(lines))
+
+        if entry.size <= self.max_bytes:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._remove(old)
+                self._entries[key] = entry
+                self._size += entry.size
+                if entry.is_mapped:
+                    self._mmaps += 1
+                while self._size > self.max_bytes or self._mmaps > self.max_mmaps:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._remove(evicted)
+
+        return entry
+
+    def _read_file(self, filename):
+        # type: (str) -> _SourceLines
+        if self.use_mmap and self.max_mmaps > 0:
+            with open(filename, "rb") as f:
+                try:
+                    source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files cannot be mapped.
+                    source = None
+            if source is not None:
+                if PY2:
+                    encoding = "utf-8"
+                else:
+                    encoding = tokenize.detect_encoding(
+                        iter(source[:1024].splitlines(True)).__next__
+                    )[0]
+                return _SourceLines(source, encoding=encoding)
+
+        if PY2:
+            with open(filename, "rU") as f:
+                return _SourceLines(f.read())
+
+        with tokenize.open(filename) as f:
+            return _SourceLines(f.read())
+
+
+source_context_cache = SourceContextCache()
+
+
 def get_lines_from_file(
     filename,  # type: str
     lineno,  # type: int
@@ -466,40 +694,28 @@ def get_lines_from_file(
 ):
     # type: (...) -> Tuple[List[Annotated[str]], Optional[Annotated[str]], List[Annotated[str]]]
     context_lines = 5
-    source = None
-    if loader is not None and hasattr(loader, "get_source"):
-        try:
-            source_str = loader.get_source(module)  # type: Optional[str]
-        except (ImportError, IOError):
-            source_str = None
-        if source_str is not None:
-            source = source_str.splitlines()
-
-    if source is None:
-        try:
-            source = linecache.getlines(filename)
-        except (OSError, IOError):
-            return [], None, []
+    source = source_context_cache.get(filename, loader, module)
 
     if not source:
         return [], None, []
 
+    if not 0 <= lineno < len(source):
+        # the file may have changed since it was loaded into memory
+        return [], None, []
+
     lower_bound = max(0, lineno - context_lines)
     upper_bound = min(lineno + 1 + context_lines, len(source))
 
-    try:
-        pre_context = [
-            strip_string(line.strip("\r\n")) for line in source[lower_bound:lineno]
-        ]
-        context_line = strip_string(source[lineno].strip("\r\n"))
-        post_context = [
-            strip_string(line.strip("\r\n"))
-            for line in source[(lineno + 1) : upper_bound]
-        ]
-        return pre_context, context_line, post_context
-    except IndexError:
-        # the file may have changed since it was loaded into memory
+    lines = [
+        strip_string(line.strip("\r\n"))
+        for line in source.lines(lower_bound, upper_bound)
+    ]
+    if not lines:
         return [], None, []
+    pre_context = lines[: lineno - lower_bound]
+    context_line = lines[lineno - lower_bound]
+    post_context = lines[lineno - lower_bound + 1 :]
+    return pre_context, context_line, post_context
 
 
 def get_source_context(
@@ -1,9 +1,9 @@
 import os
 import threading
 
-from time import sleep, time
+from collections import deque
+from time import sleep
 from sentry_sdk._compat import check_thread_support
-from sentry_sdk._queue import Queue, FullError
 from sentry_sdk.utils import logger
 from sentry_sdk.consts import DEFAULT_QUEUE_SIZE
 
@@ -11,6 +11,7 @@ from sentry_sdk._types import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from typing import Any
+    from typing import Deque
     from typing import Optional
     from typing import Callable
 
@@ -19,10 +20,26 @@ _TERMINATOR = object()
 
 
 class BackgroundWorker(object):
+    """
+    Runs submitted callbacks in order on a background thread.
+
+    Submitting is kept cheap because it happens on the application's
+    threads: callbacks are appended to a deque (which is thread-safe for
+    appends and pops) and the worker thread is only woken up through an
+    event when it is idle. The thread is not checked for liveness on every
+    submit, only whether it was started by the current process. It is
+    never expected to die on its own as it only exits when killed.
+
+    The queue size is a soft limit, concurrent submits can overshoot it by
+    the number of submitting threads.
+    """
+
     def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
         # type: (int) -> None
         check_thread_support()
-        self._queue = Queue(queue_size)  # type: Queue
+        self._queue = deque()  # type: Deque[Any]
+        self._queue_size = queue_size
+        self._wakeup = threading.Event()
         self._lock = threading.Lock()
         self._thread = None  # type: Optional[threading.Thread]
         self._thread_for_pid = None  # type: Optional[int]
@@ -41,30 +58,43 @@ class BackgroundWorker(object):
         if not self.is_alive:
             self.start()
 
-    def _timed_queue_join(self, timeout):
-        # type: (float) -> bool
-        deadline = time() + timeout
+    def _put(self, callback):
+        # type: (Any) -> None
         queue = self._queue
-
-        queue.all_tasks_done.acquire()
-
-        try:
-            while queue.unfinished_tasks:
-                delay = deadline - time()
-                if delay <= 0:
-                    return False
-                queue.all_tasks_done.wait(timeout=delay)
-
-            return True
-        finally:
-            queue.all_tasks_done.release()
+        queue.append(callback)
+        if queue is not self._queue:
+            # Raced with `kill`, which appends its terminator after replacing
+            # the queue, so the callback may be behind it. Move it over to
+            # the new queue unless the killed thread already took it.
+            try:
+                queue.remove(callback)
+            except ValueError:
+                pass
+            else:
+                self._queue.append(callback)
+        self._wake(self._wakeup)
+
+    @staticmethod
+    def _wake(wakeup):
+        # type: (threading.Event) -> None
+        # Only pay for the event's lock if the worker may be waiting on it.
+        # The worker clears the event before checking the queue a last time,
+        # so an append that sees the event set is always picked up.
+        if not wakeup.is_set():
+            wakeup.set()
 
     def start(self):
         # type: () -> None
         with self._lock:
             if not self.is_alive:
+                if self._thread_for_pid != os.getpid():
+                    # The event's lock may have been held by another thread
+                    # at the time of a fork, so it cannot be reused.
+                    self._wakeup = threading.Event()
                 self._thread = threading.Thread(
-                    target=self._target, name="raven-sentry.BackgroundWorker"
+                    target=self._target,
+                    args=(self._queue, self._wakeup),
+                    name="raven-sentry.BackgroundWorker",
                 )
                 self._thread.daemon = True
                 self._thread.start()
@@ -79,11 +109,13 @@ class BackgroundWorker(object):
         logger.debug("background worker got kill request")
         with self._lock:
             if self._thread:
-                try:
-                    self._queue.put_nowait(_TERMINATOR)
-                except FullError:
-                    logger.debug("background worker queue full, kill failed")
-
+                # The terminator is for the killed thread only, a restarted
+                # one gets its own queue and event.
+                queue, wakeup = self._queue, self._wakeup
+                self._queue = deque()
+                self._wakeup = threading.Event()
+                queue.append(_TERMINATOR)
+                self._wake(wakeup)
                 self._thread = None
                 self._thread_for_pid = None
 
@@ -97,37 +129,52 @@ class BackgroundWorker(object):
 
     def _wait_flush(self, timeout, callback):
         # type: (float, Optional[Any]) -> None
+        # Callbacks run in order, so everything submitted before the flush
+        # is done once the flush marker ran.
+        flushed = threading.Event()
+        self._put(flushed.set)
+
         initial_timeout = min(0.1, timeout)
-        if not self._timed_queue_join(initial_timeout):
-            pending = self._queue.qsize() + 1
+        if not flushed.wait(initial_timeout):
+            pending = len(self._queue)
             logger.debug("%d event(s) pending on flush", pending)
             if callback is not None:
                 callback(pending, timeout)
 
-            if not self._timed_queue_join(timeout - initial_timeout):
-                pending = self._queue.qsize() + 1
+            if not flushed.wait(timeout - initial_timeout):
+                pending = len(self._queue)
                 logger.error("flush timed out, dropped %s events", pending)
 
+    @property
+    def load(self):
+        # type: () -> float
+        """How full the queue is, between 0 and 1."""
+        return min(1.0, len(self._queue) / float(self._queue_size or 1))
+
     def submit(self, callback):
         # type: (Callable[[], None]) -> bool
-        self._ensure_thread()
-        try:
-            self._queue.put_nowait(callback)
-            return True
-        except FullError:
+        if self._thread_for_pid != os.getpid():
+            self.start()
+        if len(self._queue) >= self._queue_size:
             return False
+        self._put(callback)
+        return True
 
-    def _target(self):
-        # type: () -> None
+    def _target(self, queue, wakeup):
+        # type: (Deque[Any], threading.Event) -> None
         while True:
-            callback = self._queue.get()
             try:
-                if callback is _TERMINATOR:
-                    break
-                try:
-                    callback()
-                except Exception:
-                    logger.error("Failed processing job", exc_info=True)
-            finally:
-                self._queue.task_done()
+                callback = queue.popleft()
+            except IndexError:
+                wakeup.clear()
+                if not queue:
+                    wakeup.wait()
+                continue
+
+            if callback is _TERMINATOR:
+                break
+            try:
+                callback()
+            except Exception:
+                logger.error("Failed processing job", exc_info=True)
             sleep(0)
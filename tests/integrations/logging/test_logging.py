@@ -1,10 +1,17 @@
 # coding: utf-8
+import gc
+import subprocess
 import sys
+import threading
+import weakref
 
 import pytest
 import logging
 import warnings
+from textwrap import dedent
 
+import sentry_sdk
+from sentry_sdk import Hub
 from sentry_sdk.integrations.logging import LoggingIntegration, ignore_logger
 
 other_logger = logging.getLogger("testfoo")
@@ -207,6 +214,47 @@ def test_logging_captured_warnings(sentry_init, capture_events, recwarn):
     assert str(recwarn[0].message) == "third"
 
 
+def test_breadcrumbs_do_not_keep_records(sentry_init, capture_events):
+    sentry_init(integrations=[LoggingIntegration()], default_integrations=False)
+    events = capture_events()
+
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.info("bread %s", "crumb", exc_info=True, extra=dict(foo=42))
+
+    # Neither the record nor its traceback is kept until the breadcrumb is
+    # built.
+    (payload,) = [entry[0] for entry in Hub.current.scope._breadcrumbs._entries()]
+    assert payload == ("info", logger.name, "bread crumb", {"foo": 42})
+
+    logger.critical("lol")
+    (event,) = events
+    (crumb,) = event["breadcrumbs"]["values"]
+    assert crumb["message"] == "bread crumb"
+    assert crumb["level"] == "info"
+    assert crumb["category"] == logger.name
+    assert crumb["data"] == {"foo": 42}
+
+
+def test_breadcrumb_hint_has_record(sentry_init):
+    hints = []
+
+    def before_breadcrumb(crumb, hint):
+        hints.append(hint)
+        return crumb
+
+    sentry_init(
+        integrations=[LoggingIntegration()],
+        default_integrations=False,
+        before_breadcrumb=before_breadcrumb,
+    )
+
+    logger.info("bread")
+    (hint,) = hints
+    assert hint["log_record"].getMessage() == "bread"
+
+
 def test_ignore_logger(sentry_init, capture_events):
     sentry_init(integrations=[LoggingIntegration()], default_integrations=False)
     events = capture_events()
@@ -232,3 +280,204 @@ def test_ignore_logger_wildcard(sentry_init, capture_events):
 
     (event,) = events
     assert event["logentry"]["message"] == "hi"
+
+
+def test_ignore_logger_after_recording(sentry_init, capture_events):
+    sentry_init(integrations=[LoggingIntegration()], default_integrations=False)
+    events = capture_events()
+
+    cached_logger = logging.getLogger("testcached")
+    cached_logger.error("hi")
+    assert len(events) == 1
+
+    ignore_logger("testcached")
+    cached_logger.error("bye")
+    assert len(events) == 1
+
+
+def test_root_handler(tmpdir):
+    app = tmpdir.join("app.py")
+    app.write(
+        dedent(
+            """
+    import logging
+    from sentry_sdk import init, transport
+    from sentry_sdk.integrations.logging import LoggingIntegration
+
+    def send_event(self, event):
+        print("event: " + event["logentry"]["message"])
+
+    transport.HttpTransport._send_event = send_event
+
+    original_callhandlers = logging.Logger.callHandlers
+    init(
+        "http://foobar@localhost/123",
+        integrations=[LoggingIntegration(root_handler=True)],
+    )
+    assert logging.Logger.callHandlers is original_callhandlers
+
+    logger = logging.getLogger("app")
+    logger.error("propagated")
+    logger.propagate = False
+    logger.error("not propagated")
+    """
+        )
+    )
+
+    output = subprocess.check_output([sys.executable, str(app)])
+
+    assert b"event: propagated" in output
+    assert b"not propagated" not in output
+
+
+def test_background_events(sentry_init, capture_events):
+    integration = LoggingIntegration(background_events=True)
+    sentry_init(integrations=[integration], default_integrations=False)
+    events = capture_events()
+
+    value = "before"
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        with sentry_sdk.push_scope() as scope:
+            scope.set_tag("request", "1")
+            logger.exception("error %s", value, extra={"foo": 42})
+    value = "after"  # noqa: F841
+
+    logger.error("first", exc_info=True)
+    logger.error("second")
+
+    integration._handler.flush()
+    error, with_stack, without_stack = events
+
+    assert error["level"] == "error"
+    assert error["logger"] == __name__
+    assert error["logentry"] == {"message": "error %s", "params": ["before"]}
+    assert error["extra"] == {"foo": 42}
+    assert error["tags"] == {"request": "1"}
+    (exception,) = error["exception"]["values"]
+    assert exception["type"] == "ZeroDivisionError"
+    assert exception["mechanism"] == {"type": "logging", "handled": True}
+    (frame,) = exception["stacktrace"]["frames"]
+    assert frame["function"] == "test_background_events"
+    assert frame["vars"]["value"] == "'before'"
+
+    assert "tags" not in with_stack
+    assert with_stack["threads"]["values"][0]["stacktrace"]["frames"]
+    assert "threads" not in without_stack
+
+
+@pytest.mark.parametrize("keep_exception", [False, True])
+def test_background_events_do_not_keep_traceback(
+    sentry_init, capture_events, keep_exception
+):
+    class Marker(object):
+        pass
+
+    class CustomError(Exception):
+        pass
+
+    # Log capturing by pytest would keep the record alive.
+    no_capture_logger = logging.getLogger("no_capture")
+    no_capture_logger.propagate = False
+
+    hints = []
+
+    def before_send(event, hint):
+        hints.append(hint)
+        return event
+
+    integration = LoggingIntegration(background_events=True)
+    sentry_init(
+        integrations=[integration],
+        default_integrations=False,
+        before_send=before_send,
+        # The marker is only reachable through the original frame.
+        include_local_variables=False,
+    )
+    events = capture_events()
+
+    logger.error("start worker")
+    integration._handler.flush()
+    del events[:], hints[:]
+
+    # Keep the worker busy until the traceback had a chance to be collected.
+    release = threading.Event()
+    integration._handler._worker.submit(release.wait)
+
+    def fail():
+        marker = Marker()  # noqa: F841
+        raise CustomError("failed")
+
+    kept = []
+
+    def log_error():
+        try:
+            fail()
+        except CustomError as e:
+            marker = e.__traceback__.tb_next.tb_frame.f_locals["marker"]
+            no_capture_logger.exception("error")
+            if keep_exception:
+                kept.append(e)
+            return weakref.ref(marker)
+
+    marker_ref = log_error()
+
+    gc.collect()
+    assert (marker_ref() is None) is not keep_exception
+
+    release.set()
+    integration._handler.flush()
+
+    (event,) = events
+    (exception,) = event["exception"]["values"]
+    assert exception["value"] == "failed"
+    assert exception["stacktrace"]["frames"][-1]["function"] == "fail"
+
+    (hint,) = hints
+    assert hint["log_record"].exc_info is None
+    if keep_exception:
+        assert hint["exc_info"] == (CustomError, kept[0], kept[0].__traceback__)
+    else:
+        assert hint["exc_info"] == (CustomError, None, None)
+
+
+def test_background_events_last_event_id(sentry_init, capture_events):
+    integration = LoggingIntegration(background_events=True)
+    sentry_init(integrations=[integration], default_integrations=False)
+    events = capture_events()
+
+    logger.error("hi")
+    integration._handler.flush()
+
+    (event,) = events
+    assert sentry_sdk.last_event_id() == event["event_id"]
+
+
+@pytest.mark.parametrize("background_events", [False, True])
+def test_error_latency(sentry_init, benchmark, background_events):
+    integration = LoggingIntegration(background_events=background_events)
+    sentry_init(integrations=[integration], default_integrations=False)
+
+    @benchmark
+    def inner():
+        for _ in range(10):
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                logger.exception("error")
+        # Wait for the background thread, so that events don't pile up in
+        # its queue across rounds.
+        integration._handler.flush()
+
+
+@pytest.mark.parametrize("level", [logging.DEBUG, logging.INFO])
+def test_logging_throughput(sentry_init, benchmark, level):
+    # Debug records are below the integration's level, info records become
+    # breadcrumbs.
+    sentry_init(integrations=[LoggingIntegration()], default_integrations=False)
+
+    @benchmark
+    def inner():
+        for _ in range(1000):
+            logger.log(level, "message")
@@ -1,4 +1,5 @@
-from sentry_sdk import capture_message, start_transaction
+from sentry_sdk import Hub, capture_message, start_transaction
+from sentry_sdk.utils import MAX_STRING_LENGTH
 from sentry_sdk.integrations.redis import RedisIntegration
 
 from fakeredis import FakeStrictRedis
@@ -58,3 +59,139 @@ def test_redis_pipeline(sentry_init, capture_events, is_transaction):
         "redis.transaction": is_transaction,
         "redis.is_cluster": False,
     }
+
+
+def test_batch_commands(sentry_init, capture_events):
+    sentry_init(
+        integrations=[RedisIntegration(batch_commands=True)], traces_sample_rate=1.0
+    )
+    events = capture_events()
+
+    connection = FakeStrictRedis()
+    with start_transaction():
+        for i in range(5):
+            connection.get("foo{}".format(i))
+        connection.set("bar", 1)
+        connection.get("baz")
+
+    (event,) = events
+    gets, set_, get = event["spans"]
+
+    assert gets["description"] == "GET"
+    assert gets["tags"] == {"redis.command": "GET", "redis.is_cluster": False}
+    batch = gets["data"]["redis.batch"]
+    assert batch["count"] == 5
+    assert sum(batch["histogram"]["counts"]) == 5
+    assert batch["max_duration"] <= batch["total_duration"]
+
+    assert set_["description"] == "SET 'bar' 1"
+    assert get["description"] == "GET 'baz'"
+    assert "data" not in get
+
+
+def test_batch_commands_unsampled(sentry_init, capture_events):
+    sentry_init(
+        integrations=[RedisIntegration(batch_commands=True)], traces_sample_rate=1.0
+    )
+    events = capture_events()
+
+    connection = FakeStrictRedis()
+    with start_transaction(sampled=False) as transaction:
+        connection.get("foobar")
+        assert transaction._span_recorder is None
+        capture_message("hi")
+
+    (event,) = events
+    (crumb,) = event["breadcrumbs"]["values"]
+    assert crumb["message"] == "GET 'foobar'"
+    assert crumb["data"]["redis.key"] == "foobar"
+
+
+def test_max_description_bytes(sentry_init, capture_events):
+    sentry_init(
+        integrations=[RedisIntegration(max_description_bytes=20)],
+        traces_sample_rate=1.0,
+    )
+    events = capture_events()
+
+    connection = FakeStrictRedis()
+    with start_transaction():
+        connection.get("foo")
+        connection.get("b" * 20)
+        connection.set("bar", 1)
+
+    (event,) = events
+    assert [span["description"] for span in event["spans"]] == [
+        "GET 'foo'",
+        "GET",
+        "SET 'bar' 1",
+    ]
+
+
+def test_max_description_bytes_counts_encoded_size(sentry_init, capture_events):
+    sentry_init(
+        integrations=[RedisIntegration(max_description_bytes=20)],
+        traces_sample_rate=1.0,
+    )
+    events = capture_events()
+
+    connection = FakeStrictRedis()
+    with start_transaction():
+        # 13 characters, but 20 bytes.
+        connection.get("\xfc" * 7)
+        connection.get("a")
+
+    (event,) = events
+    assert [span["description"] for span in event["spans"]] == [
+        "GET '%s'" % ("\xfc" * 7),
+        "GET",
+    ]
+
+
+def test_unsampled_transaction_crumb_does_not_keep_args(sentry_init):
+    sentry_init(integrations=[RedisIntegration()], traces_sample_rate=1.0)
+
+    connection = FakeStrictRedis()
+    value = "x" * (MAX_STRING_LENGTH * 10)
+    with start_transaction(sampled=False):
+        connection.set("foo", value)
+
+        ((payload, _, _),) = Hub.current.scope._breadcrumbs._entries()
+        _, args, _ = payload
+        assert args[0] == "foo"
+        assert args[1] is not value
+        assert args[1] == value[:MAX_STRING_LENGTH]
+
+
+def test_unsampled_transaction(sentry_init, capture_events):
+    sentry_init(integrations=[RedisIntegration()], traces_sample_rate=1.0)
+    events = capture_events()
+
+    connection = FakeStrictRedis()
+    with start_transaction(sampled=False):
+        connection.get("foobar")
+        pipeline = connection.pipeline()
+        pipeline.get("foo")
+        pipeline.execute()
+        capture_message("hi")
+
+    (event,) = events
+    crumbs = event["breadcrumbs"]["values"]
+    assert [crumb["message"] for crumb in crumbs] == [
+        "GET 'foobar'",
+        "redis.pipeline.execute",
+    ]
+    assert crumbs[0]["data"]["redis.key"] == "foobar"
+
+
+@pytest.mark.parametrize("sampled", [True, False])
+def test_command_performance(sentry_init, benchmark, sampled):
+    sentry_init(integrations=[RedisIntegration()], traces_sample_rate=1.0)
+
+    connection = FakeStrictRedis()
+    with start_transaction(sampled=sampled):
+
+        @benchmark
+        def inner():
+            for _ in range(100):
+                connection.get("foobar")
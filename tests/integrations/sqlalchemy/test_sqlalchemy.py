@@ -204,3 +204,33 @@ def test_large_event_not_truncated(sentry_init, capture_events):
     assert event["_meta"]["message"] == {
         "": {"len": 1034, "rem": [["!limit", "x", 1021, 1024]]}
     }
+
+
+def test_normalized_sql_queries(sentry_init, capture_events):
+    sentry_init(
+        integrations=[SqlalchemyIntegration()],
+        _experiments={"normalize_sql": True},
+        traces_sample_rate=1.0,
+    )
+    events = capture_events()
+
+    Base = declarative_base()  # noqa: N806
+
+    class Person(Base):
+        __tablename__ = "person"
+        id = Column(Integer, primary_key=True)
+
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+
+    Session = sessionmaker(bind=engine)  # noqa: N806
+    session = Session()
+
+    with start_transaction(name="test_transaction", sampled=True):
+        session.query(Person).filter(Person.id.in_([1, 2, 3])).all()
+        session.query(Person).filter(Person.id.in_(range(100))).all()
+
+    (event,) = events
+    first, second = [span for span in event["spans"] if "IN" in span["description"]]
+    assert first["description"].endswith("WHERE person.id IN (...)")
+    assert first["description"] == second["description"]
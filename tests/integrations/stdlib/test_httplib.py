@@ -342,3 +342,77 @@ def test_option_trace_propagation_targets(
         else:
             assert "sentry-trace" not in request_headers
             assert "baggage" not in request_headers
+
+
+def test_unsampled_transaction(sentry_init, capture_events, monkeypatch):
+    mock_send = mock.Mock()
+    monkeypatch.setattr(HTTPSConnection, "send", mock_send)
+
+    sentry_init(traces_sample_rate=0.0, integrations=[StdlibIntegration()])
+    events = capture_events()
+
+    with start_transaction(name="unsampled") as transaction:
+        assert not transaction.is_recording()
+
+        HTTPSConnection("www.squirrelchasers.com").request("GET", "/top-chasers?q=1")
+
+        (request_str,) = mock_send.call_args[0]
+        assert (
+            "sentry-trace: %s-%s-0" % (transaction.trace_id, transaction.span_id)
+        ).encode("utf-8") in request_str
+
+    url = "http://localhost:{}/some/random/url?foo=bar".format(PORT)
+    with start_transaction(name="unsampled"):
+        urlopen(url)
+
+    capture_message("Testing!")
+
+    (event,) = events
+    (crumb,) = event["breadcrumbs"]["values"]
+    assert crumb["type"] == "http"
+    assert crumb["category"] == "httplib"
+    assert crumb["data"] == {
+        "url": "http://localhost:{}/some/random/url".format(PORT),
+        "method": "GET",
+        "status_code": 200,
+        "reason": "OK",
+        "http.fragment": "",
+        "http.query": "foo=bar",
+    }
+
+
+def test_unsampled_transaction_crumb_hint(sentry_init, capture_events):
+    hints = []
+
+    def before_breadcrumb(crumb, hint):
+        hints.append(hint)
+        return crumb
+
+    sentry_init(
+        traces_sample_rate=0.0,
+        integrations=[StdlibIntegration()],
+        before_breadcrumb=before_breadcrumb,
+    )
+
+    url = "http://localhost:{}/some/random/url".format(PORT)
+    with start_transaction(name="unsampled"):
+        urlopen(url)
+
+    (hint,) = hints
+    assert hint["httplib_response"].status == 200
+
+
+@pytest.mark.parametrize("sampled", [True, False])
+def test_request_performance(sentry_init, monkeypatch, benchmark, sampled):
+    monkeypatch.setattr(HTTPSConnection, "send", mock.Mock())
+
+    sentry_init(traces_sample_rate=1.0 if sampled else 0.0)
+
+    with start_transaction(name="benchmark"):
+
+        @benchmark
+        def inner():
+            for _ in range(100):
+                HTTPSConnection("www.squirrelchasers.com").request(
+                    "GET", "/top-chasers"
+                )
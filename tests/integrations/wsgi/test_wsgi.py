@@ -316,3 +316,20 @@ def test_profile_sent(
 
     profiles = [item for item in envelopes[0].items if item.type == "profile"]
     assert len(profiles) == 1
+
+
+def test_request_performance(sentry_init, benchmark):
+    sentry_init(traces_sample_rate=1.0)
+
+    def app(environ, start_response):
+        with sentry_sdk.configure_scope() as scope:
+            scope.set_tag("handled", True)
+        start_response("200 OK", [])
+        return [b"ok"]
+
+    client = Client(SentryWsgiMiddleware(app))
+
+    @benchmark
+    def inner():
+        for _ in range(20):
+            client.get("/")
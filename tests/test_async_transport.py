@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from sentry_sdk import Client  # noqa: E402
+from sentry_sdk.async_transport import AsyncHttpTransport  # noqa: E402
+from sentry_sdk.transport import make_transport  # noqa: E402
+
+from tests.test_transport import capturing_server, make_client  # noqa: E402,F401
+
+
+async def _close(client):
+    consumer = client.transport._consumer
+    client.transport.kill()
+    await consumer
+
+
+@pytest.mark.asyncio
+async def test_sends_from_event_loop(capturing_server, make_client):  # noqa: F811
+    client = make_client(transport=AsyncHttpTransport)
+
+    client.capture_event({"type": "transaction"})
+    client.capture_event({"message": "hello"})
+    await client.transport.flush_async(2)
+
+    assert sorted(c.path for c in capturing_server.captured) == [
+        "/api/132/envelope/",
+        "/api/132/store/",
+    ]
+    # Nothing went through the background worker thread.
+    assert not client.transport._worker.is_alive
+
+    await _close(client)
+
+
+@pytest.mark.asyncio
+async def test_flush_on_event_loop_is_awaitable(
+    capturing_server, make_client  # noqa: F811
+):
+    client = make_client(transport=AsyncHttpTransport)
+
+    client.capture_event({"type": "transaction"})
+    await client.transport.flush(2)
+
+    assert len(capturing_server.captured) == 1
+
+    await _close(client)
+
+
+def test_falls_back_to_worker_without_loop(capturing_server, make_client):  # noqa: F811
+    client = make_client(transport=AsyncHttpTransport)
+
+    client.capture_event({"type": "transaction"})
+    client.flush()
+
+    assert len(capturing_server.captured) == 1
+    assert client.transport._loop is None
+
+
+def test_flush_from_other_thread(capturing_server, make_client):  # noqa: F811
+    client = make_client(transport=AsyncHttpTransport)
+    loop = asyncio.new_event_loop()
+
+    async def capture():
+        client.capture_event({"type": "transaction"})
+
+    try:
+        loop.run_until_complete(capture())
+        # The loop is not running anymore, flushing drives it until the
+        # queue is empty.
+        client.flush()
+        consumer = client.transport._consumer
+        client.close()
+        loop.run_until_complete(consumer)
+    finally:
+        loop.close()
+
+    assert len(capturing_server.captured) == 1
+
+
+def test_records_envelopes_queued_when_loop_closes(
+    capturing_server, make_client, monkeypatch  # noqa: F811
+):
+    client = make_client(transport=AsyncHttpTransport)
+    lost = []
+    monkeypatch.setattr(
+        client.transport,
+        "record_lost_event",
+        lambda reason, data_category=None, item=None: lost.append(
+            (reason, item.data_category if item else data_category)
+        ),
+    )
+    loop = asyncio.new_event_loop()
+
+    async def capture():
+        client.capture_event({"type": "transaction"})
+
+    try:
+        loop.run_until_complete(capture())
+    finally:
+        loop.close()
+
+    # The loop closed before the consumer sent anything.
+    client.transport.kill()
+
+    assert lost == [("queue_overflow", "transaction")]
+    assert not capturing_server.captured
+
+
+@pytest.mark.asyncio
+async def test_client_flush_on_event_loop_returns_awaitable(
+    capturing_server, make_client  # noqa: F811
+):
+    client = make_client(transport=AsyncHttpTransport)
+
+    client.capture_event({"type": "transaction"})
+    flushed = client.flush(2)
+    assert flushed is not None
+    await flushed
+
+    assert len(capturing_server.captured) == 1
+
+    await _close(client)
+
+
+def test_selected_by_option():
+    options = Client(
+        "http://foobar@localhost/132", _experiments={"async_transport": True}
+    ).options
+    assert isinstance(make_transport(options), AsyncHttpTransport)
+
+
+@pytest.mark.parametrize("httpx_version", [(0, 16), (0, 28)])
+def test_proxy_argument(make_client, monkeypatch, httpx_version):  # noqa: F811
+    import httpx
+
+    from sentry_sdk import async_transport
+
+    passed = {}
+
+    def async_client(**kwargs):
+        passed.update(kwargs)
+
+    monkeypatch.setattr(async_transport, "HTTPX_VERSION", httpx_version)
+    monkeypatch.setattr(httpx, "AsyncClient", async_client)
+
+    client = make_client(
+        transport=AsyncHttpTransport, http_proxy="http://localhost/123"
+    )
+    client.transport._make_async_client()
+
+    proxy_argument = "proxy" if httpx_version >= (0, 26) else "proxies"
+    assert set(passed) == set(["verify", proxy_argument])
+    assert isinstance(passed[proxy_argument], httpx.Proxy)
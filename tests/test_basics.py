@@ -1,7 +1,9 @@
 import logging
 import os
+import subprocess
 import sys
 import time
+from textwrap import dedent
 
 import pytest
 
@@ -17,6 +19,7 @@ from sentry_sdk import (
     last_event_id,
     Hub,
 )
+from sentry_sdk import integrations
 from sentry_sdk._compat import reraise
 from sentry_sdk.integrations import _AUTO_ENABLING_INTEGRATIONS
 from sentry_sdk.integrations.logging import LoggingIntegration
@@ -70,6 +73,141 @@ def test_auto_enabling_integrations_catches_import_error(sentry_init, caplog):
         ), "Problem with checking auto enabling {}".format(import_string)
 
 
+@pytest.fixture
+def fake_framework(tmpdir, monkeypatch):
+    tmpdir.join("fakeframework.py").write("")
+    tmpdir.join("fakeframework_integration.py").write(
+        dedent(
+            """
+    import fakeframework
+    from sentry_sdk.integrations import Integration
+
+    class FakeFrameworkIntegration(Integration):
+        identifier = "fakeframework"
+        setup_calls = 0
+
+        @staticmethod
+        def setup_once():
+            FakeFrameworkIntegration.setup_calls += 1
+    """
+        )
+    )
+    monkeypatch.syspath_prepend(str(tmpdir))
+
+    import_string = "fakeframework_integration.FakeFrameworkIntegration"
+    monkeypatch.setattr(integrations, "_AUTO_ENABLING_INTEGRATIONS", (import_string,))
+    monkeypatch.setitem(
+        integrations._AUTO_ENABLING_INTEGRATION_PACKAGES,
+        import_string,
+        "fakeframework",
+    )
+
+    yield
+
+    for module in ("fakeframework", "fakeframework_integration"):
+        sys.modules.pop(module, None)
+    integrations._installed_integrations.discard("fakeframework")
+
+
+def test_deferred_integrations(sentry_init, fake_framework):
+    sentry_init(
+        auto_enabling_integrations=True,
+        _experiments={"deferred_integrations": True},
+    )
+
+    assert "fakeframework_integration" not in sys.modules
+    assert Hub.current.get_integration("fakeframework") is None
+
+    import fakeframework  # noqa: F401
+
+    integration = Hub.current.get_integration("fakeframework")
+    assert integration is not None
+    assert type(integration).setup_calls == 1
+    assert fakeframework.__loader__.__class__.__name__ != "_DeferredLoader"
+
+
+def test_deferred_integrations_already_imported(sentry_init, fake_framework):
+    import fakeframework  # noqa: F401
+
+    sentry_init(
+        auto_enabling_integrations=True,
+        _experiments={"deferred_integrations": True},
+    )
+
+    assert Hub.current.get_integration("fakeframework") is not None
+
+
+@pytest.mark.tests_internal_exceptions
+def test_deferred_integrations_broken(sentry_init, fake_framework, tmpdir):
+    tmpdir.join("fakeframework_integration.py").write(
+        "raise ImportError('missing sub-dependency')"
+    )
+    sentry_init(
+        auto_enabling_integrations=True,
+        _experiments={"deferred_integrations": True},
+    )
+
+    # The application's import works regardless.
+    import fakeframework  # noqa: F401
+
+    assert Hub.current.get_integration("fakeframework") is None
+
+
+def test_deferred_integrations_reinit(sentry_init, fake_framework):
+    sentry_init(
+        auto_enabling_integrations=True,
+        _experiments={"deferred_integrations": True},
+    )
+    old_client = Hub.current.client
+    old_integrations = old_client.integrations
+
+    sentry_init(
+        auto_enabling_integrations=True,
+        _experiments={"deferred_integrations": True},
+    )
+    client = Hub.current.client
+    integrations_before = client.integrations
+
+    import fakeframework  # noqa: F401
+
+    assert "fakeframework" not in old_client.integrations
+    assert old_client.integrations is old_integrations
+    assert "fakeframework" in client.integrations
+    # Replaced rather than changed, for whoever is reading them.
+    assert "fakeframework" not in integrations_before
+
+
+def test_deferred_integrations_reinit_without_deferring(sentry_init, fake_framework):
+    sentry_init(
+        auto_enabling_integrations=True,
+        _experiments={"deferred_integrations": True},
+    )
+    sentry_init()
+
+    import fakeframework  # noqa: F401
+
+    assert "fakeframework_integration" not in sys.modules
+    assert Hub.current.get_integration("fakeframework") is None
+
+
+@pytest.mark.parametrize("deferred", [False, True])
+def test_init_startup_time(benchmark, deferred):
+    # Cold start of a process that initializes the SDK. Run the command with
+    # `python -X importtime` to see which imports it spends its time on.
+    code = dedent(
+        """
+    import sentry_sdk
+    sentry_sdk.init(
+        "http://foobar@localhost/123",
+        _experiments={{"deferred_integrations": {deferred}}},
+    )
+    """
+    ).format(deferred=deferred)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    benchmark(lambda: subprocess.check_call([sys.executable, "-c", code], env=env))
+
+
 def test_event_id(sentry_init, capture_events):
     sentry_init()
     events = capture_events()
@@ -367,6 +505,69 @@ def test_breadcrumbs(sentry_init, capture_events):
     assert len(event["breadcrumbs"]["values"]) == 0
 
 
+def test_breadcrumbs_are_built_lazily(sentry_init, capture_events):
+    sentry_init()
+    events = capture_events()
+
+    calls = []
+
+    def factory(payload, timestamp):
+        calls.append(payload)
+        return {"message": payload, "timestamp": timestamp}
+
+    hub = Hub.current
+    hub._add_lazy_breadcrumb(factory, "lazy", 0.0)
+    add_breadcrumb(message="eager", data={"foo": "bar"})
+    assert not calls
+
+    capture_message("hello")
+    assert calls == ["lazy"]
+
+    (event,) = events
+    lazy, eager = event["breadcrumbs"]["values"]
+    assert lazy["message"] == "lazy"
+    assert eager["message"] == "eager"
+    assert eager["type"] == "default"
+    assert eager["data"] == {"foo": "bar"}
+    assert eager["timestamp"]
+
+
+def test_lazy_breadcrumbs_with_before_breadcrumb(sentry_init, capture_events):
+    hints = []
+
+    def before_breadcrumb(crumb, hint):
+        hints.append(hint)
+        crumb["message"] += "!"
+        return crumb
+
+    sentry_init(before_breadcrumb=before_breadcrumb)
+    events = capture_events()
+
+    Hub.current._add_lazy_breadcrumb(
+        lambda payload, timestamp: {"message": payload},
+        "lazy",
+        0.0,
+        lambda payload: {"payload": payload},
+    )
+    assert hints == [{"payload": "lazy"}]
+
+    capture_message("hello")
+    (event,) = events
+    assert event["breadcrumbs"]["values"][0]["message"] == "lazy!"
+
+
+def test_breadcrumb_heavy_request_performance(sentry_init, benchmark):
+    sentry_init(integrations=[LoggingIntegration()])
+    logger = logging.getLogger("breadcrumbs")
+
+    @benchmark
+    def inner():
+        with push_scope():
+            for i in range(1000):
+                add_breadcrumb(category="query", message="SELECT %s" % i)
+                logger.info("handled %s", i)
+
+
 def test_attachments(sentry_init, capture_envelopes):
     sentry_init()
     envelopes = capture_envelopes()
@@ -18,6 +18,7 @@ from sentry_sdk import (
     capture_event,
     start_transaction,
     set_tag,
+    Scope,
 )
 from sentry_sdk.integrations.executing import ExecutingIntegration
 from sentry_sdk.transport import Transport
@@ -993,3 +994,69 @@ def test_multiple_positional_args(sentry_init):
     with pytest.raises(TypeError) as exinfo:
         sentry_init(1, None)
     assert "Only single positional argument is expected" in str(exinfo.value)
+
+
+def test_drop_decisions_before_scope(sentry_init, capture_events, monkeypatch):
+    sentry_init(sample_rate=0.0)
+    events = capture_events()
+
+    applied = []
+    monkeypatch.setattr(
+        Scope, "apply_to_event", lambda self, event, hint: applied.append(event)
+    )
+
+    capture_message("sampled out")
+    capture_message("sampled out")
+
+    assert not events
+    assert not applied
+    assert Hub.current.client.debug_stats["sample_rate"] == 2
+
+
+def test_rate_limited_events_dropped_before_scope(sentry_init, monkeypatch):
+    class RateLimitedTransport(Transport):
+        def __init__(self):
+            Transport.__init__(self)
+            self.captured = []
+            self.lost = []
+
+        def capture_event(self, event):
+            self.captured.append(event)
+
+        def capture_envelope(self, envelope):
+            self.captured.append(envelope)
+
+        def is_rate_limited(self, data_category):
+            return data_category == "error"
+
+        def record_lost_event(self, reason, data_category=None, item=None):
+            self.lost.append((reason, data_category))
+
+    transport = RateLimitedTransport()
+    sentry_init(transport=transport, traces_sample_rate=1.0)
+
+    prepared = []
+    client = Hub.current.client
+    real_prepare_event = client._prepare_event
+
+    def _prepare_event(event, hint, scope):
+        prepared.append(event)
+        return real_prepare_event(event, hint, scope)
+
+    monkeypatch.setattr(client, "_prepare_event", _prepare_event)
+
+    capture_message("rate limited")
+    assert not prepared
+    assert transport.lost == [("ratelimit_backoff", "error")]
+    assert client.debug_stats["ratelimit_backoff"] == 1
+
+    # Attachments are rate limited separately, the transport decides.
+    with configure_scope() as scope:
+        scope.add_attachment(bytes=b"hello", filename="hello.txt")
+        capture_message("with attachment")
+    assert len(prepared) == 1
+
+    with start_transaction(name="transaction"):
+        pass
+    assert len(prepared) == 2
+    assert len(transport.captured) == 2
@@ -0,0 +1,170 @@
+import os
+import shutil
+import socket
+import tempfile
+from datetime import datetime
+
+import pytest
+
+from sentry_sdk import Client
+from sentry_sdk.local_aggregation import LocalAggregator, local_aggregation_supported
+from sentry_sdk.session import Session
+from sentry_sdk.sessions import SessionFlusher
+
+pytestmark = pytest.mark.skipif(
+    not local_aggregation_supported(), reason="requires Unix sockets"
+)
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 characters, which pytest's
+    # temporary directories can exceed.
+    directory = tempfile.mkdtemp(prefix="sentry")
+    yield os.path.join(directory, "aggregation.sock")
+    shutil.rmtree(directory)
+
+
+def test_collector_election(socket_path):
+    collector = LocalAggregator(socket_path)
+    publisher = LocalAggregator(socket_path)
+
+    assert collector.take_sessions() == []
+    assert collector.is_collector
+
+    assert publisher.publish_sessions([["a", 1]])
+    assert publisher.publish_discarded_events([["error", "sample_rate", 2]])
+    assert not publisher.is_collector
+
+    assert collector.take_sessions() == [["a", 1]]
+    assert collector.take_sessions() == []
+    assert collector.take_discarded_events() == [["error", "sample_rate", 2]]
+
+    # The collector sends its own data itself.
+    assert not collector.publish_sessions([["b", 2]])
+
+    collector.close()
+    assert not os.path.exists(socket_path)
+
+    # The next process that can't reach the collector takes over.
+    assert not publisher.publish_sessions([["c", 3]])
+    assert publisher.is_collector
+    publisher.close()
+
+
+def test_stale_socket(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(socket_path)
+    sock.close()
+
+    aggregator = LocalAggregator(socket_path)
+    assert aggregator.take_sessions() == []
+    assert aggregator.is_collector
+    aggregator.close()
+
+
+def test_oversized_message(socket_path):
+    collector = LocalAggregator(socket_path)
+    publisher = LocalAggregator(socket_path)
+    collector.take_sessions()
+
+    assert not publisher.publish_sessions(["x" * 100000])
+    assert not publisher.is_collector
+    assert collector.take_sessions() == []
+
+    publisher.close()
+    collector.close()
+
+
+def test_session_aggregates(socket_path):
+    envelopes = []
+    collector = SessionFlusher(
+        envelopes.append, aggregator=LocalAggregator(socket_path)
+    )
+    publisher = SessionFlusher(
+        lambda envelope: pytest.fail("publisher sent an envelope"),
+        aggregator=LocalAggregator(socket_path),
+    )
+
+    started = datetime(2023, 1, 1, 12, 0, 30)
+
+    def add_session(flusher, status="exited", errors=0):
+        session = Session(
+            release="fun-release", started=started, session_mode="request"
+        )
+        session.update(status=status, errors=errors)
+        flusher.add_aggregate_session(session)
+
+    # The first flush makes the collector claim the socket.
+    collector.flush()
+
+    add_session(collector)
+    add_session(publisher)
+    add_session(publisher, errors=1)
+    add_session(publisher, status="crashed")
+    publisher.flush()
+
+    collector.flush()
+
+    (envelope,) = envelopes
+    (item,) = envelope.items
+    assert item.payload.json == {
+        "attrs": {"release": "fun-release"},
+        "aggregates": [
+            {
+                "started": "2023-01-01T12:00:00.000000Z",
+                "exited": 2,
+                "errored": 1,
+                "crashed": 1,
+            }
+        ],
+    }
+
+    collector.aggregator.close()
+    publisher.aggregator.close()
+
+
+def test_client_reports(socket_path):
+    client = Client(
+        "http://foobar@localhost/123",
+        _experiments={"local_aggregation_socket": socket_path},
+    )
+    transport = client.transport
+    assert transport.local_aggregator is client.local_aggregator
+    # The first fetch makes the transport claim the socket.
+    assert transport._fetch_pending_client_report(force=True) is None
+
+    publisher = LocalAggregator(socket_path)
+    assert publisher.publish_discarded_events([["transaction", "sample_rate", 3]])
+
+    transport.record_lost_event("sample_rate", data_category="transaction")
+    item = transport._fetch_pending_client_report(force=True)
+    assert item.payload.json["discarded_events"] == [
+        {"reason": "sample_rate", "category": "transaction", "quantity": 4}
+    ]
+
+    publisher.close()
+    client.local_aggregator.close()
+    transport.kill()
+
+
+def test_lost_events_are_published_with_client_reports(socket_path):
+    collector = LocalAggregator(socket_path)
+    collector.take_sessions()
+
+    client = Client(
+        "http://foobar@localhost/123",
+        _experiments={"local_aggregation_socket": socket_path},
+    )
+    transport = client.transport
+
+    # Dropping an event doesn't publish anything on the caller's thread.
+    transport.record_lost_event("sample_rate", data_category="transaction")
+    assert collector.take_discarded_events() == []
+
+    transport._flush_client_reports(force=True)
+    assert collector.take_discarded_events() == [["transaction", "sample_rate", 1]]
+
+    client.local_aggregator.close()
+    collector.close()
+    transport.kill()
@@ -12,6 +12,7 @@ from sentry_sdk.profiler import (
     GeventScheduler,
     Profile,
     Scheduler,
+    StackInterner,
     ThreadScheduler,
     extract_frame,
     extract_stack,
@@ -629,26 +630,26 @@ def test_thread_scheduler_single_background_thread(scheduler_class):
 )
 @mock.patch("sentry_sdk.profiler.MAX_PROFILE_DURATION_NS", 1)
 def test_max_profile_duration_reached(scheduler_class):
-    sample = [("1", extract_stack(get_frame()))]
-
-    cwd = os.getcwd()
-
     with scheduler_class(frequency=1000) as scheduler:
+        sample = scheduler.stack_interner.intern_sample(
+            os.getcwd(), [("1", extract_stack(get_frame()))]
+        )
+
         transaction = Transaction(sampled=True)
         with Profile(transaction, scheduler=scheduler) as profile:
             # profile just started, it's active
             assert profile.active
 
             # write a sample at the start time, so still active
-            profile.write(cwd, profile.start_ns + 0, sample, {})
+            profile.write(profile.start_ns + 0, sample)
             assert profile.active
 
             # write a sample at max time, so still active
-            profile.write(cwd, profile.start_ns + 1, sample, {})
+            profile.write(profile.start_ns + 1, sample)
             assert profile.active
 
             # write a sample PAST the max time, so now inactive
-            profile.write(cwd, profile.start_ns + 2, sample, {})
+            profile.write(profile.start_ns + 2, sample)
             assert not profile.active
 
 
@@ -785,7 +786,8 @@ def test_profile_processing(
                 # force the sample to be written at a time relative to the
                 # start of the profile
                 now = profile.start_ns + ts
-                profile.write(os.getcwd(), now, sample, {})
+                sample = scheduler.stack_interner.intern_sample(os.getcwd(), sample)
+                profile.write(now, sample)
 
             processed = profile.process()
 
@@ -795,3 +797,82 @@ def test_profile_processing(
             assert processed["frames"] == expected["frames"]
             assert processed["stacks"] == expected["stacks"]
             assert processed["samples"] == expected["samples"]
+
+
+@requires_python_version(3, 4)
+def test_profile_sample_memory(benchmark):
+    import tracemalloc
+
+    # 30 seconds at the default frequency with 50 threads that all share a
+    # handful of stacks
+    num_samples = 30 * 101
+    num_threads = 50
+    interner = StackInterner()
+    stacks = [
+        interner.intern(os.getcwd(), *extract_stack(get_frame(), max_stack_depth=i))
+        for i in range(1, 5)
+    ]
+    samples = [
+        [(str(tid), stacks[(tid + i) % len(stacks)]) for tid in range(num_threads)]
+        for i in range(num_samples)
+    ]
+
+    @benchmark
+    def inner():
+        with NoopScheduler(frequency=1000) as scheduler:
+            transaction = Transaction(sampled=True)
+            with Profile(transaction, scheduler=scheduler) as profile:
+                tracemalloc.start()
+                try:
+                    for i, sample in enumerate(samples):
+                        profile.write(profile.start_ns + i, sample)
+                    size, _ = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+
+        assert len(profile.process()["samples"]) == num_samples * num_threads
+        # Samples take 20 bytes plus the over allocation of the arrays.
+        assert size < 32 * num_samples * num_threads
+
+
+def test_stack_interner_eviction():
+    interner = StackInterner(max_stacks=2, max_frames=2)
+    cwd = os.getcwd()
+    stacks = [extract_stack(get_frame(), max_stack_depth=i) for i in range(1, 4)]
+
+    first = interner.intern(cwd, *stacks[0])
+    assert interner.intern(cwd, *stacks[0]) is first
+    assert len(first.frames) == 1
+
+    interner.intern(cwd, *stacks[1])
+    interner.intern(cwd, *stacks[2])
+    assert len(interner.stacks) == 2
+    assert len(interner.frames) == 2
+
+    # The first stack was evicted, so it is processed again.
+    assert interner.intern(cwd, *stacks[0]) is not first
+
+
+@pytest.mark.parametrize("num_profiles", [1, 10, 50])
+@mock.patch("sentry_sdk.profiler.MAX_PROFILE_DURATION_NS", 10**12)
+def test_concurrent_profiles_performance(num_profiles, benchmark):
+    with NoopScheduler(frequency=1000) as scheduler:
+        profiles = [
+            Profile(Transaction(sampled=True), scheduler=scheduler)
+            for _ in range(num_profiles)
+        ]
+        for profile in profiles:
+            profile.start()
+
+        @benchmark
+        def inner():
+            for _ in range(100):
+                scheduler.sampler()
+
+        for profile in profiles:
+            profile.stop()
+            assert profile.unique_samples >= 100
+
+        # All profiles share the same processed frames.
+        processed = [profile.process() for profile in profiles]
+        assert all(p["frames"] == processed[0]["frames"] for p in processed)
@@ -1,6 +1,10 @@
 import copy
-from sentry_sdk import capture_exception
-from sentry_sdk.scope import Scope
+import threading
+
+import pytest
+
+from sentry_sdk import Hub, capture_exception
+from sentry_sdk.scope import BreadcrumbBuffer, Scope
 
 
 def test_copying():
@@ -62,3 +66,160 @@ def test_common_args():
     assert s2._extras == {"k": "v", "foo": "bar"}
     assert s2._tags == {"a": "b", "x": "y"}
     assert s2._contexts == {"os": {"name": "Blafasel"}, "device": {"a": "b"}}
+
+
+def test_copy_on_write():
+    s1 = Scope()
+    s1.set_tag("foo", "bar")
+    s1.set_extra("foo", "bar")
+    s1.set_context("foo", {"bar": "baz"})
+    s1.add_attachment(bytes=b"foo", filename="foo.txt")
+    s1.add_event_processor(lambda event, hint: event)
+    s1.add_error_processor(lambda event, exc_info: event)
+
+    s2 = copy.copy(s1)
+
+    # Nothing is copied until the first mutation.
+    assert s2._tags is s1._tags
+    assert s2._breadcrumbs is s1._breadcrumbs
+    assert s2._event_processors is s1._event_processors
+
+    s2.set_tag("child", True)
+    s2.remove_extra("foo")
+    s2.set_context("child", {})
+    s2.set_transaction_name("child", source="custom")
+    s2.add_attachment(bytes=b"child", filename="child.txt")
+    s2.add_event_processor(lambda event, hint: event)
+    s2.add_error_processor(lambda event, exc_info: event)
+    s2.update_from_kwargs(tags={"kwarg": True})
+
+    assert s1._tags == {"foo": "bar"}
+    assert s1._extras == {"foo": "bar"}
+    assert s1._contexts == {"foo": {"bar": "baz"}}
+    assert s1._transaction_info == {}
+    assert len(s1._attachments) == 1
+    assert len(s1._event_processors) == 1
+    assert len(s1._error_processors) == 1
+
+    assert s2._tags == {"foo": "bar", "child": True, "kwarg": True}
+    assert s2._extras == {}
+    assert len(s2._attachments) == 2
+    assert len(s2._event_processors) == 2
+    assert len(s2._error_processors) == 2
+
+    # The parent has to copy as well, the child still uses the old data.
+    s1.set_extra("parent", True)
+    assert s1._extras == {"foo": "bar", "parent": True}
+    assert s2._extras == {}
+
+
+def test_copy_on_write_breadcrumbs(sentry_init):
+    sentry_init()
+    hub = Hub.current
+
+    hub.add_breadcrumb(message="parent")
+    with hub.push_scope():
+        hub.add_breadcrumb(message="child")
+        with hub.configure_scope() as scope:
+            assert [crumb["message"] for crumb in scope._breadcrumbs] == [
+                "parent",
+                "child",
+            ]
+
+    with hub.configure_scope() as scope:
+        assert [crumb["message"] for crumb in scope._breadcrumbs] == ["parent"]
+
+        scope.clear()
+        assert "_tags" not in scope._shared
+        assert "_breadcrumbs" not in scope._shared
+
+
+def test_push_scope_performance(sentry_init, benchmark):
+    sentry_init()
+    hub = Hub.current
+    with hub.configure_scope() as scope:
+        for i in range(20):
+            scope.set_tag("tag%s" % i, i)
+            scope.set_extra("extra%s" % i, i)
+        for i in range(100):
+            hub.add_breadcrumb(message="crumb%s" % i)
+
+    @benchmark
+    def inner():
+        for _ in range(100):
+            with hub.push_scope() as scope:
+                scope.set_tag("request", True)
+
+
+def test_breadcrumb_buffer():
+    buffer = BreadcrumbBuffer(maxlen=3)
+    for i in range(5):
+        buffer.append({"message": i})
+    assert len(buffer) == 3
+    assert [crumb["message"] for crumb in buffer] == [2, 3, 4]
+
+    buffer.append_lazy(lambda payload, timestamp: {"message": payload}, 5, 0.0)
+    assert [crumb["message"] for crumb in buffer] == [3, 4, 5]
+
+    # Growing and shrinking keeps the newest breadcrumbs.
+    buffer.append({"message": 6}, maxlen=5)
+    assert [crumb["message"] for crumb in buffer] == [3, 4, 5, 6]
+    buffer.append({"message": 7}, maxlen=2)
+    assert [crumb["message"] for crumb in buffer] == [6, 7]
+
+    buffer.append({"message": 8}, maxlen=0)
+    assert list(buffer) == []
+
+    buffer.append({"message": 9}, maxlen=2)
+    copied = copy.copy(buffer)
+    copied.extend(buffer)
+    assert [crumb["message"] for crumb in copied] == [9, 9]
+    assert [crumb["message"] for crumb in buffer] == [9]
+
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.maxlen == 2
+
+
+@pytest.mark.tests_internal_exceptions
+def test_breadcrumb_buffer_broken_factory():
+    def factory(payload, timestamp):
+        raise ValueError()
+
+    buffer = BreadcrumbBuffer()
+    buffer.append_lazy(factory, None, 0.0)
+    buffer.append({"message": "ok"})
+    assert list(buffer) == [{"message": "ok"}]
+
+
+def test_breadcrumb_buffer_shared_between_threads():
+    calls = []
+
+    def factory(payload, timestamp):
+        calls.append(payload)
+        return {"message": payload}
+
+    buffer = BreadcrumbBuffer()
+    for i in range(50):
+        buffer.append_lazy(factory, i, 0.0)
+    copied = copy.copy(buffer)
+
+    results = []
+
+    def iterate(buffer):
+        for _ in range(20):
+            results.append([crumb["message"] for crumb in buffer])
+
+    threads = [
+        threading.Thread(target=iterate, args=(b,)) for b in (buffer, copied, buffer)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 60
+    assert all(result == list(range(50)) for result in results)
+    # Neither buffer was changed by being iterated.
+    assert [entry[0] for entry in buffer._entries()] == list(range(50))
+    assert [entry[0] for entry in copied._entries()] == list(range(50))
@@ -2,7 +2,10 @@ import re
 import sys
 import pytest
 
-from sentry_sdk.serializer import serialize
+from datetime import datetime
+
+from sentry_sdk.serializer import serialize, serialize_iterative
+from sentry_sdk.utils import AnnotatedValue
 
 try:
     from hypothesis import given
@@ -28,10 +31,15 @@ else:
         inner()
 
 
+@pytest.fixture(params=[serialize, serialize_iterative])
+def serializer(request):
+    return request.param
+
+
 @pytest.fixture
-def message_normalizer(validate_event_schema):
+def message_normalizer(validate_event_schema, serializer):
     def inner(message, **kwargs):
-        event = serialize({"logentry": {"message": message}}, **kwargs)
+        event = serializer({"logentry": {"message": message}}, **kwargs)
         validate_event_schema(event)
         return event["logentry"]["message"]
 
@@ -39,9 +47,9 @@ def message_normalizer(validate_event_schema):
 
 
 @pytest.fixture
-def extra_normalizer(validate_event_schema):
+def extra_normalizer(validate_event_schema, serializer):
     def inner(message, **kwargs):
-        event = serialize({"extra": {"foo": message}}, **kwargs)
+        event = serializer({"extra": {"foo": message}}, **kwargs)
         validate_event_schema(event)
         return event["extra"]["foo"]
 
@@ -106,3 +114,108 @@ def test_custom_mapping_doesnt_mess_with_mock(extra_normalizer):
     m = mock.Mock()
     extra_normalizer(m)
     assert len(m.mock_calls) == 0
+
+
+_UNSERIALIZABLE = object()
+
+
+def _make_event():
+    cyclic = {"name": "cyclic"}
+    cyclic["self"] = cyclic
+
+    frame_vars = {
+        "a": "A" * 2000,
+        "b": b"bytes",
+        "c": [[[[[["too deep"]]]]]],
+        "d": dict(("key%s" % i, i) for i in range(20)),
+        "e": float("nan"),
+        "f": None,
+        "g": datetime(2023, 1, 1),
+        "h": cyclic,
+        "i": AnnotatedValue("", {"rem": [["!raw", "x"]]}),
+        "j": _UNSERIALIZABLE,
+    }
+
+    return {
+        "message": "hi",
+        "exception": {
+            "values": [
+                {
+                    "type": "ValueError",
+                    "stacktrace": {
+                        "frames": [
+                            {"function": "foo", "vars": frame_vars},
+                            {"function": "bar", "vars": {"x": 1, "y": "y"}},
+                        ]
+                    },
+                }
+            ]
+        },
+        "threads": {
+            "values": [{"stacktrace": {"frames": [{"vars": {"thread": True}}]}}]
+        },
+        "request": {
+            "url": "http://example.com",
+            "data": {"items": list(range(50)), "text": "B" * 2000},
+            "headers": dict(("X-Header-%s" % i, "v") for i in range(20)),
+        },
+        "breadcrumbs": {
+            "values": [
+                {"message": "crumb %s" % i, "data": {"nested": [1, [2, [3]]]}}
+                for i in range(15)
+            ]
+        },
+        "extra": {"list": list(range(30)), "set": {1, 2, 3}, "cyclic": cyclic},
+        "spans": [{"description": "SELECT " + "x, " * 1000 + "y"}],
+        "tags": {"tag": "value"},
+        "contexts": {"trace": {"trace_id": "a" * 32}},
+        "user": AnnotatedValue({"id": "1"}, {"len": 1}),
+    }
+
+
+def test_iterative_serializer_matches_recursive():
+    assert serialize_iterative(_make_event()) == serialize(_make_event())
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{}, {"should_repr_strings": True}, {"is_databag": True}]
+)
+def test_iterative_serializer_matches_recursive_kwargs(kwargs):
+    event = {"extra": {"foo": [b"bar", "baz", 1.0]}, "more": ["a" * 1000] * 20}
+    assert serialize_iterative(event, **kwargs) == serialize(event, **kwargs)
+
+
+def test_iterative_serializer_deep_nesting():
+    value = ["a"]
+    for _ in range(10000):
+        value = [value]
+
+    # Outside of databags there is no depth limit, which makes the recursive
+    # implementation exceed the recursion limit.
+    result = serialize_iterative({"contexts": {"deep": value}})
+    for _ in range(10001):
+        (result,) = result if isinstance(result, list) else result["contexts"]["deep"]
+    assert result == "a"
+
+
+def test_iterative_serializer_enabled(sentry_init, capture_events):
+    sentry_init(_experiments={"iterative_serializer": True})
+    events = capture_events()
+
+    from sentry_sdk import capture_message, configure_scope
+
+    with configure_scope() as scope:
+        scope.set_extra("foo", list(range(100)))
+
+    capture_message("hi")
+    (event,) = events
+
+    assert event["extra"]["foo"] == list(range(10))
+    assert event["_meta"]["extra"]["foo"] == {"": {"len": 100}}
+
+
+@pytest.mark.parametrize("engine", [serialize, serialize_iterative])
+def test_serializer_performance(engine, benchmark):
+    @benchmark
+    def inner():
+        engine(_make_event())
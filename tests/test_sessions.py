@@ -1,3 +1,5 @@
+import threading
+
 import sentry_sdk
 
 from sentry_sdk import Hub
@@ -43,6 +45,35 @@ def test_basic(sentry_init, capture_envelopes):
     assert sess_event["errors"] == 1
 
 
+def test_sampled_out_error_updates_session(sentry_init, capture_envelopes):
+    sentry_init(release="fun-release", sample_rate=0.0)
+    envelopes = capture_envelopes()
+
+    hub = Hub.current
+    hub.start_session()
+
+    with hub.configure_scope() as scope:
+        scope.add_event_processor(
+            lambda event, hint: dict(
+                event, request={"headers": {"User-Agent": "fun-agent"}}
+            )
+        )
+        scope.set_user({"id": "42"})
+    try:
+        raise Exception("all is wrong")
+    except Exception:
+        hub.capture_exception()
+    hub.end_session()
+    hub.flush()
+
+    # The error is dropped, but attributed to the session like a sent one.
+    (sess,) = envelopes
+    sess_event = sess.items[0].payload.json
+    assert sess_event["did"] == "42"
+    assert sess_event["attrs"]["user_agent"] == "fun-agent"
+    assert sess_event["errors"] == 1
+
+
 def test_aggregates(sentry_init, capture_envelopes):
     sentry_init(
         release="fun-release",
@@ -119,3 +150,57 @@ def test_aggregates_explicitly_disabled_session_tracking_request_mode(
     assert len(aggregates) == 1
     assert aggregates[0]["exited"] == 1
     assert "errored" not in aggregates[0]
+
+
+def test_aggregates_from_threads(sentry_init, capture_envelopes):
+    sentry_init(release="fun-release", environment="not-fun-env")
+    envelopes = capture_envelopes()
+
+    hub = Hub.current
+    flusher = hub.client.session_flusher
+
+    def end_sessions():
+        thread_hub = Hub(hub)
+        for i in range(100):
+            thread_hub.start_session(session_mode="request")
+            if i % 10 == 0:
+                thread_hub.scope._session.update(errors=1)
+            thread_hub.end_session()
+
+    threads = [threading.Thread(target=end_sessions) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sentry_sdk.flush()
+
+    (sess,) = envelopes
+    sess_event = sess.items[0].payload.json
+    aggregates = sorted_aggregates(sess_event)
+    assert sum(aggregate.get("exited", 0) for aggregate in aggregates) == 360
+    assert sum(aggregate.get("errored", 0) for aggregate in aggregates) == 40
+
+    # Shards of threads that are done are dropped by the next flush.
+    flusher.flush()
+    assert flusher._shards == {}
+    assert len(envelopes) == 1
+
+
+def test_aggregate_session_performance(sentry_init, benchmark):
+    sentry_init(release="fun-release", environment="not-fun-env")
+    hub = Hub.current
+
+    def end_sessions():
+        thread_hub = Hub(hub)
+        for _ in range(500):
+            thread_hub.start_session(session_mode="request")
+            thread_hub.end_session()
+
+    @benchmark
+    def inner():
+        threads = [threading.Thread(target=end_sessions) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
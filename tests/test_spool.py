@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from sentry_sdk.spool import EnvelopeSpool, SpoolLocked
+
+
+def _drain(spool):
+    rv = []
+    while True:
+        payload = spool.peek()
+        if payload is None:
+            return rv
+        rv.append(payload)
+        spool.commit()
+
+
+def test_append_peek_commit(tmpdir):
+    spool = EnvelopeSpool(str(tmpdir))
+    assert spool.peek() is None
+
+    assert spool.append(b"foo")
+    assert spool.append(b"bar")
+    assert len(spool) > 0
+
+    # Peeking without committing returns the same record again.
+    assert spool.peek() == b"foo"
+    assert spool.peek() == b"foo"
+    spool.commit()
+
+    assert _drain(spool) == [b"bar"]
+    assert len(spool) == 0
+    spool.close()
+
+
+def test_replay_after_reopen(tmpdir):
+    spool = EnvelopeSpool(str(tmpdir))
+    for payload in (b"a", b"b", b"c"):
+        spool.append(payload)
+    assert spool.peek() == b"a"
+    spool.commit()
+    assert spool.peek() == b"b"
+    spool.close()
+
+    spool = EnvelopeSpool(str(tmpdir))
+    assert _drain(spool) == [b"b", b"c"]
+    spool.close()
+
+    spool = EnvelopeSpool(str(tmpdir))
+    assert len(spool) == 0
+    assert spool.peek() is None
+    spool.close()
+
+
+def test_torn_tail_is_discarded(tmpdir):
+    spool = EnvelopeSpool(str(tmpdir))
+    spool.append(b"complete")
+    spool.append(b"torn record")
+    spool.close()
+
+    (segment,) = [name for name in os.listdir(str(tmpdir)) if name.endswith(".seg")]
+    path = os.path.join(str(tmpdir), segment)
+    with open(path, "rb+") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    spool = EnvelopeSpool(str(tmpdir))
+    assert _drain(spool) == [b"complete"]
+    assert spool.append(b"after")
+    assert _drain(spool) == [b"after"]
+    spool.close()
+
+
+def test_max_bytes(tmpdir):
+    spool = EnvelopeSpool(str(tmpdir), max_bytes=64)
+    assert spool.append(b"x" * 30)
+    assert not spool.append(b"x" * 30)
+
+    assert spool.peek() == b"x" * 30
+    spool.commit()
+    assert spool.append(b"x" * 30)
+    spool.close()
+
+
+def test_segment_rollover(tmpdir):
+    spool = EnvelopeSpool(str(tmpdir), segment_bytes=32)
+    payloads = [str(i).encode("ascii") * 20 for i in range(5)]
+    for payload in payloads:
+        assert spool.append(payload)
+
+    segments = [name for name in os.listdir(str(tmpdir)) if name.endswith(".seg")]
+    assert len(segments) == 5
+
+    assert _drain(spool) == payloads
+    segments = [name for name in os.listdir(str(tmpdir)) if name.endswith(".seg")]
+    assert len(segments) == 1
+    spool.close()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="no flock on Windows")
+def test_locked_by_other_spool(tmpdir):
+    spool = EnvelopeSpool(str(tmpdir))
+    with pytest.raises(SpoolLocked):
+        EnvelopeSpool(str(tmpdir))
+    spool.close()
+
+    EnvelopeSpool(str(tmpdir)).close()
@@ -3,6 +3,8 @@ import logging
 import pickle
 import gzip
 import io
+import socket
+import time
 
 from datetime import datetime, timedelta
 
@@ -13,6 +15,7 @@ from werkzeug.wrappers import Request, Response
 from pytest_localserver.http import WSGIServer
 
 from sentry_sdk import Hub, Client, add_breadcrumb, capture_message, Scope
+from sentry_sdk import transport
 from sentry_sdk.transport import _parse_rate_limits
 from sentry_sdk.envelope import Envelope, parse_json
 from sentry_sdk.integrations.logging import LoggingIntegration
@@ -337,3 +340,185 @@ def test_complex_limits_without_data_category(
     client.flush()
 
     assert len(capturing_server.captured) == 0
+
+
+def test_batched_envelopes(capturing_server, make_client):
+    client = make_client(
+        _experiments={"transport_batch_size": 5, "transport_batch_linger": 0.5}
+    )
+
+    for _ in range(12):
+        client.capture_event({"type": "transaction"})
+
+    # Session updates are merged into a single envelope per batch.
+    for _ in range(3):
+        envelope = Envelope()
+        envelope.add_sessions({"attrs": {"release": "foo"}, "aggregates": []})
+        client.transport.capture_envelope(envelope)
+
+    client.flush()
+
+    assert all(c.path == "/api/132/envelope/" for c in capturing_server.captured)
+    item_types = [
+        [item.type for item in c.envelope.items] for c in capturing_server.captured
+    ]
+    assert item_types.count(["transaction"]) == 12
+    assert ["sessions", "sessions", "sessions"] in item_types
+    assert len(item_types) == 13
+
+
+def test_batched_envelopes_rate_limits(capturing_server, make_client, monkeypatch):
+    client = make_client(_experiments={"transport_batch_size": 10})
+    capturing_server.respond_with(
+        code=200, headers={"X-Sentry-Rate-Limits": "4711:transaction:organization"}
+    )
+
+    captured_outcomes = []
+
+    def record_lost_event(reason, data_category=None, item=None):
+        if data_category is None:
+            data_category = item.data_category
+        return captured_outcomes.append((reason, data_category))
+
+    monkeypatch.setattr(client.transport, "record_lost_event", record_lost_event)
+
+    for _ in range(3):
+        client.capture_event({"type": "transaction"})
+    client.flush()
+
+    # The first envelope of the batch triggers the rate limit, which is
+    # honored for the rest of the batch.
+    assert len(capturing_server.captured) == 1
+    assert captured_outcomes == [
+        ("ratelimit_backoff", "transaction"),
+        ("ratelimit_backoff", "transaction"),
+    ]
+
+
+def test_batched_envelopes_flush_resets_linger(capturing_server, make_client):
+    client = make_client(_experiments={"transport_batch_size": 5})
+
+    # A flush without a scheduled drain doesn't make later batches skip
+    # their linger window.
+    client.flush()
+    assert not client.transport._batch_flushing
+
+    client.capture_event({"type": "transaction"})
+    client.flush()
+    assert not client.transport._batch_flushing
+    assert len(capturing_server.captured) == 1
+
+
+def test_batched_envelopes_kill(capturing_server, make_client, monkeypatch):
+    client = make_client(
+        _experiments={"transport_batch_size": 10, "transport_batch_linger": 5}
+    )
+
+    captured_outcomes = []
+
+    def record_lost_event(reason, data_category=None, item=None):
+        captured_outcomes.append((reason, item.data_category))
+
+    monkeypatch.setattr(client.transport, "record_lost_event", record_lost_event)
+
+    for _ in range(3):
+        client.capture_event({"type": "transaction"})
+    client.transport.kill()
+
+    assert captured_outcomes == [("queue_overflow", "transaction")] * 3
+    assert not capturing_server.captured
+
+
+def test_batched_envelopes_queue_load(make_client):
+    client = make_client(
+        transport_queue_size=20,
+        _experiments={"transport_batch_size": 100, "transport_batch_linger": 5},
+    )
+
+    for _ in range(10):
+        client.capture_event({"type": "transaction"})
+
+    # The envelopes wait for the batch to fill up, not in the worker's queue.
+    assert client.transport.queue_load() >= 0.5
+    client.transport.kill()
+
+
+def test_spooled_envelopes_are_replayed(capturing_server, make_client, tmpdir):
+    spool_dir = str(tmpdir.join("spool"))
+
+    # Nothing is listening on the first client's DSN.
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    client = Client(
+        "http://foobar@127.0.0.1:{}/132".format(sock.getsockname()[1]),
+        _experiments={"transport_spool_dir": spool_dir},
+    )
+    sock.close()
+
+    client.capture_event({"message": "hello"})
+    client.capture_event({"type": "transaction"})
+    client.flush()
+    client.close()
+
+    assert not capturing_server.captured
+
+    client = make_client(_experiments={"transport_spool_dir": spool_dir})
+    client.flush()
+    client.close()
+
+    item_types = [
+        [item.type for item in c.envelope.items] for c in capturing_server.captured
+    ]
+    assert item_types == [["event"], ["transaction"]]
+
+
+def test_spooled_envelopes_are_retried(
+    capturing_server, make_client, tmpdir, monkeypatch
+):
+    monkeypatch.setattr(transport, "_SPOOL_RETRY_INTERVAL", 0.1)
+    capturing_server.respond_with(code=503)
+    client = make_client(
+        _experiments={"transport_spool_dir": str(tmpdir.join("spool"))}
+    )
+
+    client.capture_event({"message": "hello"})
+    client.flush()
+
+    # The envelope stays in the spool and is sent again without waiting for
+    # the next capture.
+    assert len(capturing_server.captured) == 1
+    assert len(client.transport._spool)
+
+    capturing_server.respond_with(code=200)
+    for _ in range(50):
+        if not len(client.transport._spool):
+            break
+        time.sleep(0.1)
+
+    assert len(capturing_server.captured) == 2
+    assert not len(client.transport._spool)
+    client.close()
+
+
+def test_spooled_envelopes_rejected_for_good(
+    capturing_server, make_client, tmpdir, monkeypatch
+):
+    capturing_server.respond_with(code=400)
+    client = make_client(
+        _experiments={"transport_spool_dir": str(tmpdir.join("spool"))}
+    )
+
+    captured_outcomes = []
+
+    def record_lost_event(reason, data_category=None, item=None):
+        captured_outcomes.append((reason, item.data_category))
+
+    monkeypatch.setattr(client.transport, "record_lost_event", record_lost_event)
+
+    client.capture_event({"message": "hello"})
+    client.flush()
+
+    assert len(capturing_server.captured) == 1
+    assert not len(client.transport._spool)
+    assert captured_outcomes == [("network_error", "error")]
+    client.close()
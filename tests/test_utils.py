@@ -1,7 +1,17 @@
+import os
+
 import pytest
 import re
 
-from sentry_sdk.utils import is_valid_sample_rate, logger, parse_url, sanitize_url
+from sentry_sdk.utils import (
+    SourceContextCache,
+    get_lines_from_file,
+    is_valid_sample_rate,
+    logger,
+    parse_url,
+    sanitize_url,
+    source_context_cache,
+)
 
 try:
     from unittest import mock  # python 3.3 and above
@@ -221,3 +231,100 @@ def test_warns_on_invalid_sample_rate(rate, StringContaining):  # noqa: N803
         result = is_valid_sample_rate(rate, source="Testing")
         logger.warning.assert_any_call(StringContaining("Given sample rate is invalid"))
         assert result is False
+
+
+def _write_source(tmpdir, name="module.py", num_lines=20):
+    path = tmpdir.join(name)
+    path.write("\n".join("line %s" % i for i in range(num_lines)) + "\n")
+    return str(path)
+
+
+def test_get_lines_from_file(tmpdir):
+    filename = _write_source(tmpdir)
+
+    pre_context, context_line, post_context = get_lines_from_file(filename, 10)
+    assert pre_context == ["line %s" % i for i in range(5, 10)]
+    assert context_line == "line 10"
+    assert post_context == ["line %s" % i for i in range(11, 16)]
+
+    pre_context, context_line, post_context = get_lines_from_file(filename, 1)
+    assert pre_context == ["line 0"]
+    assert context_line == "line 1"
+
+    assert get_lines_from_file(filename, 20) == ([], None, [])
+    assert get_lines_from_file(str(tmpdir.join("missing.py")), 1) == ([], None, [])
+
+
+def test_get_lines_from_file_with_loader(tmpdir):
+    class Loader(object):
+        def get_source(self, module):
+            assert module == "foo"
+            return "a\r\nb\r\nc"
+
+    filename = str(tmpdir.join("not_on_disk.py"))
+    assert get_lines_from_file(filename, 1, Loader(), "foo") == (["a"], "b", ["c"])
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_source_context_cache(tmpdir, use_mmap):
+    cache = SourceContextCache(use_mmap=use_mmap)
+    filename = _write_source(tmpdir)
+
+    assert cache.get(filename).lines(3, 5) == ["line 3\n", "line 4\n"]
+    assert cache.get(filename) is cache.get(filename)
+    assert cache.hits == 2
+    assert cache.misses == 1
+    assert cache.hit_rate == 2 / 3.0
+
+    # A modified file is read again.
+    tmpdir.join("module.py").write(
+        "# coding: utf-8\nprint('\xfc')\n".encode("utf-8"), "wb"
+    )
+    os.utime(filename, (0, 0))
+    source = cache.get(filename)
+    assert len(source) == 2
+    assert source.lines(1, 2) == ["print('\xfc')\n"]
+    assert cache.misses == 2
+
+
+def test_source_context_cache_eviction(tmpdir):
+    first = _write_source(tmpdir, "first.py")
+    second = _write_source(tmpdir, "second.py")
+
+    size = SourceContextCache().get(first).size
+    cache = SourceContextCache(max_bytes=size + 1)
+
+    cache.get(first)
+    cache.get(second)
+    cache.get(first)
+    assert cache.hits == 0
+    assert cache.misses == 3
+
+
+def test_source_context_cache_unmaps_evicted_files(tmpdir):
+    filenames = [_write_source(tmpdir, "file%s.py" % i) for i in range(3)]
+    cache = SourceContextCache(use_mmap=True, max_mmaps=2)
+
+    first = cache.get(filenames[0])
+    assert first.is_mapped
+    assert first.lines(3, 5) == ["line 3\n", "line 4\n"]
+    second = cache.get(filenames[1])
+    cache.get(filenames[2])
+
+    # Reading from the closed mapping of an evicted file gives no lines.
+    assert first.lines(3, 5) == []
+    assert cache.get(filenames[1]) is second
+    assert second.lines(3, 5) == ["line 3\n", "line 4\n"]
+
+    cache.clear()
+    assert second.lines(3, 5) == []
+
+
+def test_source_context_cache_is_used(tmpdir):
+    source_context_cache.clear()
+    filename = _write_source(tmpdir)
+
+    hits = source_context_cache.hits
+    for _ in range(3):
+        get_lines_from_file(filename, 10)
+    assert source_context_cache.hits == hits + 2
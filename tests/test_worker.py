@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+from sentry_sdk.worker import BackgroundWorker
+
+
+def test_callbacks_run_in_order():
+    worker = BackgroundWorker()
+    results = []
+
+    for i in range(50):
+        assert worker.submit(lambda i=i: results.append(i))
+    worker.flush(2.0)
+
+    assert results == list(range(50))
+    worker.kill()
+
+
+def test_submit_respects_queue_size():
+    worker = BackgroundWorker(queue_size=2)
+    blocker = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        blocker.wait()
+
+    assert worker.submit(block)
+    started.wait()
+
+    assert worker.load == 0.0
+    assert worker.submit(lambda: None)
+    assert worker.load == 0.5
+    assert worker.submit(lambda: None)
+    assert worker.load == 1.0
+    assert not worker.submit(lambda: None)
+
+    blocker.set()
+    worker.flush(2.0)
+    assert worker.load == 0.0
+    assert worker.submit(lambda: None)
+    worker.kill()
+
+
+def test_flush_timeout_reports_pending():
+    worker = BackgroundWorker()
+    blocker = threading.Event()
+    worker.submit(blocker.wait)
+    worker.submit(lambda: None)
+
+    reported = []
+    worker.flush(0.2, lambda pending, timeout: reported.append(pending))
+    assert reported and reported[0] >= 1
+
+    blocker.set()
+    worker.kill()
+
+
+def test_failing_callback_does_not_kill_worker():
+    worker = BackgroundWorker()
+    results = []
+
+    worker.submit(lambda: 1 / 0)
+    worker.submit(lambda: results.append(True))
+    worker.flush(2.0)
+
+    assert results == [True]
+    assert worker.is_alive
+    worker.kill()
+
+
+def test_restart_after_kill():
+    worker = BackgroundWorker()
+    results = []
+
+    worker.submit(lambda: results.append(1))
+    worker.flush(2.0)
+    worker.kill()
+    assert not worker.is_alive
+
+    worker.submit(lambda: results.append(2))
+    worker.flush(2.0)
+    assert results == [1, 2]
+    worker.kill()
+
+
+@pytest.mark.parametrize("producers", [1, 8, 64])
+def test_submit_performance(producers, benchmark):
+    submits_per_producer = 2000
+    worker = BackgroundWorker(queue_size=producers * submits_per_producer)
+    worker.start()
+
+    def noop():
+        pass
+
+    def produce():
+        submit = worker.submit
+        for _ in range(submits_per_producer):
+            submit(noop)
+
+    @benchmark
+    def inner():
+        threads = [threading.Thread(target=produce) for _ in range(producers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        worker.flush(10.0)
+
+    worker.kill()
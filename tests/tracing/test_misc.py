@@ -1,14 +1,23 @@
 from mock import MagicMock
 import pytest
 import gc
+import sys
+import threading
 import uuid
 import os
+from datetime import datetime
 
 import sentry_sdk
 from sentry_sdk import Hub, start_span, start_transaction, set_measurement
 from sentry_sdk.consts import MATCH_ALL
-from sentry_sdk.tracing import Span, Transaction
-from sentry_sdk.tracing_utils import should_propagate_trace
+from sentry_sdk.tracing import NoOpSpan, RandomIdGenerator, Span, Transaction
+from sentry_sdk.tracing_utils import (
+    Baggage,
+    PropagationTargetMatcher,
+    SqlFingerprintCache,
+    normalize_sql,
+    should_propagate_trace,
+)
 
 try:
     from unittest import mock  # python 3.3 and above
@@ -306,3 +315,394 @@ def test_should_propagate_trace(
     hub.client.options = {"trace_propagation_targets": trace_propagation_targets}
 
     assert should_propagate_trace(hub, url) == expected_propagation_decision
+
+
+def test_propagation_target_matcher():
+    matcher = PropagationTargetMatcher(["localhost", r"^/api"])
+    assert matcher.matches("http://localhost:8443/api/users")
+    assert matcher.matches("/api/envelopes")
+    assert not matcher.matches("/backend/api/envelopes")
+    assert matcher._results == {
+        "http://localhost:8443/api/users": True,
+        "/api/envelopes": True,
+        "/backend/api/envelopes": False,
+    }
+
+    assert PropagationTargetMatcher([MATCH_ALL]).matches("http://example.com")
+
+
+def test_should_propagate_trace_targets_changed():
+    hub = MagicMock()
+    hub.client.options = {"trace_propagation_targets": ["example.com"]}
+    assert should_propagate_trace(hub, "http://example.com")
+
+    hub.client.options["trace_propagation_targets"].remove("example.com")
+    assert not should_propagate_trace(hub, "http://example.com")
+
+
+def test_propagation_headers_cache(sentry_init):
+    sentry_init(traces_sample_rate=1.0, release="foo")
+
+    with start_transaction(name="hi") as transaction:
+        with start_span(op="foo") as span:
+            headers = dict(span.iter_headers())
+            assert headers["sentry-trace"] == "%s-%s-1" % (
+                transaction.trace_id,
+                span.span_id,
+            )
+            assert "sentry-release=foo" in headers["baggage"]
+            assert dict(span.iter_headers()) == headers
+            assert (
+                transaction.get_baggage().serialize()
+                is transaction.get_baggage().serialize()
+            )
+
+            span.sampled = False
+            assert dict(span.iter_headers())["sentry-trace"].endswith("-0")
+
+    baggage = Baggage({"release": "foo"})
+    assert baggage.serialize() == "sentry-release=foo"
+    baggage.sentry_items["environment"] = "bar"
+    assert "sentry-environment=bar" in baggage.serialize()
+
+
+def test_propagation_headers_performance(sentry_init, benchmark):
+    sentry_init(traces_sample_rate=1.0, release="foo")
+    hub = Hub.current
+
+    with start_transaction(name="hi"):
+        with start_span(op="http.client"):
+
+            @benchmark
+            def inner():
+                for _ in range(100):
+                    if should_propagate_trace(hub, "http://example.com/api"):
+                        list(hub.iter_trace_propagation_headers())
+
+
+def test_random_id_generator():
+    generator = RandomIdGenerator()
+    trace_ids = set(generator.trace_id() for _ in range(1000))
+    span_ids = set(generator.span_id() for _ in range(1000))
+
+    assert len(trace_ids) == len(span_ids) == 1000
+    for trace_id in trace_ids:
+        assert len(trace_id) == 32
+        int(trace_id, 16)
+    for span_id in span_ids:
+        assert len(span_id) == 16
+        int(span_id, 16)
+
+    # Forked children must not repeat the ids of their parent.
+    rng = generator._random()
+    generator._reseed()
+    assert generator._random() is not rng
+
+
+def test_custom_id_generator(sentry_init, capture_events):
+    class FixedIdGenerator(object):
+        def trace_id(self):
+            return "a" * 32
+
+        def span_id(self):
+            return "b" * 16
+
+    sentry_init(
+        traces_sample_rate=1.0, _experiments={"id_generator": FixedIdGenerator()}
+    )
+    events = capture_events()
+
+    try:
+        with start_transaction(name="hi"):
+            with start_span(op="foo"):
+                pass
+    finally:
+        sentry_sdk.tracing.set_id_generator(None)
+
+    (event,) = events
+    assert event["contexts"]["trace"]["trace_id"] == "a" * 32
+    assert event["spans"][0]["span_id"] == "b" * 16
+    assert Span().span_id != "b" * 16
+
+
+def test_span_timestamps(sentry_init, capture_events):
+    sentry_init(traces_sample_rate=1.0)
+    events = capture_events()
+
+    with start_transaction(name="hi") as transaction:
+        with start_span(op="foo") as span:
+            pass
+        # Child spans share the wall clock reading of their transaction.
+        assert span._clock_anchor is transaction._clock_anchor
+
+    (event,) = events
+    (child,) = event["spans"]
+    assert (
+        event["start_timestamp"]
+        <= child["start_timestamp"]
+        <= child["timestamp"]
+        <= event["timestamp"]
+    )
+
+    start = datetime(2020, 1, 1)
+    span = Span(start_timestamp=start)
+    assert span.start_timestamp == start
+    span.finish()
+    finished = span.timestamp
+    assert finished >= start
+
+    # Finishing twice keeps the first end timestamp.
+    span.finish(end_timestamp=datetime(2021, 1, 1))
+    assert span.timestamp == finished
+
+
+def test_span_creation_performance(sentry_init, benchmark):
+    sentry_init(traces_sample_rate=1.0, _experiments={"max_spans": 10000})
+
+    @benchmark
+    def inner():
+        with start_transaction(name="hi") as transaction:
+            for _ in range(1000):
+                transaction.start_child(op="db").finish()
+
+
+def test_is_recording(sentry_init):
+    sentry_init(traces_sample_rate=1.0)
+    hub = Hub.current
+
+    assert not hub.is_recording()
+    assert not hub.span_is_unsampled()
+
+    with start_transaction(name="hi") as transaction:
+        assert transaction.is_recording()
+        assert hub.is_recording()
+        assert not hub.span_is_unsampled()
+        with start_span(op="foo") as span:
+            assert span.is_recording()
+            assert hub.is_recording()
+
+    assert not transaction.is_recording()
+    assert not span.is_recording()
+
+    with start_transaction(name="hi", sampled=False) as transaction:
+        assert not transaction.is_recording()
+        assert not hub.is_recording()
+        assert hub.span_is_unsampled()
+        with start_span(op="foo") as span:
+            assert not span.is_recording()
+
+    assert not Span().is_recording()
+    assert not NoOpSpan().is_recording()
+
+
+def test_span_compression(sentry_init, capture_events):
+    sentry_init(
+        traces_sample_rate=1.0,
+        _experiments={"max_spans": 5, "span_compression": True},
+    )
+    events = capture_events()
+
+    with start_transaction(name="hi"):
+        for i in range(100):
+            with start_span(
+                op="db", description="SELECT * FROM users WHERE id = %s" % i
+            ):
+                pass
+        with start_span(op="http.client", description="GET /") as parent:
+            parent.start_child(op="db", description="SELECT 1").finish()
+        for _ in range(3):
+            with start_span(op="http.client", description="GET /"):
+                pass
+
+    (event,) = events
+    db, http, child, http2 = event["spans"]
+
+    assert db["description"] == "SELECT * FROM users WHERE id = ?"
+    compressed = db["data"]["compressed_spans"]
+    assert compressed["count"] == 100
+    assert compressed["max_duration"] <= compressed["total_duration"]
+    assert db["start_timestamp"] <= db["timestamp"]
+
+    assert "data" not in http
+    assert child["parent_span_id"] == http["span_id"]
+    assert http2["data"]["compressed_spans"]["count"] == 3
+
+
+def test_span_compression_reparents_children(sentry_init, capture_events):
+    sentry_init(traces_sample_rate=1.0, _experiments={"span_compression": True})
+    events = capture_events()
+
+    with start_transaction(name="hi") as transaction:
+        first = transaction.start_child(op="db", description="SELECT 1")
+        second = transaction.start_child(op="db", description="SELECT 2")
+        second.start_child(op="cache").finish()
+        first.finish()
+        second.finish()
+
+    (event,) = events
+    db, cache = event["spans"]
+    assert db["span_id"] == first.span_id
+    assert db["data"]["compressed_spans"]["count"] == 2
+    assert cache["parent_span_id"] == first.span_id
+
+
+def test_span_compression_disabled(sentry_init, capture_events):
+    sentry_init(traces_sample_rate=1.0)
+    events = capture_events()
+
+    with start_transaction(name="hi"):
+        for _ in range(3):
+            with start_span(op="db", description="SELECT 1"):
+                pass
+
+    (event,) = events
+    assert len(event["spans"]) == 3
+
+
+def test_transaction_chunks(sentry_init, capture_events):
+    sentry_init(
+        traces_sample_rate=1.0,
+        _experiments={"max_spans": 5, "transaction_chunk_size": 4},
+    )
+    events = capture_events()
+
+    with start_transaction(name="hi") as transaction:
+        with start_span(op="outer") as outer:
+            for i in range(10):
+                with start_span(op="foo{}".format(i)):
+                    pass
+            # Sent spans are no longer held in memory.
+            assert transaction._span_recorder.spans[0] is outer
+            assert len(transaction._span_recorder.spans) == 3
+
+    first, second, final = events
+    assert [span["op"] for span in first["spans"]] == ["foo0", "foo1", "foo2", "foo3"]
+    assert [span["op"] for span in second["spans"]] == ["foo4", "foo5", "foo6", "foo7"]
+    assert [span["op"] for span in final["spans"]] == ["outer", "foo8", "foo9"]
+
+    for index, event in enumerate(events):
+        assert event["type"] == "transaction"
+        assert event["contexts"]["trace"]["trace_id"] == transaction.trace_id
+        assert event["contexts"]["transaction_chunk"] == {
+            "index": index,
+            "final": index == 2,
+        }
+    assert first["timestamp"] <= second["timestamp"] <= final["timestamp"]
+
+    # Chunks are segments of the transaction rather than copies of it.
+    assert final["transaction"] == "hi"
+    assert final["contexts"]["trace"]["span_id"] == transaction.span_id
+    for chunk in (first, second):
+        assert chunk["transaction"] == "hi [chunk]"
+        assert chunk["contexts"]["trace"]["op"] == "transaction.chunk"
+        assert chunk["contexts"]["trace"]["parent_span_id"] == transaction.span_id
+        assert chunk["contexts"]["trace"]["span_id"] != transaction.span_id
+        assert chunk["start_timestamp"] == chunk["spans"][0]["start_timestamp"]
+        assert chunk["timestamp"] == chunk["spans"][-1]["timestamp"]
+    assert (
+        first["contexts"]["trace"]["span_id"] != second["contexts"]["trace"]["span_id"]
+    )
+
+
+def test_transaction_chunks_exclude_transaction(sentry_init, capture_events):
+    sentry_init(
+        traces_sample_rate=1.0,
+        _experiments={"transaction_chunk_size": 3},
+    )
+    events = capture_events()
+
+    with start_transaction(name="hi"):
+        for i in range(2):
+            with start_span(op="foo{}".format(i)):
+                pass
+
+    # Finishing the transaction doesn't complete a chunk of its own.
+    (event,) = events
+    assert [span["op"] for span in event["spans"]] == ["foo0", "foo1"]
+    assert "transaction_chunk" not in event["contexts"]
+
+
+@pytest.mark.skipif(
+    not hasattr(sys, "setswitchinterval"), reason="no control over thread switches"
+)
+def test_transaction_chunks_threaded(sentry_init, capture_events):
+    sentry_init(
+        traces_sample_rate=1.0,
+        _experiments={"max_spans": 1000, "transaction_chunk_size": 7},
+    )
+    events = capture_events()
+    hub = Hub.current
+
+    def finish_spans(transaction, n):
+        thread_hub = Hub(hub)
+        for _ in range(200):
+            transaction.start_child(op="thread{}".format(n)).finish(thread_hub)
+
+    # Switch threads as often as possible to provoke races.
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with start_transaction(name="hi") as transaction:
+            threads = [
+                threading.Thread(target=finish_spans, args=(transaction, n))
+                for n in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    span_ids = [span["span_id"] for event in events for span in event["spans"]]
+    assert len(span_ids) == 8 * 200
+    assert len(set(span_ids)) == len(span_ids)
+
+    indexes = [event["contexts"]["transaction_chunk"]["index"] for event in events]
+    assert sorted(indexes) == list(range(len(events)))
+
+
+@pytest.mark.parametrize(
+    "sql,expected",
+    [
+        ("SELECT * FROM t1 WHERE id = 1", "SELECT * FROM t1 WHERE id = ?"),
+        ("SELECT 'it''s', 1.5", "SELECT ?, ?"),
+        (
+            "SELECT * FROM t WHERE a = $1 AND b = :b2",
+            "SELECT * FROM t WHERE a = $1 AND b = :b2",
+        ),
+        (
+            "SELECT * FROM t WHERE id IN (%s, %s,%s)",
+            "SELECT * FROM t WHERE id IN (...)",
+        ),
+        ("select * from t where id in (1, 2)", "select * from t where id in (...)"),
+        (
+            "SELECT *\n  FROM t\n  WHERE id IN (%(id_1)s)",
+            "SELECT * FROM t WHERE id IN (...)",
+        ),
+        (
+            "SELECT * FROM t WHERE id IN (SELECT id FROM u)",
+            "SELECT * FROM t WHERE id IN (SELECT id FROM u)",
+        ),
+    ],
+)
+def test_normalize_sql(sql, expected):
+    assert normalize_sql(sql) == expected
+
+
+def test_sql_fingerprint_cache():
+    cache = SqlFingerprintCache(max_entries=2)
+
+    first = cache.get("SELECT * FROM t WHERE id IN (%s)")
+    second = cache.get("SELECT * FROM t WHERE id IN (%s, %s)")
+    assert first is second
+    assert cache.get("SELECT * FROM t WHERE id IN (%s)") is first
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.get("SELECT 1")
+    cache.get("SELECT 2")
+    assert len(cache._entries) == 2
+    assert list(cache._fingerprints) == ["SELECT ?"]
+
+    cache.clear()
+    assert not cache._entries and not cache._fingerprints
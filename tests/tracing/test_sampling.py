@@ -1,8 +1,17 @@
 import random
+from datetime import datetime, timedelta
 
 import pytest
 
-from sentry_sdk import Hub, start_span, start_transaction
+from sentry_sdk import (
+    Hub,
+    capture_exception,
+    capture_message,
+    start_span,
+    start_transaction,
+)
+from sentry_sdk.adaptive_sampling import AdaptiveSampler
+from sentry_sdk.tail_sampling import TailSampler
 from sentry_sdk.tracing import Transaction
 from sentry_sdk.utils import logger
 
@@ -309,3 +318,156 @@ def test_records_lost_event_only_if_traces_sampler_enabled(
     transaction.finish()
 
     assert reports == reports_output
+
+
+def test_tail_sampling_keeps_failed_transactions(sentry_init, capture_events):
+    sentry_init(traces_sample_rate=0.5, _experiments={"tail_sampling": True})
+    events = capture_events()
+
+    with mock.patch.object(random, "random", return_value=0.9):
+        with start_transaction(name="ok") as transaction:
+            assert transaction._sampling_deferred
+            assert transaction.to_traceparent().endswith("-")
+            with start_span(op="foo"):
+                pass
+
+        with start_transaction(name="http") as transaction:
+            transaction.set_http_status(500)
+
+        with start_transaction(name="error"):
+            capture_message("oops", level="error")
+
+        with start_transaction(name="exception"):
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                capture_exception()
+
+        with start_transaction(name="info"):
+            capture_message("just so you know")
+
+    transaction_events = [e for e in events if e.get("type") == "transaction"]
+    assert [e["transaction"] for e in transaction_events] == [
+        "http",
+        "error",
+        "exception",
+    ]
+
+
+@pytest.mark.parametrize("traces_sampler", [None, lambda _: 0, lambda _: False])
+def test_tail_sampling_respects_explicit_exclusion(
+    sentry_init, capture_events, traces_sampler
+):
+    sentry_init(
+        traces_sample_rate=0.0,
+        traces_sampler=traces_sampler,
+        _experiments={"tail_sampling": True},
+    )
+    events = capture_events()
+
+    with start_transaction(name="healthcheck") as transaction:
+        assert transaction.sampled is False
+        assert not transaction._sampling_deferred
+        transaction.set_http_status(500)
+
+    assert not events
+
+
+def test_tail_sampling_respects_parent_decision(sentry_init):
+    sentry_init(traces_sample_rate=0.5, _experiments={"tail_sampling": True})
+
+    transaction = start_transaction(name="hi", parent_sampled=False)
+    assert transaction.sampled is False
+    assert not transaction._sampling_deferred
+
+
+def test_tail_sampling_keeps_slow_transactions():
+    sampler = TailSampler(percentile=0.9, max_per_second=1000)
+    start = datetime(2020, 1, 1)
+
+    def finished(duration):
+        transaction = Transaction(name="hi", start_timestamp=start)
+        transaction.timestamp = start + timedelta(seconds=duration)
+        return transaction
+
+    # No decision is made before the percentile is known.
+    assert not sampler.should_keep(finished(10))
+    assert not any(sampler.should_keep(finished(1)) for _ in range(50))
+
+    assert sampler.should_keep(finished(10))
+    assert not sampler.should_keep(finished(1))
+
+
+def test_tail_sampling_budget():
+    sampler = TailSampler(max_per_second=2)
+    transaction = Transaction(name="hi")
+    transaction.set_status("internal_error")
+    transaction.timestamp = transaction.start_timestamp
+
+    with mock.patch("sentry_sdk.tail_sampling.now", return_value=1000.0):
+        sampler._last_refill = 1000.0
+        assert [sampler.should_keep(transaction) for _ in range(3)] == [
+            True,
+            True,
+            False,
+        ]
+    with mock.patch("sentry_sdk.tail_sampling.now", return_value=1000.5):
+        assert [sampler.should_keep(transaction) for _ in range(2)] == [True, False]
+
+
+def test_adaptive_sampler_targets_throughput():
+    sampler = AdaptiveSampler(target_per_second=10)
+
+    with mock.patch("sentry_sdk.adaptive_sampling.now", return_value=1000.0):
+        sampler._throughputs.clear()
+        assert [sampler.sample_rate("busy") for _ in range(1000)][-1] == 1.0
+        sampler.sample_rate("quiet")
+
+    with mock.patch("sentry_sdk.adaptive_sampling.now", return_value=1001.0):
+        assert sampler.sample_rate("busy") == pytest.approx(0.01)
+        assert sampler.sample_rate("quiet") == 1.0
+
+        # Too many sampled transactions finished, e.g. because of incoming
+        # traces that were sampled upstream.
+        for _ in range(40):
+            sampler.record_finished("quiet")
+
+    with mock.patch("sentry_sdk.adaptive_sampling.now", return_value=1002.0):
+        assert sampler.sample_rate("quiet") == pytest.approx(0.25)
+
+
+def test_adaptive_sampler_respects_parent_decision():
+    sampler = AdaptiveSampler(target_per_second=10)
+    assert sampler({"parent_sampled": False, "transaction_context": {}}) == 0.0
+    assert (
+        sampler({"parent_sampled": None, "transaction_context": {"name": "hi"}}) == 1.0
+    )
+
+
+@pytest.mark.parametrize("as_traces_sampler", [True, False])
+def test_adaptive_sampling(sentry_init, as_traces_sampler):
+    if as_traces_sampler:
+        sentry_init(traces_sampler=AdaptiveSampler(target_per_second=1, max_rate=0.5))
+    else:
+        sentry_init(
+            traces_sample_rate=0.5, _experiments={"adaptive_sampling_target": 1}
+        )
+
+    sampler = Hub.current.client.adaptive_sampler
+    assert sampler.max_rate == 0.5
+
+    with mock.patch.object(sampler, "sample_rate", return_value=0.25):
+        with mock.patch.object(random, "random", return_value=0.1):
+            transaction = start_transaction(name="hi")
+
+    assert transaction.sample_rate == 0.25
+    # The effective rate is propagated to downstream services.
+    assert transaction.get_baggage().sentry_items["sample_rate"] == "0.25"
+
+    with mock.patch.object(sampler, "record_finished") as record_finished:
+        transaction.finish()
+    record_finished.assert_called_once_with("hi")
+
+    # Sample rates are lowered once the transport can't keep up.
+    Hub.current.client.transport.queue_load = mock.Mock(return_value=0.75)
+    assert sampler.sample_rate("new") == pytest.approx(0.25)